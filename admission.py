@@ -0,0 +1,212 @@
+"""
+Admission control for the API (pure ASGI middleware).
+
+Every endpoint belongs to a priority class with its own concurrency limit and bounded queue:
+
+    interactive  /search, /suggest, /pantry-search, /swap-meal many slots, short queue wait
+    batch        /generate-diet-plan, /generate-household-plan few slots, longer queue wait
+    (none)       /, /metrics, docs, CORS preflight            never queued
+
+All classes also share TOTAL_CONCURRENCY slots, and a free slot always goes to the most urgent
+waiting class first, so a burst of plan requests can neither occupy the threadpool nor delay
+interactive search. A request is rejected up front with 429 + Retry-After when its queue is full
+or when the expected wait (queue position x average service time) would exceed the class's
+max wait, or the client's own budget from the X-Time-Budget-Ms header; a queued request that
+runs out of time is rejected the same way instead of starting late.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+from starlette.responses import JSONResponse
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+PRIORITY_CLASSES = {
+    # name: concurrency, queue size, max queue wait, priority (lower = served first)
+    "interactive": {"concurrency": 16, "queue": 64, "max_wait_ms": 1000, "priority": 0},
+    "batch": {"concurrency": 2, "queue": 16, "max_wait_ms": 10000, "priority": 1},
+}
+
+ENDPOINT_CLASSES = {
+    "/search": "interactive",
+    "/suggest": "interactive",
+    "/pantry-search": "interactive",
+    "/swap-meal": "interactive",
+    "/generate-diet-plan": "batch",
+    "/generate-diet-plan/stream": "batch",
+    "/generate-household-plan": "batch",
+}
+
+TOTAL_CONCURRENCY = 24 # below the threadpool's 40 workers, so health checks always find one
+BUDGET_HEADER = b"x-time-budget-ms"
+SERVICE_TIME_ALPHA = 0.2 # EWMA weight of the latest request's service time
+
+
+class _Class:
+    def __init__(self, name, concurrency, queue, max_wait_ms, priority):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue
+        self.max_wait = max_wait_ms / 1000
+        self.priority = priority
+        self.running = 0
+        self.queued = 0
+        self.service_time = 0.05 # seconds, EWMA; refined as requests complete
+        self.counters = {"admitted": 0, "waited": 0, "rejected_queue_full": 0,
+                         "rejected_deadline": 0, "expired_in_queue": 0, "max_queue_depth": 0}
+
+    def expected_wait(self):
+        """Seconds a request joining the queue now should expect to wait."""
+        return (self.queued + 1) * self.service_time / self.concurrency
+
+    def stats(self):
+        return {"running": self.running, "queued": self.queued, "concurrency": self.concurrency,
+                "avg_service_ms": round(self.service_time * 1000, 2), **self.counters}
+
+
+# ------------------------------
+# ADMISSION CONTROLLER
+# ------------------------------
+class AdmissionController:
+    """Slots and priority queues. Runs on the event loop only, so it needs no locks."""
+
+    def __init__(self, classes=None, endpoints=None, total_concurrency=TOTAL_CONCURRENCY):
+        self.classes = {name: _Class(name, **config) for name, config in (classes or PRIORITY_CLASSES).items()}
+        self.endpoints = endpoints or ENDPOINT_CLASSES
+        self.total_concurrency = total_concurrency
+        self.running = 0
+        self._waiters = [] # heap of (priority, seq, class, future)
+        self._seq = itertools.count()
+
+    def classify(self, scope):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return None
+        name = self.endpoints.get(scope["path"].rstrip("/") or "/")
+        return self.classes.get(name)
+
+    def _has_slot(self, cls):
+        return cls.running < cls.concurrency and self.running < self.total_concurrency
+
+    def _start(self, cls):
+        cls.running += 1
+        self.running += 1
+        cls.counters["admitted"] += 1
+
+    async def acquire(self, cls, budget=None):
+        """None once admitted, else the reason for rejecting (the caller answers 429)."""
+        urgent_waiting = any(w[0] <= cls.priority and not w[3].done() for w in self._waiters)
+        if self._has_slot(cls) and not urgent_waiting:
+            self._start(cls)
+            return None
+
+        if cls.queued >= cls.queue_size:
+            cls.counters["rejected_queue_full"] += 1
+            return "queue_full"
+        max_wait = cls.max_wait if budget is None else min(cls.max_wait, budget)
+        if cls.expected_wait() > max_wait:
+            cls.counters["rejected_deadline"] += 1
+            return "deadline"
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (cls.priority, next(self._seq), cls, future))
+        cls.queued += 1
+        cls.counters["waited"] += 1
+        cls.counters["max_queue_depth"] = max(cls.counters["max_queue_depth"], cls.queued)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max_wait)
+            return None # _dispatch() already counted us as running
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            admitted = future.done() and not future.cancelled() # slot granted as the wait ended
+            future.cancel()
+            if isinstance(e, asyncio.CancelledError): # client went away
+                if admitted:
+                    self._free(cls)
+                raise
+            if admitted:
+                return None
+            cls.counters["expired_in_queue"] += 1
+            return "deadline"
+        finally:
+            cls.queued -= 1
+
+    def _free(self, cls):
+        cls.running -= 1
+        self.running -= 1
+        self._dispatch()
+
+    def release(self, cls, elapsed):
+        cls.service_time += SERVICE_TIME_ALPHA * (elapsed - cls.service_time)
+        self._free(cls)
+
+    def _dispatch(self):
+        """Hand free slots to waiters, most urgent class first (FIFO within a class)."""
+        skipped = []
+        while self._waiters and self.running < self.total_concurrency:
+            waiter = heapq.heappop(self._waiters)
+            _, _, cls, future = waiter
+            if future.done(): # expired or cancelled
+                continue
+            if not self._has_slot(cls):
+                skipped.append(waiter) # its class is full; a less urgent class may still fit
+                continue
+            self._start(cls)
+            future.set_result(True)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+    def retry_after(self, cls):
+        """Seconds a rejected client should wait before retrying."""
+        return max(1, math.ceil(cls.expected_wait()))
+
+    def stats(self):
+        return {"running": self.running, "total_concurrency": self.total_concurrency,
+                "classes": {name: cls.stats() for name, cls in self.classes.items()}}
+
+
+# ------------------------------
+# Middleware
+# ------------------------------
+def request_budget(scope):
+    """Client time budget in seconds from X-Time-Budget-Ms (None when absent or invalid)."""
+    for name, value in scope.get("headers", []):
+        if name == BUDGET_HEADER:
+            try:
+                return max(float(value.decode("latin-1")), 0) / 1000
+            except ValueError:
+                return None
+    return None
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller=None):
+        self.app = app
+        self.controller = controller or AdmissionController()
+
+    async def __call__(self, scope, receive, send):
+        cls = self.controller.classify(scope)
+        if cls is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Time budgets (X-Time-Budget-Ms) count from arrival, so queueing uses them up too
+        scope.setdefault("state", {})["arrived"] = time.perf_counter()
+        rejected = await self.controller.acquire(cls, request_budget(scope))
+        if rejected:
+            response = JSONResponse(
+                {"detail": f"Server busy ({cls.name} {rejected.replace('_', ' ')}). Retry later."},
+                status_code=429,
+                headers={"Retry-After": str(self.controller.retry_after(cls))},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cls, time.perf_counter() - start)
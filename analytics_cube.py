@@ -0,0 +1,180 @@
+"""
+Pre-aggregated nutrition statistics (an OLAP-style cube) for dashboards.
+
+Every recipe falls into one cell keyed by
+
+    (Continent, Region, Sub_region, diet flag mask, cooking time bucket)
+
+and each cell keeps a count, per-measure sums (with how many rows had a value), and a histogram
+of calories per serving. The cube is a DerivedIndex, so fetched pages are added to their cells
+as they arrive, and edited or deleted recipes are taken back out of theirs. An analytics query
+only visits cells (a few thousand at most), never recipes:
+
+    cube.query(group_by=["region"], diet_type="vegan", max_time=30)
+"""
+import bisect
+
+from recipe_index import DIET_ALIASES, DIET_FLAGS, RANGE_COLUMNS, DerivedIndex, normalize_diet_type
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+MEASURES = ["calories", "protein", "fat", "carbs", "total_time"] # RANGE_COLUMNS keys
+
+# Upper edges (minutes) of the total_time buckets; longer recipes go to the last bucket
+TIME_BUCKETS = [15, 30, 45, 60, 90, 120, 240]
+
+# Calorie histogram bin edges (per serving); the last bin is open-ended
+CALORIE_BINS = list(range(0, 1600, 100))
+
+DIMENSIONS = ["continent", "region", "sub_region", "diet", "time_bucket"]
+
+_COUNT = 0
+_SUMS = 1
+_PRESENT = _SUMS + len(MEASURES)
+_HISTOGRAM = _PRESENT + len(MEASURES)
+_CELL_SIZE = _HISTOGRAM + len(CALORIE_BINS)
+
+
+def _float(value):
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if f != f else f
+
+
+def time_bucket_labels():
+    labels, low = [], 0
+    for edge in TIME_BUCKETS:
+        labels.append(f"{low}-{edge}")
+        low = edge
+    return labels + [f">{TIME_BUCKETS[-1]}", "unknown"]
+
+
+TIME_BUCKET_LABELS = time_bucket_labels()
+
+
+def time_bucket(total_time):
+    """Index into TIME_BUCKET_LABELS (unparseable times, e.g. "1Day20", are "unknown")."""
+    minutes = _float(total_time)
+    if minutes is None:
+        return len(TIME_BUCKET_LABELS) - 1
+    return bisect.bisect_left(TIME_BUCKETS, minutes)
+
+
+def diet_mask(r):
+    return sum(1 << i for i, f in enumerate(DIET_FLAGS) if str(r.get(f, "0.0")) == "1.0")
+
+
+# ------------------------------
+# ANALYTICS CUBE
+# ------------------------------
+class AnalyticsCube(DerivedIndex):
+    name = "analytics_cube"
+
+    def clear(self):
+        self.cells = {} # (continent, region, sub_region, diet mask, time bucket) -> flat counters
+
+    def add_rows(self, rows, start):
+        self._count(rows, 1)
+
+    def update_rows(self, positions, old_rows, new_rows):
+        self._count(old_rows, -1)
+        self._count(new_rows, 1)
+
+    def remove_rows(self, positions, old_rows):
+        self._count(old_rows, -1)
+
+    def _count(self, rows, sign):
+        """Add (sign=1) or take back (sign=-1) the rows' contributions to their cells."""
+        columns = [RANGE_COLUMNS[m] for m in MEASURES]
+        for r in rows:
+            key = (str(r.get("Continent") or ""), str(r.get("Region") or ""), str(r.get("Sub_region") or ""),
+                   diet_mask(r), time_bucket(r.get("total_time")))
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = [0] * _CELL_SIZE
+            cell[_COUNT] += sign
+            for i, column in enumerate(columns):
+                v = _float(r.get(column))
+                if v is not None:
+                    cell[_SUMS + i] += sign * v
+                    cell[_PRESENT + i] += sign
+            calories = _float(r.get(RANGE_COLUMNS["calories"]))
+            if calories is not None:
+                cell[_HISTOGRAM + max(bisect.bisect_right(CALORIE_BINS, calories) - 1, 0)] += sign
+            if not cell[_COUNT]:
+                del self.cells[key]
+
+    def fingerprint(self):
+        return {key: [round(v, 6) for v in cell] for key, cell in self.cells.items()}
+
+    # ------------------------------
+    # Queries
+    # ------------------------------
+    def _matches(self, key, diet_bits, region, continent, max_bucket):
+        cell_continent, cell_region, cell_sub_region, mask, bucket = key
+        if diet_bits is not None and not mask & diet_bits:
+            return False
+        if continent and cell_continent.lower() != continent:
+            return False
+        if region and region not in cell_region.lower() and region not in cell_sub_region.lower():
+            return False
+        return max_bucket is None or bucket <= max_bucket
+
+    @staticmethod
+    def _group_keys(key, group_by):
+        """The group(s) a cell adds to; a cell with several diet flags counts once per flag."""
+        continent, region, sub_region, mask, bucket = key
+        values = {"continent": [continent], "region": [region], "sub_region": [sub_region],
+                  "diet": [f for i, f in enumerate(DIET_FLAGS) if mask >> i & 1] or ["none"],
+                  "time_bucket": [TIME_BUCKET_LABELS[bucket]]}
+        keys = [()]
+        for dimension in group_by:
+            keys = [k + (v,) for k in keys for v in values[dimension]]
+        return keys
+
+    def query(self, group_by=(), diet_type="any", region=None, continent=None, max_time=None):
+        """
+        Statistics per group: count, mean of every measure, calorie histogram.
+        `region` matches Region or Sub_region (substring, as in plan filters), `continent` exactly.
+        `max_time` keeps the time buckets that end at or below it (bucket edges: TIME_BUCKETS).
+        """
+        unknown = [d for d in group_by if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown dimension(s) {', '.join(unknown)}. Expected: {', '.join(DIMENSIONS)}")
+
+        diet_type = normalize_diet_type(diet_type)
+        diet_bits = None
+        if diet_type != "any":
+            diet_bits = sum(1 << DIET_FLAGS.index(f) for f in DIET_ALIASES.get(diet_type, [diet_type]))
+        max_bucket = None
+        if max_time is not None:
+            max_bucket = bisect.bisect_right(TIME_BUCKETS, max_time) - 1 # -1: nothing fits
+
+        groups = {}
+        for key, cell in self.cells.items():
+            if not self._matches(key, diet_bits, (region or "").lower(), (continent or "").lower(), max_bucket):
+                continue
+            for group in self._group_keys(key, group_by):
+                total = groups.get(group)
+                if total is None:
+                    groups[group] = list(cell)
+                else:
+                    for i, v in enumerate(cell):
+                        total[i] += v
+
+        results = [{**dict(zip(group_by, group)), **self._summary(total)} for group, total in groups.items()]
+        results.sort(key=lambda g: g["count"], reverse=True)
+        return {"groups": results, "calorie_bins": CALORIE_BINS, "cells": len(self.cells)}
+
+    @staticmethod
+    def _summary(cell):
+        mean = {}
+        for i, measure in enumerate(MEASURES):
+            present = cell[_PRESENT + i]
+            mean[measure] = round(cell[_SUMS + i] / present, 2) if present else None
+        return {"count": cell[_COUNT], "mean": mean,
+                "calorie_histogram": cell[_HISTOGRAM:_HISTOGRAM + len(CALORIE_BINS)]}
@@ -1,16 +1,34 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional
-import pandas as pd
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Literal
 import json
 
 # Import Backend Logic
-from recipe_service import RecipeService
+from recipe_service import SEARCH_SHARDS, RecipeService
+from recipe_index import normalize_diet_type
+from api_encoding import (CompressionMiddleware, encoded_response, is_not_modified,
+                          make_etag, negotiate, not_modified_response)
+from single_flight import SingleFlight
+from admission import AdmissionController, AdmissionMiddleware, request_budget
+from deadline import Deadline
+from similarity_graph import GRAPH_NEIGHBORS
 
 app = FastAPI(title="Foodoscope API")
 
 recipe_service = RecipeService()
+periodic_sync = None # threading.Event that stops the background sync, see startup_event()
+flights = SingleFlight() # identical concurrent requests share one computation
+
+# Middleware added last runs first: CORS wraps everything, so 429s from admission carry CORS headers too
+
+# Per-endpoint concurrency limits and priority queues; sheds load with 429 + Retry-After
+admission = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# gzip / brotli for large single-chunk responses (SSE streams pass through)
+app.add_middleware(CompressionMiddleware)
 
 # Allow CORS for React Frontend
 app.add_middleware(
@@ -19,54 +37,325 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After", "X-Partial-Result", "X-Stopped-At"],
 )
 
 # Load data into memory on startup
 @app.on_event("startup")
 def startup_event():
-    print("🚀 App starting... Initializing sequential fetch (Local-First).")
-    # Increased to 50 pages to build a larger original dataset
-    recipe_service.fetch_recipes(max_new_pages=50) 
+    global periodic_sync
+    print("🚀 App starting... Initializing delta sync (Local-First).")
+    # Revalidates a few cached pages (edits / deletions), then fetches up to 50 new pages
+    recipe_service.sync_recipes(max_new_pages=50)
     print(f"✅ Active pool: {len(recipe_service.recipes)} recipes available.")
+    if SEARCH_SHARDS:
+        recipe_service.use_shards(SEARCH_SHARDS) # /search fans out to worker processes
+    # Same delta sync every FOODOSCOPE_SYNC_INTERVAL seconds while serving
+    periodic_sync = recipe_service.start_periodic_sync()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if periodic_sync is not None:
+        periodic_sync.set()
+    if recipe_service.shards is not None:
+        recipe_service.shards.stop()
 
 # Pydantic Models for the Diet Plan
 class DietPlanRequest(BaseModel):
     daily_calories: float = 2000
-    diet_type: Optional[str] = "any" # "vegan" or "any"
+    diet_type: Optional[str] = "any" # "any", a diet flag column (e.g. "vegan", "pescetarian") or "vegetarian"
     max_cooking_time: Optional[float] = None
-    min_calories: Optional[float] = None
+    min_calories: Optional[float] = None # per-recipe bounds on Calories
     max_calories: Optional[float] = None
     region: Optional[str] = None
-    servings: Optional[float] = None
+    servings: Optional[float] = None # minimum servings a recipe should yield
     protein_goal: Optional[float] = None
+    per_serving: bool = False # protein_goal applies to protein per serving
+    days: int = Field(7, ge=1, le=84) # up to 12 weeks
+    meals_per_day: int = Field(3, ge=2, le=5)
+    focus: Literal["Balanced", "High Protein", "Low Calorie"] = "Balanced"
+    meal_split: Optional[Dict[str, float]] = None # e.g. {"Breakfast": 0.25, "Lunch": 0.45, "Dinner": 0.3}
+    repeat_gap_days: Optional[int] = Field(None, ge=1) # e.g. 10 = no recipe twice within 10 days
+    time_budget_ms: Optional[float] = Field(None, gt=0) # or the X-Time-Budget-Ms header; returns the days planned so far
+
+class HouseholdMember(BaseModel):
+    name: str
+    daily_calories: float = 2000
+    meals_per_day: int = Field(3, ge=2, le=5)
+    focus: Literal["Balanced", "High Protein", "Low Calorie"] = "Balanced"
+    meal_split: Optional[Dict[str, float]] = None
+
+class HouseholdPlanRequest(BaseModel):
+    members: List[HouseholdMember] = Field(..., min_length=1)
+    diet_type: Optional[str] = "any"
+    max_cooking_time: Optional[float] = None
+    region: Optional[str] = None
+    protein_goal: Optional[float] = None
+    days: int = Field(28, ge=1, le=84)
+    repeat_gap_days: Optional[int] = Field(None, ge=1)
 
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 20
+    fuzzy: bool = False # correct misspellings ("falafal" -> "falafel") before searching
+
+class SwapMealRequest(BaseModel):
+    recipe_id: str # `_id` of the planned meal to replace
+    limit: int = Field(5, ge=1, le=GRAPH_NEIGHBORS)
+    exclude_ids: List[str] = [] # e.g. the rest of the plan, so a swap never repeats a meal
+    diet_type: Optional[str] = "any"
+    max_cooking_time: Optional[float] = None
+    region: Optional[str] = None
+    protein_goal: Optional[float] = None
+    min_calories: Optional[float] = None
+    max_calories: Optional[float] = None
+
+class PantryRequest(BaseModel):
+    items: List[str] = Field(..., min_length=1)
+    min_coverage: float = Field(0.8, gt=0, le=1) # share of a recipe's ingredients the pantry must cover
+    top_k: int = 20
+    diet_type: Optional[str] = "any"
 
 @app.get("/")
 def health_check():
     return {"status": "ok", "message": "Foodoscope API is running"}
 
+# ------------------------------
+# Cached responses: ETag on (snapshot version, normalized arguments)
+# ------------------------------
+def respond(http_request: Request, endpoint, arguments, compute, compact=False):
+    """
+    304 if the client already has this snapshot's result, else compute() encoded per Accept.
+    Concurrent requests with the same snapshot and arguments share a single compute().
+    """
+    media_type = negotiate(http_request.headers.get("accept")) # JSON and msgpack bodies get distinct ETags
+    etag = make_etag(recipe_service.version, endpoint, arguments, compact, media_type)
+    if is_not_modified(http_request, etag):
+        return not_modified_response(etag)
+    key = make_etag(recipe_service.version, endpoint, arguments) # compact only changes the encoding
+    return encoded_response(http_request, flights.do(endpoint, key, compute), etag, compact, media_type=media_type)
+
+def request_deadline(http_request: Request, budget_ms=None):
+    """Deadline for a request field or the X-Time-Budget-Ms header (None when neither is set)."""
+    if budget_ms is None:
+        budget = request_budget(http_request.scope)
+        budget_ms = budget * 1000 if budget is not None else None
+    if budget_ms is None:
+        return None
+    return Deadline(budget_ms, start=http_request.scope.get("state", {}).get("arrived"))
+
+def respond_within(http_request: Request, endpoint, arguments, compute, deadline, compact=False):
+    """
+    respond() under a time budget: compute(deadline) runs on its own (never coalesced with other
+    requests), and a partial result carries X-Partial-Result / X-Stopped-At instead of an ETag,
+    so it is never revalidated as the complete one.
+    """
+    media_type = negotiate(http_request.headers.get("accept"))
+    etag = make_etag(recipe_service.version, endpoint, arguments, compact, media_type)
+    if is_not_modified(http_request, etag):
+        return not_modified_response(etag)
+    payload = compute(deadline)
+    response = encoded_response(http_request, payload, None if deadline.partial else etag, compact,
+                                media_type=media_type)
+    response.headers["X-Partial-Result"] = "true" if deadline.partial else "false"
+    if deadline.partial:
+        response.headers["X-Stopped-At"] = deadline.stopped_at
+    return response
+
+def search_payload(query, top_k, fuzzy=False):
+    recipes, stats = recipe_service.search_with_stats(query, top_k, fuzzy=fuzzy)
+    return {"recipes": recipes, "search": stats}
+
 @app.post("/search")
-def search_recipes(request: SearchRequest):
-    results = recipe_service.search_recipes(request.query, request.top_k)
-    return {"recipes": results}
+def search_recipes(request: SearchRequest, http_request: Request, compact: bool = False):
+    arguments = {"query": request.query, "top_k": request.top_k, "fuzzy": request.fuzzy}
+    return respond(http_request, "search", arguments, lambda: search_payload(**arguments), compact)
 
-@app.post("/generate-diet-plan")
-def generate_diet(request: DietPlanRequest):
-    plan = recipe_service.generate_weekly_plan(
+@app.get("/search")
+def search_recipes_get(http_request: Request, query: str, top_k: int = 20, fuzzy: bool = False,
+                       compact: bool = False):
+    # Cacheable variant: browsers and CDNs revalidate GETs with If-None-Match
+    arguments = {"query": query, "top_k": top_k, "fuzzy": fuzzy}
+    return respond(http_request, "search", arguments, lambda: search_payload(**arguments), compact)
+
+@app.get("/suggest")
+def suggest(http_request: Request, q: str, limit: int = Query(10, ge=1, le=50)):
+    # Autocomplete as the user types; tolerant to typos
+    arguments = {"q": q, "limit": limit}
+    return respond(http_request, "suggest", arguments,
+                   lambda: {"suggestions": recipe_service.suggest(q, limit)})
+
+@app.post("/pantry-search")
+def pantry_search(request: PantryRequest, http_request: Request, compact: bool = False):
+    arguments = dict(
+        items=sorted(set(request.items)),
+        min_coverage=request.min_coverage,
+        top_k=request.top_k,
+        diet_type=validated_diet_type(request.diet_type)
+    )
+    return respond(http_request, "pantry-search", arguments,
+                   lambda: {"matches": recipe_service.pantry_search(**arguments)}, compact)
+
+def validated_diet_type(diet_type):
+    try:
+        return normalize_diet_type(diet_type)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def validated_meal_split(meal_split):
+    if meal_split is not None and (not meal_split or any(share <= 0 for share in meal_split.values())):
+        raise HTTPException(status_code=422, detail="meal_split needs at least one meal, each with a positive share.")
+    return meal_split
+
+def plan_arguments(request: DietPlanRequest):
+    diet_type = validated_diet_type(request.diet_type)
+
+    return dict(
         daily_calories=request.daily_calories,
-        diet_type=request.diet_type,
+        diet_type=diet_type,
         max_time=request.max_cooking_time,
         region=request.region,
-        protein_goal=request.protein_goal
+        protein_goal=request.protein_goal,
+        min_calories=request.min_calories,
+        max_calories=request.max_calories,
+        servings=request.servings,
+        per_serving=request.per_serving,
+        days=request.days,
+        meals_per_day=request.meals_per_day,
+        focus=request.focus,
+        meal_split=validated_meal_split(request.meal_split),
+        repeat_gap_days=request.repeat_gap_days
     )
-    
-    if not plan:
-        raise HTTPException(status_code=404, detail="Could not generate plan with given constraints.")
+
+@app.post("/generate-diet-plan")
+def generate_diet(request: DietPlanRequest, http_request: Request, compact: bool = False):
+    arguments = plan_arguments(request)
+    deadline = request_deadline(http_request, request.time_budget_ms)
+
+    def compute(deadline=None):
+        plan = recipe_service.generate_weekly_plan(**arguments, deadline=deadline)
         
-    return plan
+        if not plan and not (deadline and deadline.partial):
+            raise HTTPException(status_code=404, detail="Could not generate plan with given constraints.")
+            
+        return plan
+
+    if deadline is not None:
+        return respond_within(http_request, "generate-diet-plan", arguments, compute, deadline, compact)
+    return respond(http_request, "generate-diet-plan", arguments, compute, compact)
+
+@app.post("/generate-household-plan")
+def generate_household(request: HouseholdPlanRequest, http_request: Request, compact: bool = False):
+    names = [m.name for m in request.members]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=422, detail="Household member names must be unique.")
+
+    members = {
+        m.name: {
+            "daily_calories": m.daily_calories,
+            "meals_per_day": m.meals_per_day,
+            "focus": m.focus,
+            "meal_split": validated_meal_split(m.meal_split),
+        }
+        for m in request.members
+    }
+    arguments = dict(
+        diet_type=validated_diet_type(request.diet_type),
+        max_time=request.max_cooking_time,
+        region=request.region,
+        protein_goal=request.protein_goal,
+        days=request.days,
+        repeat_gap_days=request.repeat_gap_days
+    )
+
+    def compute():
+        plan = recipe_service.generate_household_plan(members, **arguments)
+
+        if not any(plan.values()):
+            raise HTTPException(status_code=404, detail="Could not generate plan with given constraints.")
+
+        return plan
+
+    return respond(http_request, "generate-household-plan", {"members": members, **arguments}, compute, compact)
+
+@app.get("/analytics")
+def analytics(http_request: Request, group_by: str = "region", diet_type: str = "any", region: Optional[str] = None,
+              continent: Optional[str] = None, max_time: Optional[float] = None):
+    # Dashboard statistics from the pre-aggregated cube, e.g. ?group_by=continent,diet&max_time=30
+    arguments = dict(
+        group_by=[d.strip() for d in group_by.split(",") if d.strip()],
+        diet_type=validated_diet_type(diet_type),
+        region=region,
+        continent=continent,
+        max_time=max_time
+    )
+
+    def compute():
+        try:
+            return recipe_service.analytics.query(**arguments)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+    return respond(http_request, "analytics", arguments, compute)
+
+@app.post("/swap-meal")
+def swap_meal(request: SwapMealRequest):
+    # "Something similar but different" for one meal, from the precomputed similarity graph
+    diet_type = validated_diet_type(request.diet_type)
+    if recipe_service.similarity_graph() is None:
+        raise HTTPException(status_code=503, detail="Similarity graph not built. Run `python preflight.py warmup`.")
+
+    alternatives = recipe_service.swap_meal(
+        request.recipe_id,
+        limit=request.limit,
+        exclude_ids=request.exclude_ids,
+        diet_type=diet_type,
+        max_time=request.max_cooking_time,
+        region=request.region,
+        protein_goal=request.protein_goal,
+        min_calories=request.min_calories,
+        max_calories=request.max_calories
+    )
+    if alternatives is None:
+        raise HTTPException(status_code=404, detail=f"Recipe '{request.recipe_id}' is not in the similarity graph.")
+    return {"recipe_id": request.recipe_id, "alternatives": alternatives}
+
+@app.get("/metrics")
+def metrics():
+    return {"recipes": len(recipe_service.recipes), "version": recipe_service.version,
+            "single_flight": flights.stats(), "admission": admission.stats(),
+            "candidate_pools": recipe_service.pools.status(),
+            "upstream": recipe_service.upstream_status(),
+            "shards": recipe_service.shards.status() if recipe_service.shards is not None else None}
+
+# ------------------------------
+# Streaming plan (Server-Sent Events)
+# ------------------------------
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/generate-diet-plan/stream")
+def generate_diet_stream(request: DietPlanRequest, http_request: Request):
+    """
+    Same plan as /generate-diet-plan, sent day by day as it is chosen.
+    Events: relaxed, pool, day, progress, done (or error when nothing matches).
+    With a time budget, "done" reports partial / stopped_at when the budget ended the plan early.
+    """
+    arguments = plan_arguments(request) # validate before the stream starts
+    deadline = request_deadline(http_request, request.time_budget_ms)
+
+    def events():
+        for event, data in recipe_service.stream_weekly_plan(**arguments, deadline=deadline):
+            if event == "pool" and data["size"] == 0:
+                yield sse_event("error", {"detail": "Could not generate plan with given constraints."})
+                return
+            yield sse_event(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 if __name__ == "__main__":
     import uvicorn
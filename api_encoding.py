@@ -0,0 +1,187 @@
+"""
+Response encoding for the API.
+
+- encoded_response(): orjson when installed (stdlib json otherwise), msgpack when the client
+  sends `Accept: application/msgpack`, plus an ETag header.
+- make_etag() / is_not_modified(): conditional requests keyed on the recipe snapshot version,
+  so repeated identical requests get a bodiless 304.
+- CompressionMiddleware: brotli or gzip for single-chunk responses above a size threshold.
+  Streaming responses (e.g. Server-Sent Events) pass through untouched.
+"""
+import gzip
+import hashlib
+import json
+from collections.abc import Mapping
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+COMPRESS_MIN_SIZE = 1024 # bytes; smaller bodies are not worth the CPU
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+# ------------------------------
+# Serialization
+# ------------------------------
+def _default(obj):
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if hasattr(obj, "item"): # numpy scalars
+        return obj.item()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def drop_empty(obj):
+    """Recursively drop None / "" values (the `compact` response option)."""
+    if isinstance(obj, (str, int, float)):
+        return obj # fast path: the ABC check below is slow for scalars
+    if isinstance(obj, Mapping):
+        return {k: drop_empty(v) for k, v in obj.items() if v is not None and v != ""}
+    if isinstance(obj, list):
+        return [drop_empty(v) for v in obj]
+    return obj
+
+
+def negotiate(accept):
+    accept = (accept or "").lower()
+    if msgpack is not None and any(t in accept for t in MSGPACK_MEDIA_TYPES):
+        return MSGPACK_MEDIA_TYPES[0]
+    return JSON_MEDIA_TYPE
+
+
+def encode(payload, media_type=JSON_MEDIA_TYPE):
+    if media_type in MSGPACK_MEDIA_TYPES:
+        return msgpack.packb(payload, default=_default, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+# ------------------------------
+# ETags keyed on the recipe snapshot version
+# ------------------------------
+def make_etag(version, *parts):
+    """Weak ETag for a response derived from snapshot `version` and the request `parts`."""
+    raw = json.dumps(parts, default=_default, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.blake2b(raw, digest_size=8).hexdigest()
+    return f'W/"v{version}-{digest}"'
+
+
+def is_not_modified(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or etag.removeprefix("W/") in tags
+
+
+def not_modified_response(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept, Accept-Encoding"})
+
+
+def encoded_response(request, payload, etag=None, compact=False, status_code=200, media_type=None):
+    if compact:
+        payload = drop_empty(payload)
+    media_type = media_type or negotiate(request.headers.get("accept"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if etag:
+        headers["ETag"] = etag
+    return Response(encode(payload, media_type), status_code=status_code,
+                    media_type=media_type, headers=headers)
+
+
+# ------------------------------
+# Compression middleware (pure ASGI)
+# ------------------------------
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE, gzip_level=GZIP_LEVEL,
+                 brotli_quality=BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, scope):
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accepted = value.decode("latin-1").lower()
+                if brotli is not None and "br" in accepted:
+                    return "br"
+                if "gzip" in accepted:
+                    return "gzip"
+        return None
+
+    def _compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        encoding = self._choose_encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        pending_start = None
+
+        async def send_wrapper(message):
+            nonlocal pending_start
+            if message["type"] == "http.response.start":
+                pending_start = message # held until we see the first body chunk
+                return
+
+            if message["type"] == "http.response.body" and pending_start is not None:
+                start, pending_start = pending_start, None
+                body = message.get("body", b"")
+                headers = MutableHeaders(scope=start)
+
+                passthrough = (
+                    message.get("more_body", False) # streaming response
+                    or len(body) < self.minimum_size
+                    or "content-encoding" in headers
+                    or headers.get("content-type", "").startswith("text/event-stream")
+                )
+                if passthrough:
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressed = self._compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(compressed))
+                if "accept-encoding" not in {v.strip().lower() for v in headers.get("vary", "").split(",")}:
+                    headers.add_vary_header("Accept-Encoding")
+                if "etag" in headers and not headers["etag"].startswith("W/"):
+                    headers["ETag"] = "W/" + headers["etag"] # representation changed
+                await send(start)
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,15 +1,24 @@
 import streamlit as st
 import pandas as pd
 import json
-import time
-import random
 import plotly.express as px
 
 # ---------------------------------------------------
 # Backend Imports (DO NOT MODIFY BACKEND)
 # ---------------------------------------------------
-from ner_foodoscope import run_full_ner_pipeline, process_recipe_dataset
-from recipe_finder import find_matching_recipes
+from ner_foodoscope import run_full_ner_pipeline, load_processed_dataset, NER_DATASET_ARTIFACT
+from recipe_finder import find_matching_recipes, title_embeddings
+from query_encoder import get_encoder
+from meal_planner import MealPlanner, MEAL_SPLITS, FOCUS_OPTIONS
+from token_index import UtensilProcessIndex
+from hybrid_search import HybridSearcher
+from topk_engine import EntityIndex
+from deadline import Deadline
+
+# Searches always fetch this many matches; the "Results to Analyze" slider slices them
+MAX_TOP_K = 50
+SEARCH_BUDGET_MS = 3000 # matching stops here and shows the best recipes found so far
+SEARCH_CACHE_SIZE = 20 # memoized queries per session
 
 # ---------------------------------------------------
 # Page Config & Styling
@@ -217,7 +226,7 @@ with st.sidebar:
     st.title("Settings")
     
     st.markdown("### 🔍 Search Filters")
-    top_k_slider = st.slider("Results to Analyze", 5, 50, 20, 5)
+    top_k_slider = st.slider("Results to Analyze", 5, MAX_TOP_K, 20, 5)
     
     st.markdown("### 🥗 Preference Tweaks")
     st.info("These apply after AI search")
@@ -245,20 +254,61 @@ def render_hero():
         </div>
     """, unsafe_allow_html=True)
 
-@st.cache_data
+@st.cache_resource
 def load_data():
-    # Only load data once
-    return process_recipe_dataset('Datasets/foodoscope_recipes.csv')
-
-def animated_loading():
-    with st.status("🧠 AI is thinking...", expanded=True) as status:
-        st.write("🔍 Analyzing your request...")
-        time.sleep(0.5)
-        st.write("🥦 Extracting dietary constraints...")
-        time.sleep(0.5)
-        st.write("🍳 Matching recipes from database...")
-        time.sleep(0.5)
-        status.update(label="✅ Recipe plan ready!", state="complete", expanded=False)
+    # Loaded once per server process and shared by every session (no per-rerun copy)
+    return load_processed_dataset('Datasets/foodoscope_recipes.csv', NER_DATASET_ARTIFACT)
+
+@st.cache_resource
+def load_encoder(_df):
+    # Load the model and embed every dataset title once, so searches only encode the query
+    encoder = get_encoder()
+    titles = [t for t in _df["Recipe_title"].dropna().unique() if isinstance(t, str) and t]
+    title_embeddings(titles)
+    return encoder
+
+@st.cache_resource
+def load_token_index(_df):
+    # Utensils / Processes tokens in CSR form, built once for equipment and technique filters
+    return UtensilProcessIndex.from_frame(_df)
+
+@st.cache_resource
+def load_entity_index(_df):
+    # NER_ENTITIES parsed once, with postings that bound each recipe's score for top-k pruning
+    return EntityIndex.from_frame(_df)
+
+@st.cache_resource
+def load_searcher(_df):
+    # Same hybrid ranking stack as the API's /search (BM25 + title embeddings + entity boosts)
+    searcher = HybridSearcher(_df.to_dict("records"))
+    searcher.semantic.warm()
+    return searcher
+
+def run_search(query, df, budget_ms=SEARCH_BUDGET_MS):
+    """
+    NER + matching for a query, memoized in session state so reruns (slider moves) skip it.
+    Results cut short by the budget are memoized too, flagged "partial"; budget_ms=None searches to the end.
+    """
+    cache = st.session_state.setdefault("search_cache", {})
+    if query not in cache:
+        with st.status("🧠 AI is thinking...", expanded=True) as status:
+            st.write("🔍 Analyzing your request...")
+            res = run_full_ner_pipeline(query)
+            final_entities = res["FINAL_ENTITIES"]
+            st.write("🍳 Matching recipes from database...")
+            deadline = Deadline(budget_ms)
+            matches = find_matching_recipes(df, final_entities, query, top_k=MAX_TOP_K,
+                                            token_index=load_token_index(df), searcher=load_searcher(df),
+                                            entity_index=load_entity_index(df), deadline=deadline)
+            if deadline.partial:
+                status.update(label=f"⏱️ Best matches found in {budget_ms / 1000:.0f}s", state="complete",
+                              expanded=False)
+            else:
+                status.update(label="✅ Recipe plan ready!", state="complete", expanded=False)
+        cache[query] = {"entities": final_entities, "matches": matches, "partial": deadline.partial}
+        while len(cache) > SEARCH_CACHE_SIZE:
+            cache.pop(next(iter(cache)))
+    return cache[query]
 
 def format_list(item_list):
     if not item_list:
@@ -337,51 +387,34 @@ def render_diet_chart_generator(recipes):
     st.markdown("### 🥗 Smart Diet Chart Generator")
     st.caption("Create a personalized plan from your search results.")
     
-    c1, c2, c3 = st.columns(3)
+    c1, c2, c3, c4 = st.columns(4)
     num_days = c1.slider("Number of Days", 3, 7, 5)
-    meals_per_day = c2.radio("Meals per Day", [2, 3], horizontal=True)
-    focus = c3.selectbox("Plan Focus", ["Balanced", "High Protein", "Low Calorie"])
+    meals_per_day = c2.radio("Meals per Day", sorted(MEAL_SPLITS), index=1, horizontal=True)
+    focus = c3.selectbox("Plan Focus", FOCUS_OPTIONS)
+    daily_calories = c4.number_input("Daily Calories", 1000, 4000, 2000, 100)
     
     if st.button("📅 Generate My Plan", type="primary"):
-        # Filter/Sort Logic
-        plan_recipes = recipes.copy()
-        
-        if focus == "High Protein":
-            plan_recipes = sorted(plan_recipes, key=lambda x: float(x.get('Protein (g)', 0)), reverse=True)
-        elif focus == "Low Calorie":
-            plan_recipes = sorted(plan_recipes, key=lambda x: float(x.get('Calories', 0)))
-        else:
-            random.shuffle(plan_recipes) # Balanced = Random mix
-            
-        # Ensure we have enough recipes to fill the slots (recycle if needed)
-        total_slots = num_days * meals_per_day
-        while len(plan_recipes) < total_slots:
-            plan_recipes.extend(plan_recipes)
+        # Same engine as the API's /generate-diet-plan (calorie targets per meal, no repeats until exhausted)
+        plan = MealPlanner(recipes).plan(daily_calories, num_days, meals_per_day, focus)
         
         # Grid Display
-        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
         display_cols = st.columns(num_days)
         
-        recipe_idx = 0
-        names = ["Breakfast", "Lunch", "Dinner"] if meals_per_day == 3 else ["Lunch", "Dinner"]
-        
-        for i in range(num_days):
+        for i, (day, meals) in enumerate(plan.items()):
             with display_cols[i]:
-                st.markdown(f"**{days[i]}**")
+                st.markdown(f"**{day}**")
                 
                 content_html = f'<div class="diet-day-card">'
-                for m in range(meals_per_day):
-                    r = plan_recipes[recipe_idx]
+                for meal, r in meals.items():
                     content_html += f"""
                     <div class="meal-slot">
-                        <div class="meal-type">{names[m]}</div>
+                        <div class="meal-type">{meal}</div>
                         <div class="meal-name" title="{r['Recipe_title']}">{r['Recipe_title']}</div>
                         <div style="font-size: 0.75rem; color: #636e72">
                             {r.get('Protein (g)')}g Pro • {r.get('Calories')} Cal
                         </div>
                     </div>
                     """
-                    recipe_idx += 1
                 content_html += "</div>"
                 
                 st.markdown(content_html, unsafe_allow_html=True)
@@ -393,9 +426,12 @@ def render_diet_chart_generator(recipes):
 
 render_hero()
 
-# Load Data
+# Load Data (cached resources: dataset, encoder, title embeddings, token index, searcher)
 try:
     df = load_data()
+    load_encoder(df)
+    load_token_index(df)
+    load_searcher(df)
 except Exception as e:
     st.error(f"❌ Failed to load dataset: {e}")
     st.stop()
@@ -413,69 +449,79 @@ if col3.button("🍗 Grilled Chicken (No Fried)"):
 
 query = st.text_input("Describe your dietary needs...", value=start_text, placeholder="e.g. I want spicy Asian food, high protein, low carb...")
 
-# Search
+# Search (only runs the pipeline for queries not seen in this session)
 if st.button("🚀 Find Matching Recipes", type="primary", use_container_width=True):
     if not query:
         st.warning("Please enter a query first!")
     else:
-        animated_loading() # UX Spinners
-        
-        # 1. Run Pipeline
-        res = run_full_ner_pipeline(query)
-        final_entities = res["FINAL_ENTITIES"]
-        
-        # 2. Display Entities (Enhanced)
-        st.markdown("### 🧩 Extracted Constraints")
-        st.markdown('<div class="entity-container">', unsafe_allow_html=True)
+        run_search(query, df)
+        st.session_state["active_query"] = query
+
+# Results are rendered from session state, so sidebar sliders re-filter without re-searching
+active_query = st.session_state.get("active_query")
+if active_query:
+    # 1. Cached NER + matches for the active query
+    result = run_search(active_query, df)
+    if result["partial"]:
+        st.info(f"⏱️ Showing the best matches found within {SEARCH_BUDGET_MS / 1000:.0f}s.")
+        if st.button("🔎 Keep searching"):
+            st.session_state["search_cache"].pop(active_query)
+            result = run_search(active_query, df, budget_ms=None)
+    final_entities = result["entities"]
+    matches = result["matches"][:top_k_slider]
+
+    # 2. Display Entities (Enhanced)
+    st.markdown("### 🧩 Extracted Constraints")
+    st.markdown('<div class="entity-container">', unsafe_allow_html=True)
+    
+    # Helper to render pills
+    def render_pills_html(items, css_class):
+        html = ""
+        if items:
+            if isinstance(items, str): items = [items]
+            for item in items:
+                html += f'<span class="entity-pill {css_class}">{item}</span>'
+        return html
+
+    entity_html = ""
+    entity_html += render_pills_html(final_entities.get("CUISINE"), "pill-cuisine")
+    entity_html += render_pills_html(final_entities.get("DIET"), "pill-diet")
+    entity_html += render_pills_html(final_entities.get("FLAVOR"), "pill-flavor")
+    entity_html += render_pills_html(final_entities.get("METHOD_PREFERENCE"), "pill-method")
+    entity_html += render_pills_html(final_entities.get("METHOD_AVOID"), "pill-avoid")
+    entity_html += render_pills_html(final_entities.get("UTENSIL_REQUIRE"), "pill-method")
+    entity_html += render_pills_html([f"no {u}" for u in final_entities.get("UTENSIL_AVOID") or []], "pill-avoid")
+    entity_html += render_pills_html([f"only {p}" for p in final_entities.get("PROCESS_ONLY") or []], "pill-method")
+    
+    st.markdown(entity_html + '</div>', unsafe_allow_html=True)
+    
+    if not matches:
+        st.error("No recipes found matching your exact criteria. Try valid constraints!")
+    else:
+        # 4. Filter & Display
+        st.markdown("---")
+        st.success(f"🎉 Found {len(matches)} generic matches based on AI analysis!")
         
-        # Helper to render pills
-        def render_pills_html(items, css_class):
-            html = ""
-            if items:
-                if isinstance(items, str): items = [items]
-                for item in items:
-                    html += f'<span class="entity-pill {css_class}">{item}</span>'
-            return html
-
-        entity_html = ""
-        entity_html += render_pills_html(final_entities.get("CUISINE"), "pill-cuisine")
-        entity_html += render_pills_html(final_entities.get("DIET"), "pill-diet")
-        entity_html += render_pills_html(final_entities.get("FLAVOR"), "pill-flavor")
-        entity_html += render_pills_html(final_entities.get("METHOD_PREFERENCE"), "pill-method")
-        entity_html += render_pills_html(final_entities.get("METHOD_AVOID"), "pill-avoid")
+        # Post-filtering for Sidebar (applied to the cached matches)
+        filtered_matches = []
+        for m in matches:
+            p = float(m.get('Protein (g)', 0))
+            c = float(m.get('Calories', 0))
+            if p >= min_prot and c <= max_cal:
+                filtered_matches.append(m)
         
-        st.markdown(entity_html + '</div>', unsafe_allow_html=True)
+        if not filtered_matches:
+             st.warning("Matches found, but sidebar filters hid them all. Reset filters!")
         
-        # 3. Find Matches
-        matches = find_matching_recipes(df, final_entities, query, top_k=top_k_slider)
+        # Recipe Grid (3 cols)
+        cols = st.columns(3)
+        for i, recipe in enumerate(filtered_matches):
+            with cols[i % 3]:
+                render_recipe_card(recipe, final_entities)
         
-        if not matches:
-            st.error("No recipes found matching your exact criteria. Try valid constraints!")
-        else:
-            # 4. Filter & Display
-            st.markdown("---")
-            st.success(f"🎉 Found {len(matches)} generic matches based on AI analysis!")
-            
-            # Post-filtering for Sidebar
-            filtered_matches = []
-            for m in matches:
-                p = float(m.get('Protein (g)', 0))
-                c = float(m.get('Calories', 0))
-                if p >= min_prot and c <= max_cal:
-                    filtered_matches.append(m)
-            
-            if not filtered_matches:
-                 st.warning("Matches found, but sidebar filters hid them all. Reset filters!")
-            
-            # Recipe Grid (3 cols)
-            cols = st.columns(3)
-            for i, recipe in enumerate(filtered_matches):
-                with cols[i % 3]:
-                    render_recipe_card(recipe, final_entities)
-            
-            # 5. Diet Chart Generator
-            if filtered_matches:
-                render_diet_chart_generator(filtered_matches)
+        # 5. Diet Chart Generator
+        if filtered_matches:
+            render_diet_chart_generator(filtered_matches)
 
 # Footer
 st.markdown("---")
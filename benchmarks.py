@@ -0,0 +1,345 @@
+"""
+Micro-benchmarks on synthetic recipe catalogs.
+
+    python benchmarks.py                 # list benchmarks
+    python benchmarks.py diet-bitmaps --n 1000000
+
+Synthetic rows follow the shape of recipes_cache.json so results carry over to real data.
+"""
+import argparse
+import random
+import sys
+import time
+
+# ------------------------------
+# Synthetic data
+# ------------------------------
+REGIONS = [
+    ("Indian Subcontinent", "Indian", "Asian"),
+    ("Chinese and Mongolian", "Chinese", "Asian"),
+    ("Thai", "Thai", "Asian"),
+    ("Japanese", "Japanese", "Asian"),
+    ("Middle Eastern", "Egyptian", "African"),
+    ("Rest Africa", "Nigerian", "African"),
+    ("Northern Africa", "Moroccan", "African"),
+]
+
+
+TITLE_WORDS = (
+    ["spicy", "creamy", "smoky", "classic", "easy", "grilled", "baked", "crispy", "tangy", "herbed"],
+    ["chicken", "lamb", "paneer", "tofu", "chickpea", "lentil", "prawn", "beef", "falafel", "mushroom"],
+    ["biryani", "curry", "tagine", "stew", "salad", "kebab", "noodles", "soup", "wrap", "masala"],
+)
+
+
+INGREDIENTS = [f"herb {a}{b}" for a in "abcdefghijklmnop" for b in "abcdefghijklmnopqrstuvwxy"] + [
+    "2 cups chopped tomatoes", "1 onion, diced", "3 cloves garlic", "salt", "olive oil",
+    "1 tsp ground cumin", "chicken breasts", "basmati rice", "1 can chickpeas", "fresh cilantro",
+]
+
+
+def synthetic_recipes(n, seed=7, start=0):
+    rng = random.Random(seed + start)
+    for i in range(start, start + n):
+        region, sub_region, continent = rng.choice(REGIONS)
+        vegan = rng.random() < 0.08
+        calories = rng.uniform(50, 1200)
+        yield {
+            "_id": f"{i:024x}",
+            "Recipe_id": str(i),
+            "Calories": f"{calories:.1f}",
+            "cook_time": str(rng.randint(0, 120)),
+            "prep_time": str(rng.randint(5, 60)),
+            "servings": str(rng.choice([2, 4, 4, 6, 8, 12])),
+            "Recipe_title": " ".join(rng.choice(words) for words in TITLE_WORDS).title(),
+            "total_time": str(rng.randint(5, 240)),
+            "Region": region,
+            "Sub_region": sub_region,
+            "Continent": continent,
+            "Source": rng.choice(["AllRecipes", "Food.com", "Epicurious"]),
+            "Carbohydrate, by difference (g)": f"{rng.uniform(0, 200):.4f}",
+            "Energy (kcal)": f"{calories * rng.uniform(1, 4):.4f}",
+            "Protein (g)": f"{rng.uniform(0, 150):.4f}",
+            "Total lipid (fat) (g)": f"{rng.uniform(0, 120):.4f}",
+            "Utensils": "||".join(rng.sample(["bowl", "oven", "skillet", "saucepan", "dish", "pan"], 3)),
+            "Processes": "||".join(rng.sample(["stir", "heat", "mix", "bake", "simmer", "fry", "boil"], 4)),
+            "vegan": "1.0" if vegan else "0.0",
+            "pescetarian": "1.0" if vegan or rng.random() < 0.04 else "0.0",
+            "ovo_vegetarian": "0.0",
+            "lacto_vegetarian": "1.0" if rng.random() < 0.03 else "0.0",
+            "ovo_lacto_vegetarian": "0.0",
+            "ingredients": "||".join(rng.sample(INGREDIENTS, rng.randint(4, 12))),
+        }
+
+
+def timed(fn, repeats=50):
+    """Best-of-N wall time of fn() in microseconds, plus its last result."""
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def build_index(index, n, chunk=100_000):
+    """Build a DerivedIndex over n synthetic rows without holding them all in memory."""
+    index.clear()
+    start = time.perf_counter()
+    for offset in range(0, n, chunk):
+        rows = list(synthetic_recipes(min(chunk, n - offset), start=offset))
+        index.add_rows(rows, offset)
+    index.size = n
+    print(f"   build: {time.perf_counter() - start:.2f}s for {n:,} rows")
+    return index
+
+
+# ------------------------------
+# Benchmarks
+# ------------------------------
+def bench_diet_bitmaps(n):
+    from recipe_index import FacetBitmapIndex
+
+    index = build_index(FacetBitmapIndex(), n)
+
+    queries = {
+        "vegan": lambda: index.diet("vegan"),
+        "vegetarian (OR of 4 flags)": lambda: index.diet("vegetarian"),
+        "vegan AND Asian": lambda: index.diet("vegan") & index.facet("continent", "Asian"),
+        "pescetarian AND NOT vegan": lambda: index.flag("pescetarian") & index.negate(index.flag("vegan")),
+        "vegan AND region~indian": lambda: index.diet("vegan") & index.region("indian"),
+    }
+    for label, query in queries.items():
+        us, bits = timed(query)
+        print(f"   {label:<30} {us:9.1f} µs  ({bits.bit_count():,} rows)")
+
+
+def bench_nutrient_ranges(n):
+    from recipe_index import RangeIndex
+
+    index = build_index(RangeIndex(), n)
+
+    queries = {
+        "calories 400-450": lambda: index.range("calories", 400, 450),
+        "calories 400-450 & time<=30": lambda: index.query(
+            {"calories": (400, 450), "total_time": (None, 30)}),
+        "protein/serving>=20 & fat<=15 & servings>=4": lambda: index.query(
+            {"protein": (20, None), "fat": (None, 15), "servings": (4, None)}, per_serving=True),
+        "carbs<=20 & calories<=300 & time<=20": lambda: index.query(
+            {"carbs": (None, 20), "calories": (None, 300), "total_time": (None, 20)}),
+    }
+    for label, query in queries.items():
+        us, bits = timed(query, repeats=10)
+        print(f"   {label:<45} {us / 1000:8.2f} ms  ({bits.bit_count():,} rows)")
+
+
+def bench_response_encoding(n):
+    import gzip
+    import json
+
+    import api_encoding
+    from meal_planner import MealPlanner
+    from recipe_service import plan_entry
+
+    recipes = list(synthetic_recipes(n))
+    planner = MealPlanner(recipes)
+    plan = {day: {meal: plan_entry(r) for meal, r in meals.items()}
+            for day, meals in planner.plan(2000, days=28, meals_per_day=4).items()}
+    payloads = {"search (top 200)": {"recipes": recipes[:200]}, "28-day plan": plan}
+
+    for label, payload in payloads.items():
+        print(f"   {label}")
+        encoders = {"json (stdlib)": lambda: json.dumps(payload).encode("utf-8")}
+        if api_encoding.orjson is not None:
+            encoders["orjson"] = lambda: api_encoding.encode(payload)
+        if api_encoding.msgpack is not None:
+            encoders["msgpack"] = lambda: api_encoding.encode(payload, api_encoding.MSGPACK_MEDIA_TYPES[0])
+        encoders["orjson + compact"] = lambda: api_encoding.encode(api_encoding.drop_empty(payload))
+
+        for name, fn in encoders.items():
+            us, body = timed(fn, repeats=20)
+            gz = gzip.compress(body, compresslevel=api_encoding.GZIP_LEVEL)
+            line = f"      {name:<18} {us:9.1f} µs  {len(body):>9,} B  gzip {len(gz):>8,} B"
+            if api_encoding.brotli is not None:
+                line += f"  br {len(api_encoding.brotli.compress(body, quality=api_encoding.BROTLI_QUALITY)):>8,} B"
+            print(line)
+
+
+def bench_pantry(n):
+    from ingredient_index import IngredientIndex
+
+    index = build_index(IngredientIndex(), n)
+    pantry = ["tomato", "onion", "garlic", "salt", "olive oil", "cumin", "chicken breast", "rice"]
+    pantry += INGREDIENTS[:400:8]
+    print(f"   vocabulary: {len(index.names):,} canonical ingredients, pantry: {len(pantry)} items")
+
+    pantry_ids = index.resolve(pantry)
+    for coverage in (1.0, 0.8, 0.5):
+        us, bits = timed(lambda: index.pantry_bits(pantry_ids, coverage), repeats=5)
+        print(f"   coverage >= {coverage:.0%}  {us / 1000:8.2f} ms  ({bits.bit_count():,} rows)")
+
+
+def bench_memory(n):
+    import gc
+    import json
+    import tracemalloc
+
+    from recipe_table import RecipeTable
+
+    # Round-trip through JSON so rows own their strings, as after RecipeService.load_cache()
+    text = json.dumps(list(synthetic_recipes(n)))
+
+    def allocated(build):
+        gc.collect()
+        tracemalloc.start()
+        data = build()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return size, data
+
+    dict_bytes, rows = allocated(lambda: json.loads(text))
+    del rows
+    table_bytes, table = allocated(lambda: RecipeTable(json.loads(text)))
+
+    print(f"   list of dicts  {dict_bytes / n:8.1f} B/recipe  ({dict_bytes / 2**20:7.1f} MiB)")
+    print(f"   RecipeTable    {table_bytes / n:8.1f} B/recipe  ({table_bytes / 2**20:7.1f} MiB)"
+          f"  {dict_bytes / table_bytes:.1f}x smaller")
+    for key, column in table.columns.items():
+        distinct = len(column.dictionary) - 2 if hasattr(column, "dictionary") else len(getattr(column, "tokens", ()))
+        if distinct:
+            print(f"      {key:<22} {type(column).__name__.strip('_'):<18} {distinct:>7,} distinct")
+
+    us, _ = timed(lambda: [r.get("Calories") for r in table[:10_000]], repeats=5)
+    print(f"   10k row.get() via views: {us / 1000:.2f} ms")
+
+
+def bench_fuzzy(n):
+    from trigram_index import TrigramIndex
+
+    index = build_index(TrigramIndex(), n)
+    print(f"   vocabulary: {len(index.words):,} words")
+
+    lookups = {
+        "similar('falafal')": lambda: index.similar("falafal"),
+        "similar('biriyani')": lambda: index.similar("biriyani"),
+        "correct('spicey chiken biriyani')": lambda: index.correct("spicey chiken biriyani"),
+        "suggest_rows('chick')": lambda: index.suggest_rows("chick"),
+        "suggest_rows('creamy lentl cur')": lambda: index.suggest_rows("creamy lentl cur"),
+    }
+    for label, lookup in lookups.items():
+        us, result = timed(lookup, repeats=20)
+        print(f"   {label:<36} {us / 1000:7.2f} ms  {str(result)[:60]}")
+
+
+def bench_topk(n):
+    import json
+
+    import pandas as pd
+
+    from ner_foodoscope import SUPPORTED_CUISINES, SUPPORTED_FLAVORS, SUPPORTED_METHODS
+    from recipe_finder import find_matching_recipes, score_recipe
+    from topk_engine import EntityIndex
+
+    rng = random.Random(3)
+    rows = list(synthetic_recipes(n))
+    for r in rows:
+        r["NER_ENTITIES"] = json.dumps({
+            "CUISINE": rng.sample(SUPPORTED_CUISINES, rng.randint(0, 1)),
+            "FLAVOR": rng.sample(SUPPORTED_FLAVORS, rng.randint(0, 2)),
+            "METHOD_PREFERENCE": rng.sample(SUPPORTED_METHODS, rng.randint(0, 2)),
+        })
+    df = pd.DataFrame(rows)
+    us, index = timed(lambda: EntityIndex.from_frame(df), repeats=1)
+    print(f"   entity index build: {us / 1000:.1f} ms")
+
+    user = {"CUISINE": [SUPPORTED_CUISINES[0]], "FLAVOR": [SUPPORTED_FLAVORS[0]], "CALORIE_LIMIT": 600}
+    entities = [json.loads(e) for e in df["NER_ENTITIES"]]
+    full = lambda: sorted(((score_recipe(e, user), i) for i, e in enumerate(entities)), reverse=True)[:20]
+    queries = {
+        "score every row + sort (entities pre-parsed)": full,
+        "find_matching_recipes top 20 (grouped)": lambda: find_matching_recipes(df, user, top_k=20, entity_index=index),
+    }
+    for label, query in queries.items():
+        us, _ = timed(query, repeats=3)
+        print(f"   {label:<46} {us / 1000:8.2f} ms")
+
+
+def bench_analytics(n):
+    from analytics_cube import AnalyticsCube
+
+    rows = list(synthetic_recipes(n))
+    us, cube = timed(lambda: AnalyticsCube().rebuild(rows), repeats=1)
+    print(f"   cube build: {us / 1000:.1f} ms, {len(cube.cells):,} cells")
+
+    def scan():
+        totals = {}
+        for r in rows:
+            if r["vegan"] == "1.0":
+                total = totals.setdefault(r["Region"], [0, 0.0])
+                total[0] += 1
+                total[1] += float(r["Protein (g)"])
+        return {region: s / c for region, (c, s) in totals.items()}
+
+    queries = {
+        "scan: avg protein of vegan recipes by region": scan,
+        "cube: same query": lambda: cube.query(["region"], diet_type="vegan"),
+        "cube: continent x time bucket, <= 30 min": lambda: cube.query(["continent", "time_bucket"], max_time=30),
+    }
+    for label, query in queries.items():
+        us, _ = timed(query, repeats=5)
+        print(f"   {label:<46} {us / 1000:8.3f} ms")
+
+
+def bench_swap(n):
+    from similarity_graph import SimilarityGraph
+
+    rows = list(synthetic_recipes(n))
+    us, graph = timed(lambda: SimilarityGraph.build(rows, use_titles=False), repeats=1)
+    print(f"   graph build (nutrients only): {us / 1e6:.1f} s, "
+          f"{graph.neighbor_rows.nbytes / 1e6:.1f} MB adjacency")
+
+    rid = rows[n // 2]["_id"]
+    calories = float(rows[n // 2]["Calories"])
+    scan = lambda: sorted(rows, key=lambda r: abs(float(r["Calories"]) - calories))[:5]
+    lookups = {
+        "sort whole catalog by calorie distance": scan,
+        "graph neighbours (O(k))": lambda: graph.neighbors(rid)[:5],
+    }
+    for label, lookup in lookups.items():
+        us, _ = timed(lookup, repeats=5)
+        print(f"   {label:<40} {us / 1000:8.3f} ms")
+
+
+BENCHMARKS = {
+    "analytics": bench_analytics,
+    "diet-bitmaps": bench_diet_bitmaps,
+    "fuzzy": bench_fuzzy,
+    "memory": bench_memory,
+    "nutrient-ranges": bench_nutrient_ranges,
+    "pantry": bench_pantry,
+    "response-encoding": bench_response_encoding,
+    "swap": bench_swap,
+    "topk": bench_topk,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", nargs="?", choices=sorted(BENCHMARKS))
+    parser.add_argument("--n", type=int, default=100_000, help="Synthetic catalog size")
+    args = parser.parse_args(argv)
+
+    if not args.benchmark:
+        print("Available benchmarks: " + ", ".join(sorted(BENCHMARKS)))
+        return 0
+
+    print(f"🏁 {args.benchmark} (n={args.n:,})")
+    BENCHMARKS[args.benchmark](args.n)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Materialized candidate pools for the most frequent plan constraint combinations.
+
+Most plan requests share a handful of constraint combinations (vegan or any, a few regions,
+30 / 45 / 60 minute caps), yet every one of them used to rerun get_filtered_pool() and sort the
+result by calories. CandidatePools counts how often each combination is requested and keeps a
+ready MealPlanner (calorie-sorted pool, its calorie / protein arrays and the filters that had to be
+relaxed) for the MATERIALIZED_POOLS most requested ones. Uncommon combinations are filtered on
+the fly as before. Request counts are halved every DECAY_EVERY lookups, so the set follows
+recent traffic. After every commit to the recipe set, the appended recipes that pass a pool's
+filters are merged into it; edits, deletions and relaxed pools are rebuilt.
+"""
+import copy
+import threading
+from collections import Counter
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+MATERIALIZED_POOLS = 8 # combinations kept ready
+MIN_REQUESTS = 3 # a combination is materialized once it was requested this often (after decay)
+DECAY_EVERY = 1000 # lookups between halvings of the request counts
+
+
+class CandidatePools:
+    def __init__(self, build, extend=None, capacity=MATERIALIZED_POOLS, min_requests=MIN_REQUESTS,
+                 decay_every=DECAY_EVERY):
+        self.build = build # key -> (MealPlanner, relaxed filter names)
+        self.extend = extend # (key, planner, relaxed, change) -> (planner, relaxed), or None to rebuild
+        self.capacity = capacity
+        self.min_requests = min_requests
+        self.decay_every = decay_every
+        self.pools = {} # key -> (recipes version, planner, relaxed)
+        self.requests = Counter()
+        self.stats = {"hits": 0, "misses": 0, "materialized": 0, "evicted": 0, "refreshed": 0, "extended": 0}
+        self._lookups = 0
+        self._lock = threading.Lock()
+        self._service = None
+        self._unsubscribe = None
+
+    def _version(self):
+        return self._service.version if self._service is not None else None
+
+    # ------------------------------
+    # Lookup
+    # ------------------------------
+    def get(self, key):
+        """
+        (planner, relaxed) for a constraint key. Planners share the materialized arrays; each caller
+        gets its own copy, so per-plan state (last_stats) is never shared.
+        """
+        version = self._version()
+        with self._lock:
+            self.requests[key] += 1
+            self._lookups += 1
+            if self._lookups % self.decay_every == 0:
+                self._decay()
+            entry = self.pools.get(key)
+            hit = entry is not None and entry[0] == version
+            self.stats["hits" if hit else "misses"] += 1
+
+        if hit:
+            return copy.copy(entry[1]), list(entry[2])
+
+        planner, relaxed = self.build(key)
+        with self._lock:
+            if version == self._version() and self._admit(key):
+                self.pools[key] = (version, planner, relaxed)
+        return copy.copy(planner), list(relaxed)
+
+    def _decay(self):
+        for key in list(self.requests):
+            self.requests[key] //= 2
+            if not self.requests[key]:
+                del self.requests[key]
+
+    def _admit(self, key):
+        """Make room for `key` if it is requested often enough (evicting the least requested pool)."""
+        if key in self.pools:
+            return True
+        if self.requests[key] < self.min_requests:
+            return False
+        if len(self.pools) >= self.capacity:
+            coldest = min(self.pools, key=lambda k: self.requests[k])
+            if self.requests[coldest] >= self.requests[key]:
+                return False
+            del self.pools[coldest]
+            self.stats["evicted"] += 1
+        self.stats["materialized"] += 1
+        return True
+
+    # ------------------------------
+    # Refresh on recipe changes
+    # ------------------------------
+    def attach(self, service):
+        self.detach()
+        self._service = service
+        self._unsubscribe = service.subscribe(self.refresh)
+        return self
+
+    def detach(self):
+        if self._unsubscribe:
+            self._unsubscribe()
+        self._unsubscribe = None
+
+    def refresh(self, change=None):
+        """
+        Bring every materialized pool up to the current recipes (runs on the sync thread).
+        Appended pages are merged into the existing pools; other changes rebuild them.
+        """
+        version = self._version()
+        with self._lock:
+            entries = dict(self.pools)
+        for key, (built, planner, relaxed) in entries.items():
+            updated = None
+            if self.extend is not None and change is not None and built == change.version - 1:
+                updated = self.extend(key, planner, relaxed, change)
+            counter = "extended" if updated else "refreshed"
+            planner, relaxed = updated or self.build(key)
+            with self._lock:
+                if key in self.pools:
+                    self.pools[key] = (version, planner, relaxed)
+                    self.stats[counter] += 1
+
+    def status(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "hit_rate": round(self.stats["hits"] / (lookups or 1), 4),
+                    "pools": [{"constraints": list(key), "size": len(planner), "requests": self.requests[key]}
+                              for key, (_, planner, _) in self.pools.items()]}
@@ -0,0 +1,138 @@
+"""
+Circuit breaker for the upstream recipe API.
+
+    closed     requests go through; FAILURE_THRESHOLD consecutive failures open the circuit
+    open       requests fail fast (UpstreamUnavailable) without touching the network
+    half_open  after the cooldown, one probe request at a time is let through: a success
+               closes the circuit, a failure re-opens it with twice the cooldown (capped)
+
+The state is persisted to a small JSON file, so a restart while the upstream is down does not
+pay the request timeout again, along with the time of the last successful sync.
+"""
+import json
+import os
+import threading
+import time
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+FAILURE_THRESHOLD = 3 # consecutive failures before the circuit opens
+RESET_TIMEOUT = 60 # seconds open before the first probe
+MAX_RESET_TIMEOUT = 30 * 60 # cooldown cap after repeated failed probes
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of a network request while the circuit is open (or the service is offline)."""
+
+
+# ------------------------------
+# CIRCUIT BREAKER
+# ------------------------------
+class CircuitBreaker:
+    def __init__(self, state_file=None, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 max_reset_timeout=MAX_RESET_TIMEOUT, clock=time.time):
+        self.state_file = state_file
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._probing = False # a half-open probe is in flight
+
+        self.state = CLOSED
+        self.failures = 0 # consecutive
+        self.opened_at = None
+        self.cooldown = reset_timeout
+        self.last_error = None
+        self.last_good_sync = None
+        self.load()
+
+    # ------------------------------
+    # Persistence
+    # ------------------------------
+    def load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.state = data.get("state", CLOSED)
+            self.failures = data.get("failures", 0)
+            self.opened_at = data.get("opened_at")
+            self.cooldown = data.get("cooldown", self.reset_timeout)
+            self.last_error = data.get("last_error")
+            self.last_good_sync = data.get("last_good_sync")
+            if self.state == HALF_OPEN: # the probe died with the previous process
+                self.state = OPEN
+        except Exception as e:
+            print(f"⚠️ Error loading circuit breaker state: {e}")
+
+    def save(self):
+        if not self.state_file:
+            return
+        with open(self.state_file, "w", encoding="utf-8") as f:
+            json.dump(self.status(), f, indent=2)
+
+    # ------------------------------
+    # Transitions
+    # ------------------------------
+    def retry_in(self):
+        """Seconds until the next probe is allowed (0 unless open)."""
+        if self.state != OPEN:
+            return 0
+        return max(self.opened_at + self.cooldown - self.clock(), 0)
+
+    def allow(self):
+        """May a request go out now? In half-open state only one probe at a time is allowed."""
+        with self._lock:
+            if self.state == OPEN and self.retry_in() == 0:
+                self.state = HALF_OPEN
+                print("🩺 Upstream circuit half-open: probing")
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return self.state != OPEN
+
+    def record_success(self):
+        with self._lock:
+            self._probing = False
+            changed = self.state != CLOSED or self.failures
+            if self.state != CLOSED:
+                print("✅ Upstream circuit closed")
+            self.state, self.failures, self.opened_at, self.cooldown = CLOSED, 0, None, self.reset_timeout
+            if changed:
+                self.save()
+
+    def record_failure(self, error):
+        with self._lock:
+            self.last_error = str(error)
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, self.max_reset_timeout)
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state, self.opened_at = OPEN, self.clock()
+                print(f"⛔ Upstream circuit open for {self.cooldown:.0f}s after {self.failures} failures: {error}")
+            self._probing = False
+            self.save()
+
+    def record_sync(self):
+        """Remember a sync run that completed without upstream errors."""
+        with self._lock:
+            self.last_good_sync = self.clock()
+            self.save()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened_at": self.opened_at,
+            "cooldown": self.cooldown,
+            "retry_in": round(self.retry_in(), 1),
+            "last_error": self.last_error,
+            "last_good_sync": self.last_good_sync,
+        }
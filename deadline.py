@@ -0,0 +1,53 @@
+"""
+Per-request time budgets for anytime execution.
+
+    deadline = Deadline(250)                  # milliseconds; Deadline() never expires
+    for day in days:
+        ...
+        if deadline.check("plan"):            # out of time: keep what we have
+            break
+    deadline.status()  # {"partial": True, "stopped_at": "plan", "budget_ms": 250, "elapsed_ms": 251.3}
+
+Pipelines call check(stage) between units of work, most useful work first. Once the budget is
+spent, check() records the first stage that hit it and returns True, and the caller returns its
+best result so far instead of running to completion.
+"""
+import time
+
+
+class Deadline:
+    def __init__(self, budget_ms=None, start=None, clock=time.perf_counter):
+        self.budget_ms = budget_ms
+        self.clock = clock
+        self.start = clock() if start is None else start # e.g. the request's arrival time
+        self.stopped_at = None
+
+    @property
+    def partial(self):
+        return self.stopped_at is not None
+
+    def elapsed_ms(self):
+        return (self.clock() - self.start) * 1000
+
+    def remaining_ms(self):
+        if self.budget_ms is None:
+            return float("inf")
+        return max(self.budget_ms - self.elapsed_ms(), 0.0)
+
+    def expired(self):
+        return self.budget_ms is not None and self.elapsed_ms() >= self.budget_ms
+
+    def check(self, stage):
+        """True once the budget is spent; remembers `stage` as where work stopped."""
+        if self.stopped_at is None and self.expired():
+            self.stopped_at = stage
+        return self.stopped_at is not None
+
+    def cap(self, budgets_ms):
+        """Per-stage budgets ({stage: ms}) cut down to the time that is left."""
+        remaining = self.remaining_ms()
+        return {stage: min(ms, remaining) for stage, ms in budgets_ms.items()}
+
+    def status(self):
+        return {"partial": self.partial, "stopped_at": self.stopped_at,
+                "budget_ms": self.budget_ms, "elapsed_ms": round(self.elapsed_ms(), 3)}
@@ -1,5 +1,4 @@
 import { useState } from 'react'
-import axios from 'axios'
 import { Link } from 'react-router-dom'
 
 function DietChart() {
@@ -14,58 +13,78 @@ function DietChart() {
   
   const [dietPlan, setDietPlan] = useState(null)
   const [loading, setLoading] = useState(false)
+  const [progress, setProgress] = useState(null)
+  const [notices, setNotices] = useState([])
 
   const handleChange = (e) => {
     setFormData({ ...formData, [e.target.name]: e.target.value })
   }
 
+  // Map form choices onto the planner's request fields
+  const buildPlanRequest = () => {
+    const focusByGoal = { 'Weight Loss': 'Low Calorie', 'Muscle Gain': 'High Protein' }
+    // Only diets the planner can filter on (the dataset has no keto / paleo flags)
+    const dietByChoice = { 'Vegetarian': 'vegetarian', 'Vegan': 'vegan', 'Pescetarian': 'pescetarian' }
+    const weight = parseFloat(formData.weight)
+    return {
+      daily_calories: weight ? Math.round(weight * 30) : 2000,
+      diet_type: dietByChoice[formData.diet] || 'any',
+      region: formData.cuisine.trim() || null,
+      days: parseInt(formData.days, 10) || 7,
+      focus: focusByGoal[formData.goal] || formData.goal
+    }
+  }
+
   const handleGenerate = async (e) => {
     e.preventDefault()
     setLoading(true)
-    
-    // Simulate Plan Generation based on search results for now
-    // In a real app, this would call a dedicated /generate-plan endpoint
-    // We will reuse the search endpoint to find recipes matching the criteria first
-    
-    const query = `${formData.cuisine} ${formData.diet === 'None' ? '' : formData.diet} food for ${formData.goal}`
-    
+    setDietPlan({})
+    setNotices([])
+    setProgress(null)
+
+    // Days arrive as Server-Sent Events and render as soon as each one is chosen
     try {
-      const res = await axios.post('http://localhost:8000/search', {
-        query: query,
-        top_k: 30
+      const res = await fetch('http://localhost:8000/generate-diet-plan/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify(buildPlanRequest())
       })
-      const recipes = res.data.recipes
-      
-      if(recipes.length === 0) {
-        alert("No recipes found for these criteria. Try broader terms!")
-        setLoading(false)
-        return
-      }
+      if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`)
 
-      // Generate Plan Logic
-      let sorted = [...recipes]
-      if (formData.goal === 'High Protein') {
-        sorted.sort((a, b) => b['Protein (g)'] - a['Protein (g)'])
-      } else if (formData.goal === 'Low Calorie') {
-        sorted.sort((a, b) => a['Calories'] - b['Calories'])
-      } else {
-        sorted.sort(() => Math.random() - 0.5)
-      }
+      const reader = res.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        let sep
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+          const chunk = buffer.slice(0, sep)
+          buffer = buffer.slice(sep + 2)
+
+          let event = 'message'
+          let data = ''
+          for (const line of chunk.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7)
+            else if (line.startsWith('data: ')) data += line.slice(6)
+          }
+          const payload = data ? JSON.parse(data) : {}
 
-      const days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-      const plan = {}
-      let idx = 0
-      
-      for (let i = 0; i < formData.days; i++) {
-        const dayName = days[i % 7]
-        plan[dayName] = []
-        for (let m = 0; m < 3; m++) {
-          plan[dayName].push(sorted[idx % sorted.length])
-          idx++
+          if (event === 'day') {
+            const meals = Object.entries(payload.meals).map(([mealName, recipe]) => ({ ...recipe, mealName }))
+            setDietPlan(prev => ({ ...prev, [payload.day]: meals }))
+          } else if (event === 'progress') {
+            setProgress(payload)
+          } else if (event === 'relaxed') {
+            setNotices(prev => [...prev, `No exact matches, so the ${payload.filter} filter was relaxed.`])
+          } else if (event === 'error') {
+            alert(payload.detail)
+          }
         }
       }
-      setDietPlan(plan)
-      
     } catch (err) {
       console.error(err)
       alert("Error generating plan.")
@@ -151,8 +170,7 @@ function DietChart() {
                  <option>None</option>
                  <option>Vegetarian</option>
                  <option>Vegan</option>
-                 <option>Keto</option>
-                 <option>Paleo</option>
+                 <option>Pescetarian</option>
                </select>
             </div>
 
@@ -173,7 +191,9 @@ function DietChart() {
               disabled={loading}
               className="w-full bg-secondary hover:bg-orange-600 text-white font-bold py-4 rounded-xl transition-all shadow-md transform hover:scale-105 disabled:opacity-50"
             >
-              {loading ? "Generating Plan..." : "Create My Plan"}
+              {loading
+                ? (progress ? `Generating Plan... ${progress.completed}/${progress.total}` : "Generating Plan...")
+                : "Create My Plan"}
             </button>
           </form>
         </div>
@@ -188,6 +208,9 @@ function DietChart() {
           ) : (
             <div className="space-y-6">
                 <h3 className="text-2xl font-bold text-gray-800">Your {formData.days}-Day Plan</h3>
+                {notices.map((notice, nIdx) => (
+                  <p key={nIdx} className="text-sm text-orange-700 bg-orange-50 rounded-xl px-4 py-2">⚠️ {notice}</p>
+                ))}
                 <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
                   {Object.keys(dietPlan).map((day, dIdx) => (
                     <div key={dIdx} className="bg-white rounded-2xl p-5 shadow-sm border border-gray-100 hover:shadow-md transition-shadow">
@@ -198,7 +221,7 @@ function DietChart() {
                         {dietPlan[day].map((meal, mIdx) => (
                           <div key={mIdx} className="flex gap-4 items-start">
                              <div className="w-16 text-xs font-bold text-gray-400 uppercase pt-1">
-                               {['Breakfast', 'Lunch', 'Dinner'][mIdx]}
+                               {meal.mealName}
                              </div>
                              <div className="flex-1">
                                <div className="font-bold text-gray-800 text-sm">{meal.Recipe_title}</div>
@@ -0,0 +1,459 @@
+"""
+Hybrid retrieval shared by /search and the Streamlit search.
+
+    candidates   BM25 over titles, ingredients and region (LexicalIndex)   } in parallel, each
+                 cosine similarity over title embeddings (EmbeddingIndex)  } with its own budget
+    fusion       reciprocal rank fusion, optionally weighted per retriever
+    boosts       score_recipe entity overlap (cuisine x5, flavor x3, method x2)
+
+A retriever that misses its latency budget is left out of the fusion instead of delaying the
+response. The semantic retriever also stays out until its title embeddings are ready; the first
+query starts building them in the background. Edited titles keep their old vectors until the
+background re-embedding is done.
+
+Given precomputed entity scores (topk_engine.EntityIndex), candidates no retriever returned are
+ranked by their entity bound with early termination, and on large candidate sets the semantic
+retriever only scores a shortlist (lexical hits + best entity groups).
+"""
+import bisect
+import heapq
+import json
+import math
+import re
+import threading
+import time
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from ingredient_index import singularize, split_ingredients
+from ner_foodoscope import SUPPORTED_CUISINES, SUPPORTED_FLAVORS, SUPPORTED_METHODS
+from recipe_finder import score_recipe
+from recipe_index import DerivedIndex, compact_rows
+from topk_engine import TopK, bound_groups, scan_groups
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+STAGE_BUDGETS_MS = {"lexical": 50, "semantic": 100, "boosts": 20}
+FUSION_WEIGHTS = {"lexical": 1.0, "semantic": 1.0}
+
+RRF_K = 60 # reciprocal rank fusion constant
+CANDIDATES_PER_RESULT = 5 # each retriever returns top_k * this many candidates
+MIN_CANDIDATES = 50
+ENTITY_WEIGHT = 0.5 # entity boost relative to the (normalised) fused score
+SCORE_SCALE = 10 # reported Score = SCORE_SCALE * (fused + boost)
+SEMANTIC_FULL_SCAN = 20000 # above this many candidates, semantic similarity is only computed for a shortlist
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {"a", "an", "and", "the", "of", "with", "in", "on", "for", "to", "or", "i", "want", "some", "me"}
+
+_WORD = re.compile(r"[a-z]+")
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-search")
+    return _POOL
+
+
+def tokenize(text):
+    return [singularize(w) for w in _WORD.findall(str(text).lower()) if w not in STOPWORDS]
+
+
+def _document(row):
+    parts = [row.get("Recipe_title"), row.get("Region"), row.get("Sub_region")]
+    parts += split_ingredients(row.get("ingredients"))
+    return " ".join(p for p in parts if isinstance(p, str))
+
+
+# ------------------------------
+# Entities of a recipe (for the boost stage)
+# ------------------------------
+def recipe_entities(row):
+    """NER_ENTITIES when the row carries them (processed dataset), else vocabulary matches on its text."""
+    entities = row.get("NER_ENTITIES")
+    if isinstance(entities, str):
+        entities = json.loads(entities)
+    if isinstance(entities, dict):
+        return entities
+
+    text = " ".join(str(row.get(k) or "") for k in ("Recipe_title", "Region", "Sub_region", "Processes")).lower()
+    return {
+        "CUISINE": [c for c in SUPPORTED_CUISINES if c.lower() in text],
+        "FLAVOR": [f for f in SUPPORTED_FLAVORS if f.lower() in text],
+        "METHOD_PREFERENCE": [m for m in SUPPORTED_METHODS if m.lower() in text],
+    }
+
+
+def max_entity_score(user_entities):
+    """Largest score_recipe() any recipe can get for these user entities."""
+    return (5 * len(set(user_entities.get("CUISINE") or []))
+            + 3 * len(set(user_entities.get("FLAVOR") or []))
+            + 2 * len(set(user_entities.get("METHOD_PREFERENCE") or [])))
+
+
+# ------------------------------
+# LEXICAL INDEX (BM25)
+# ------------------------------
+class LexicalIndex(DerivedIndex):
+    name = "lexical"
+
+    def clear(self):
+        self.postings = {} # term -> (rows, term frequencies)
+        self.doc_len = array("I")
+        self.total_len = 0
+
+    @staticmethod
+    def _terms(r):
+        terms = tokenize(_document(r))
+        counts = defaultdict(int)
+        for t in terms:
+            counts[t] += 1
+        return len(terms), counts
+
+    def add_rows(self, rows, start):
+        for i, r in enumerate(rows, start):
+            length, counts = self._terms(r)
+            self.doc_len.append(length)
+            self.total_len += length
+
+            for t, tf in counts.items():
+                posting = self.postings.get(t)
+                if posting is None:
+                    posting = self.postings[t] = (array("I"), array("H"))
+                posting[0].append(i)
+                posting[1].append(min(tf, 65535))
+
+    def fingerprint(self):
+        return self.postings, self.doc_len
+
+    def update_rows(self, positions, old_rows, new_rows):
+        for p, old, row in zip(positions, old_rows, new_rows):
+            for t in self._terms(old)[1]:
+                rows, tfs = self.postings[t]
+                at = bisect.bisect_left(rows, p)
+                del rows[at], tfs[at]
+                if not rows:
+                    del self.postings[t]
+
+            length, counts = self._terms(row)
+            self.total_len += length - self.doc_len[p]
+            self.doc_len[p] = length
+            for t, tf in counts.items():
+                rows, tfs = self.postings.setdefault(t, (array("I"), array("H")))
+                at = bisect.bisect_left(rows, p)
+                rows.insert(at, p)
+                tfs.insert(at, min(tf, 65535))
+
+    def remove_rows(self, positions, old_rows):
+        import numpy as np
+
+        first = min(positions)
+        for t, (rows, tfs) in list(self.postings.items()):
+            at = bisect.bisect_left(rows, first) # rows before the first deletion keep their positions
+            if at == len(rows):
+                continue
+            keep, tail = compact_rows(np.frombuffer(rows[at:], dtype=np.uint32), positions)
+            kept_tfs = np.frombuffer(tfs[at:], dtype=np.uint16)[keep]
+            del rows[at:], tfs[at:]
+            rows.frombytes(tail.astype(np.uint32).tobytes())
+            tfs.frombytes(kept_tfs.tobytes())
+            if not rows:
+                del self.postings[t]
+        for p in sorted(positions, reverse=True):
+            self.total_len -= self.doc_len[p]
+            del self.doc_len[p]
+
+    def top(self, query, n, candidates=None, accept=None):
+        """
+        [(row, bm25)] best first; `candidates` (a set of rows) restricts the result, and
+        `accept(row)` filters it lazily (only rows that would make the top n are checked).
+        """
+        docs = len(self.doc_len)
+        if not docs:
+            return []
+        avg_len = self.total_len / docs or 1.0
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, tfs = posting
+            idf = math.log(1 + (docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            for row, tf in zip(rows, tfs):
+                if candidates is not None and row not in candidates:
+                    continue
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[row] / avg_len)
+                scores[row] += idf * tf * (BM25_K1 + 1) / norm
+
+        if accept is None:
+            return heapq.nlargest(n, scores.items(), key=lambda item: item[1])
+        ranked = []
+        for row, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+            if len(ranked) >= n:
+                break
+            if accept(row):
+                ranked.append((row, score))
+        return ranked
+
+
+# ------------------------------
+# EMBEDDING INDEX (title vectors)
+# ------------------------------
+class EmbeddingIndex(DerivedIndex):
+    name = "semantic"
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._warming = None
+
+    def clear(self):
+        self.titles = []
+        self.matrix = None # (rows, dim) float32, L2-normalised; stale until warm() covers every row
+        self.stale = False # titles were edited since the matrix was built
+        self.error = None
+
+    @staticmethod
+    def _title(r):
+        return r.get("Recipe_title") if isinstance(r.get("Recipe_title"), str) else ""
+
+    def add_rows(self, rows, start):
+        self.titles.extend(self._title(r) for r in rows)
+
+    def fingerprint(self):
+        return self.titles
+
+    def update_rows(self, positions, old_rows, new_rows):
+        # The current matrix keeps serving (old vectors for these rows) until warm() replaces it
+        for p, row in zip(positions, new_rows):
+            self.titles[p] = self._title(row)
+        self.stale = True
+        if self.matrix is not None:
+            self.warm_async()
+
+    def remove_rows(self, positions, old_rows):
+        import numpy as np
+
+        for p in sorted(positions, reverse=True):
+            del self.titles[p]
+        matrix = self.matrix
+        if matrix is not None: # it may not cover rows appended since the last warm()
+            self.matrix = np.delete(matrix, [p for p in positions if p < len(matrix)], axis=0)
+
+    def ready(self):
+        matrix = self.matrix
+        return matrix is not None and len(matrix) == len(self.titles)
+
+    def warm(self):
+        """Embed every title (cached per title, so only new ones are encoded)."""
+        import numpy as np
+        from recipe_finder import title_embeddings
+
+        self.stale = False
+        titles = list(self.titles)
+        named = [t for t in dict.fromkeys(titles) if t]
+        vectors = dict(zip(named, title_embeddings(named))) if named else {}
+        dim = len(next(iter(vectors.values()))) if vectors else 1
+        zero = np.zeros(dim, dtype=np.float32)
+        matrix = np.stack([vectors.get(t, zero) for t in titles]).astype(np.float32) if titles else None
+        if titles == self.titles:
+            self.matrix = matrix
+        return len(named)
+
+    def warm_async(self):
+        """Start warm() in the background once (no-op while one is running or after a failure)."""
+        with self._lock:
+            if self.error or (self._warming is not None and not self._warming.done()):
+                return
+            self._warming = _pool().submit(self._warm_logged)
+
+    def _warm_logged(self):
+        try:
+            count = self.warm()
+            while self.stale: # titles were edited while embedding
+                count = self.warm()
+            print(f"🧠 Semantic search ready ({count} titles embedded)")
+        except Exception as e:
+            self.error = str(e)
+            print(f"⚠️ Semantic search unavailable: {e}")
+
+    def top(self, query_vector, n, candidates=None, accept=None):
+        import numpy as np
+
+        matrix = self.matrix
+        if candidates is not None:
+            rows = np.fromiter(candidates, dtype=np.int64)
+            scores = matrix[rows] @ query_vector
+        else:
+            rows = None
+            scores = matrix @ query_vector
+
+        n = min(n, len(scores))
+        if n <= 0:
+            return []
+        if accept is not None:
+            ranked = []
+            for i in np.argsort(-scores, kind="stable").tolist():
+                if len(ranked) >= n:
+                    break
+                row = int(rows[i] if rows is not None else i)
+                if accept(row):
+                    ranked.append((row, float(scores[i])))
+            return ranked
+        best = np.argpartition(-scores, n - 1)[:n]
+        best = best[np.argsort(-scores[best])]
+        return [(int(rows[i] if rows is not None else i), float(scores[i])) for i in best]
+
+
+# ------------------------------
+# HYBRID SEARCHER
+# ------------------------------
+class HybridSearcher:
+    """
+    Follows a RecipeService (API) or indexes a fixed list of rows (Streamlit DataFrame records).
+    search() returns ([(row, score)], stats) with per-stage timings and skipped stages.
+    """
+
+    def __init__(self, recipes=None, service=None):
+        self.lexical = LexicalIndex()
+        self.semantic = EmbeddingIndex()
+        if service is not None:
+            self.lexical.attach(service)
+            self.semantic.attach(service)
+            self._rows = lambda: service.recipes
+        else:
+            recipes = recipes if isinstance(recipes, list) else list(recipes or []) # a list is shared, not copied
+            self.lexical.rebuild(recipes)
+            self.semantic.rebuild(recipes)
+            self._rows = lambda: recipes
+
+    def detach(self):
+        """Stop following the service (before the searcher is dropped)."""
+        self.lexical.detach()
+        self.semantic.detach()
+
+    def _semantic_top(self, query, n, candidates, accept=None):
+        from query_encoder import get_encoder
+        return self.semantic.top(get_encoder().encode(query), n, candidates, accept)
+
+    @staticmethod
+    def _shortlist(lexical, candidates, n, accept, entity_scores):
+        """Lexical hits plus the first `n` accepted candidates of the best entity groups."""
+        rows = {row for row, _ in lexical}
+        if entity_scores is None:
+            return rows
+        added = 0
+        for _, group in bound_groups(sorted(candidates), entity_scores):
+            for row in group.tolist():
+                if added >= n:
+                    return rows
+                if row not in rows and (accept is None or accept(row)):
+                    rows.add(row)
+                    added += 1
+        return rows
+
+    @staticmethod
+    def _timed(fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        return result, (time.perf_counter() - start) * 1000
+
+    @staticmethod
+    def _collect(futures, budgets, rankings, stats):
+        started = time.perf_counter()
+        for name, future in futures.items():
+            remaining = budgets[name] / 1000 - (time.perf_counter() - started)
+            try:
+                rankings[name], stats["stages"][name] = future.result(timeout=max(remaining, 0))
+            except TimeoutError:
+                stats["skipped"].append(name) # keeps running; its result is simply not used
+            except Exception as e:
+                print(f"⚠️ {name} retrieval failed: {e}")
+                stats["skipped"].append(name)
+
+    def search(self, query, top_k=20, user_entities=None, candidates=None, budgets_ms=None, weights=None,
+               accept=None, entity_scores=None, deadline=None):
+        """
+        Rank recipes for `query`. With `candidates` (row positions), only those rows are ranked and
+        rows no retriever found still compete on their entity boost. `accept(row)` filters the
+        candidates lazily. `entity_scores` (score_recipe for every row, see EntityIndex) replaces the
+        budgeted boost stage and lets candidates be skipped by group bound instead of scored one by one.
+        A `deadline` (see deadline.py) caps every stage budget and stops that candidate scan.
+        """
+        budgets = {**STAGE_BUDGETS_MS, **(budgets_ms or {})}
+        if deadline is not None:
+            budgets = deadline.cap(budgets)
+        weights = {**FUSION_WEIGHTS, **(weights or {})}
+        candidates = set(candidates) if candidates is not None else None
+        if accept is not None and candidates is not None and entity_scores is None:
+            candidates, accept = {row for row in candidates if accept(row)}, None # no bounds to prune with
+        depth = max(top_k * CANDIDATES_PER_RESULT, MIN_CANDIDATES)
+        stats = {"stages": {}, "skipped": []}
+
+        # 1. Candidate retrieval, in parallel (on large candidate sets the semantic retriever
+        #    waits for the lexical one and only scores a shortlist)
+        shortlist = candidates is not None and len(candidates) > SEMANTIC_FULL_SCAN
+        futures = {"lexical": _pool().submit(self._timed, self.lexical.top, query, depth, candidates, accept)}
+        semantic = self.semantic.ready()
+        if semantic and not shortlist:
+            futures["semantic"] = _pool().submit(self._timed, self._semantic_top, query, depth, candidates, accept)
+        elif not semantic:
+            self.semantic.warm_async()
+            stats["skipped"].append("semantic")
+
+        rankings = {}
+        self._collect(futures, budgets, rankings, stats)
+        if semantic and shortlist:
+            rows = self._shortlist(rankings.get("lexical", []), candidates, depth, accept, entity_scores)
+            future = _pool().submit(self._timed, self._semantic_top, query, depth, rows)
+            self._collect({"semantic": future}, budgets, rankings, stats)
+
+        # 2. Reciprocal rank fusion, normalised to [0, 1]
+        fused = defaultdict(float)
+        for name, ranked in rankings.items():
+            for rank, (row, _) in enumerate(ranked, 1):
+                fused[row] += weights.get(name, 1.0) / (RRF_K + rank)
+        best_possible = sum(weights.get(name, 1.0) for name in rankings) / (RRF_K + 1) or 1.0
+        scored = {row: score / best_possible for row, score in fused.items()}
+
+        # 3. Entity boosts and the top k
+        start = time.perf_counter()
+        top_entity_score = max_entity_score(user_entities or {})
+        top = TopK(top_k)
+        if entity_scores is not None:
+            scale = ENTITY_WEIGHT / top_entity_score if top_entity_score else 0.0
+            for row, score in scored.items():
+                top.push(score + scale * entity_scores[row], row, row)
+            if candidates is not None:
+                # Candidates no retriever found score exactly their entity boost
+                groups = bound_groups(sorted(candidates.difference(scored)), entity_scores, scale)
+                stats["pruning"] = scan_groups(top, groups, lambda row: (
+                    (scale * entity_scores[row], row) if accept is None or accept(row) else None),
+                    deadline, "rank")
+        else:
+            for row in candidates or ():
+                scored.setdefault(row, 0.0)
+            if top_entity_score:
+                recipes = self._rows()
+                boosts_until = start + budgets["boosts"] / 1000
+                for i, row in enumerate(sorted(scored, key=scored.get, reverse=True)):
+                    if i % 64 == 0 and time.perf_counter() > boosts_until:
+                        stats["skipped"].append("boosts")
+                        break
+                    boost = score_recipe(recipe_entities(recipes[row]), user_entities) / top_entity_score
+                    scored[row] += ENTITY_WEIGHT * boost
+            for row, score in scored.items():
+                top.push(score, row, row)
+        stats["stages"]["boosts"] = (time.perf_counter() - start) * 1000
+
+        return [(row, round(float(score) * SCORE_SCALE, 4)) for row, score in top.items()], stats
@@ -0,0 +1,231 @@
+"""
+Ingredient-level index for pantry queries ("what can I cook with these items?").
+
+Ingredient strings are normalized to canonical names ("2 cups chopped tomatoes" -> "tomato")
+and interned to integer ids. Each id has a posting bitmap over recipe rows. A pantry query
+adds the pantry's posting bitmaps into a bit-sliced counter, so "rows using >= k pantry items"
+is a handful of whole-catalog bitwise operations instead of a per-recipe loop.
+"""
+import math
+import re
+
+from recipe_index import DerivedIndex, bits_from_positions, drop_positions, iter_positions
+
+# ------------------------------
+# Normalization
+# ------------------------------
+UNITS = {
+    "cup", "cups", "tablespoon", "tablespoons", "tbsp", "teaspoon", "teaspoons", "tsp",
+    "g", "gram", "grams", "kg", "ml", "l", "liter", "litre", "oz", "ounce", "ounces",
+    "lb", "lbs", "pound", "pounds", "pinch", "dash", "clove", "cloves", "can", "cans",
+    "package", "packages", "slice", "slices", "piece", "pieces", "bunch", "sprig", "sprigs",
+    "quart", "pint", "stick", "sticks", "jar", "handful",
+}
+
+DESCRIPTORS = {
+    "chopped", "diced", "minced", "sliced", "grated", "shredded", "crushed", "ground",
+    "fresh", "freshly", "dried", "frozen", "large", "small", "medium", "finely", "roughly",
+    "peeled", "seeded", "boneless", "skinless", "cooked", "uncooked", "raw", "softened",
+    "melted", "beaten", "optional", "to", "taste", "divided", "packed", "and", "or", "of",
+    "a", "an", "the", "for", "into", "cut", "inch", "inches", "about", "plus", "more",
+}
+
+_QUANTITY = re.compile(r"[\d¼½¾⅓⅔⅛/.\-]+")
+_PARENS = re.compile(r"\([^)]*\)")
+_NON_WORD = re.compile(r"[^a-z\s]")
+_SPLIT = re.compile(r"\|\||[;\n]|,(?![^()]*\))")
+
+
+def singularize(word):
+    if len(word) <= 3 or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes") or word.endswith("ches") or word.endswith("shes"):
+        return word[:-2]
+    if word.endswith("ves"):
+        return word[:-3] + "f"
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def canonical_ingredient(text):
+    """'2 cups finely chopped Tomatoes (ripe)' -> 'tomato'. Returns '' when nothing is left."""
+    text = _PARENS.sub(" ", str(text).lower())
+    text = text.split(",")[0] # "onion, chopped" -> "onion"
+    text = _QUANTITY.sub(" ", text)
+    text = _NON_WORD.sub(" ", text)
+    words = [w for w in text.split() if w not in UNITS and w not in DESCRIPTORS]
+    return " ".join(singularize(w) for w in words)
+
+
+def split_ingredients(value):
+    """Accept the shapes the upstream uses: a list of strings / dicts, or a delimited string."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        items = []
+        for item in value:
+            if isinstance(item, dict):
+                item = item.get("ingredient") or item.get("name") or item.get("ingredient_name")
+            if item:
+                items.append(str(item))
+        return items
+    return [part for part in _SPLIT.split(str(value)) if part.strip()]
+
+
+# ------------------------------
+# Bit-sliced counting
+# ------------------------------
+def _add_to_counter(planes, bits):
+    """planes[i] holds bit i of every row's counter; add 1 to the rows in `bits`."""
+    carry = bits
+    for i in range(len(planes)):
+        if not carry:
+            return
+        planes[i], carry = planes[i] ^ carry, planes[i] & carry
+    if carry:
+        planes.append(carry)
+
+
+def _at_least(planes, k, rows):
+    """Rows (within `rows`) whose counter is >= k."""
+    if k <= 0:
+        return rows
+    greater, equal = 0, rows
+    for i in reversed(range(max(len(planes), k.bit_length()))):
+        plane = planes[i] if i < len(planes) else 0
+        if k >> i & 1:
+            equal &= plane
+        else:
+            greater |= equal & plane
+            equal ^= equal & plane
+    return greater | equal
+
+
+# ------------------------------
+# INGREDIENT INDEX
+# ------------------------------
+class IngredientIndex(DerivedIndex):
+    name = "ingredients"
+
+    def clear(self):
+        self.vocab = {} # canonical name -> id
+        self.names = [] # id -> canonical name
+        self.postings = [] # id -> bitmap of rows
+        self.row_ingredients = [] # row -> tuple of ids
+        self.by_count = {} # number of distinct ingredients -> bitmap of rows
+
+    def intern(self, name):
+        iid = self.vocab.get(name)
+        if iid is None:
+            iid = self.vocab[name] = len(self.names)
+            self.names.append(name)
+            self.postings.append(0)
+        return iid
+
+    def _row_ids(self, r):
+        ids = set()
+        for item in split_ingredients(r.get("ingredients")):
+            name = canonical_ingredient(item)
+            if name:
+                ids.add(self.intern(name))
+        return tuple(sorted(ids))
+
+    def add_rows(self, rows, start):
+        new_postings = {}
+        new_counts = {}
+        for i, r in enumerate(rows, start):
+            ids = self._row_ids(r)
+            self.row_ingredients.append(ids)
+            for iid in ids:
+                new_postings.setdefault(iid, []).append(i)
+            if ids:
+                new_counts.setdefault(len(ids), []).append(i)
+
+        for iid, positions in new_postings.items():
+            self.postings[iid] |= bits_from_positions(positions)
+        for n, positions in new_counts.items():
+            self.by_count[n] = self.by_count.get(n, 0) | bits_from_positions(positions)
+
+    def fingerprint(self):
+        # Ids follow first use, which edits change; compare by name (edits can leave unused names)
+        return {name: bits for name, bits in zip(self.names, self.postings) if bits}, self.by_count
+
+    def update_rows(self, positions, old_rows, new_rows):
+        for p, row in zip(positions, new_rows):
+            bit = 1 << p
+            old, ids = self.row_ingredients[p], self._row_ids(row)
+            for iid in old:
+                self.postings[iid] &= ~bit
+            if old:
+                self.by_count[len(old)] &= ~bit
+                if not self.by_count[len(old)]:
+                    del self.by_count[len(old)]
+            for iid in ids:
+                self.postings[iid] |= bit
+            if ids:
+                self.by_count[len(ids)] = self.by_count.get(len(ids), 0) | bit
+            self.row_ingredients[p] = ids
+
+    def remove_rows(self, positions, old_rows):
+        self.postings = [drop_positions(bits, positions) for bits in self.postings]
+        self.by_count = {n: bits for n, bits in
+                         ((n, drop_positions(bits, positions)) for n, bits in self.by_count.items()) if bits}
+        gone = set(positions)
+        self.row_ingredients = [ids for i, ids in enumerate(self.row_ingredients) if i not in gone]
+
+    # ------------------------------
+    # Pantry queries
+    # ------------------------------
+    def resolve(self, items):
+        """Canonical ids for pantry items (unknown items are dropped)."""
+        ids = set()
+        for item in items:
+            iid = self.vocab.get(canonical_ingredient(item))
+            if iid is not None:
+                ids.add(iid)
+        return ids
+
+    def with_ingredient(self, item):
+        iid = self.vocab.get(canonical_ingredient(item))
+        return self.postings[iid] if iid is not None else 0
+
+    def pantry_bits(self, pantry_ids, min_coverage=0.8, candidates=None):
+        """
+        Bitmap of rows where at least `min_coverage` of the recipe's ingredients are in the pantry.
+        `candidates` (a bitmap, e.g. a diet filter) restricts the search.
+        """
+        planes = []
+        for iid in pantry_ids:
+            _add_to_counter(planes, self.postings[iid])
+
+        result = 0
+        for n, rows in self.by_count.items():
+            if candidates is not None:
+                rows &= candidates
+            if rows:
+                result |= _at_least(planes, math.ceil(min_coverage * n - 1e-9), rows)
+        return result
+
+    def pantry_matches(self, recipes, items, min_coverage=0.8, top_k=20, candidates=None):
+        """Recipes ranked by coverage (then fewest missing ingredients), with what is missing."""
+        pantry_ids = self.resolve(items)
+        bits = self.pantry_bits(pantry_ids, min_coverage, candidates)
+
+        scored = []
+        for pos in iter_positions(bits):
+            ids = self.row_ingredients[pos]
+            missing = [iid for iid in ids if iid not in pantry_ids]
+            scored.append((len(missing) / len(ids), len(missing), pos, missing))
+        scored.sort()
+
+        return [
+            {
+                "recipe": recipes[pos],
+                "coverage": round(1 - missing_share, 3),
+                "missing": [self.names[iid] for iid in missing],
+            }
+            for missing_share, _, pos, missing in scored[:top_k]
+        ]
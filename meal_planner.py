@@ -0,0 +1,284 @@
+import bisect
+import heapq
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Share of daily calories per meal, by meals per day
+MEAL_SPLITS = {
+    2: {"Lunch": 0.50, "Dinner": 0.50},
+    3: {"Breakfast": 0.30, "Lunch": 0.40, "Dinner": 0.30},
+    4: {"Breakfast": 0.25, "Lunch": 0.35, "Snack": 0.10, "Dinner": 0.30},
+    5: {"Breakfast": 0.25, "Morning Snack": 0.10, "Lunch": 0.30, "Afternoon Snack": 0.10, "Dinner": 0.25},
+}
+
+FOCUS_OPTIONS = ["Balanced", "High Protein", "Low Calorie"]
+
+LOW_CALORIE_FACTOR = 0.8 # "Low Calorie" aims this fraction of the calorie targets
+PROTEIN_WINDOW = 8 # "High Protein" picks the best protein among this many calorie-nearest recipes
+PROTEIN_TOLERANCE = 0.15 # ...as long as calories stay within this fraction of the target
+
+
+def _num(value):
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if f != f else f
+
+
+def day_labels(days):
+    """Monday..Sunday for the first week, then "Monday (Week 2)" and so on."""
+    labels = []
+    for i in range(days):
+        name = WEEKDAYS[i % 7]
+        week = i // 7 + 1
+        labels.append(name if week == 1 else f"{name} (Week {week})")
+    return labels
+
+
+# ------------------------------
+# AVAILABILITY TREE
+# ------------------------------
+class _Availability:
+    """
+    Segment tree of counts over calorie-sorted pool positions.
+    set() and nearest-available lookups (next_at / prev_at) are O(log N).
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.size = 1
+        while self.size < max(n, 1):
+            self.size *= 2
+        self.fill()
+
+    def fill(self):
+        tree = [0] * (2 * self.size)
+        for i in range(self.n):
+            tree[self.size + i] = 1
+        for i in range(self.size - 1, 0, -1):
+            tree[i] = tree[2 * i] + tree[2 * i + 1]
+        self.tree = tree
+
+    def __len__(self):
+        return self.tree[1]
+
+    def set(self, i, available):
+        pos = self.size + i
+        value = 1 if available else 0
+        if self.tree[pos] == value:
+            return
+        delta = value - self.tree[pos]
+        while pos:
+            self.tree[pos] += delta
+            pos //= 2
+
+    def next_at(self, i):
+        """First available position >= i, or None."""
+        if i >= self.n:
+            return None
+        tree = self.tree
+        pos = self.size + max(i, 0)
+        if tree[pos]:
+            return pos - self.size
+        while pos > 1:
+            if pos % 2 == 0 and tree[pos + 1]:
+                pos += 1
+                break
+            pos //= 2
+        else:
+            return None
+        while pos < self.size:
+            pos = 2 * pos if tree[2 * pos] else 2 * pos + 1
+        return pos - self.size
+
+    def prev_at(self, i):
+        """Last available position <= i, or None."""
+        if i < 0:
+            return None
+        tree = self.tree
+        pos = self.size + min(i, self.n - 1)
+        if tree[pos]:
+            return pos - self.size
+        while pos > 1:
+            if pos % 2 == 1 and tree[pos - 1]:
+                pos -= 1
+                break
+            pos //= 2
+        else:
+            return None
+        while pos < self.size:
+            pos = 2 * pos + 1 if tree[2 * pos + 1] else 2 * pos
+        return pos - self.size
+
+
+# ------------------------------
+# PLAN STATE (shared by every member of a household plan)
+# ------------------------------
+class PlanState:
+    """
+    Which pool positions may be picked on the current day.
+    With repeat_gap_days=None a recipe is not reused until the pool is exhausted (then everything resets).
+    With repeat_gap_days=g a recipe used on day d is blocked until day d + g; the cooldown heap
+    releases it. If no recipe is free, the one closest to release is reused early (counted in stats).
+    """
+
+    def __init__(self, pool_size, repeat_gap_days=None):
+        self.available = _Availability(pool_size)
+        self.repeat_gap_days = repeat_gap_days
+        self.cooldown = [] # (release_day, position)
+        self.stats = {"pool_resets": 0, "early_repeats": 0}
+
+    def start_day(self, day_index):
+        while self.cooldown and self.cooldown[0][0] <= day_index:
+            _, pos = heapq.heappop(self.cooldown)
+            self.available.set(pos, True)
+
+    def take(self, pos, day_index):
+        self.available.set(pos, False)
+        if self.repeat_gap_days:
+            heapq.heappush(self.cooldown, (day_index + self.repeat_gap_days, pos))
+
+    def replenish(self):
+        """Called when nothing is available for a slot."""
+        if not self.repeat_gap_days:
+            # If we ran out of recipes, reset the used set for diversity
+            self.available.fill()
+            self.cooldown.clear()
+            self.stats["pool_resets"] += 1
+        elif self.cooldown:
+            _, pos = heapq.heappop(self.cooldown)
+            self.available.set(pos, True)
+            self.stats["early_repeats"] += 1
+
+
+# ------------------------------
+# PLANNING ENGINE
+# ------------------------------
+class MealPlanner:
+    """
+    Picks one recipe per (day, member, meal) slot from a candidate pool.
+    The pool is sorted by calories once; each slot is a bisect to its calorie target plus
+    nearest-available lookups in an availability tree, so a plan costs O(slots log N).
+    """
+
+    def __init__(self, pool):
+        order = sorted(range(len(pool)), key=lambda i: _num(pool[i].get("Calories")))
+        self.recipes = [pool[i] for i in order]
+        self.calories = [_num(r.get("Calories")) for r in self.recipes]
+        self.protein = [_num(r.get("Protein (g)")) for r in self.recipes]
+        self.last_stats = {}
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def extended(self, rows):
+        """A new planner over this pool plus `rows` (which come after it, as appended recipes do)."""
+        extra = MealPlanner(rows)
+        recipes, calories, protein = (self.recipes + extra.recipes, self.calories + extra.calories,
+                                      self.protein + extra.protein)
+        # Stable merge: on equal calories this pool's recipes stay first, as in a full sort
+        order = list(heapq.merge(range(len(self)), range(len(self), len(recipes)), key=calories.__getitem__))
+        planner = MealPlanner([])
+        planner.recipes = [recipes[i] for i in order]
+        planner.calories = [calories[i] for i in order]
+        planner.protein = [protein[i] for i in order]
+        return planner
+
+    # ------------------------------
+    # Candidate search around a calorie target
+    # ------------------------------
+    def _nearest_available(self, target, available, count=1):
+        """Up to `count` available positions, nearest in calories to `target` first."""
+        at = bisect.bisect_left(self.calories, target)
+        left = available.prev_at(at - 1)
+        right = available.next_at(at)
+        found = []
+
+        while len(found) < count and (left is not None or right is not None):
+            take_left = right is None or (
+                left is not None and target - self.calories[left] <= self.calories[right] - target)
+            if take_left:
+                found.append(left)
+                left = available.prev_at(left - 1)
+            else:
+                found.append(right)
+                right = available.next_at(right + 1)
+        return found
+
+    def pick(self, target, available, focus="Balanced"):
+        """Position of the best available recipe for one slot (None if nothing is available)."""
+        if focus == "High Protein":
+            candidates = self._nearest_available(target, available, PROTEIN_WINDOW)
+            if not candidates:
+                return None
+            tolerance = max(target * PROTEIN_TOLERANCE, 1.0)
+            close = [p for p in candidates if abs(self.calories[p] - target) <= tolerance]
+            return max(close or candidates[:1], key=lambda p: self.protein[p])
+
+        candidates = self._nearest_available(target, available, 1)
+        return candidates[0] if candidates else None
+
+    # ------------------------------
+    # Full plan
+    # ------------------------------
+    def plan(self, daily_calories, days=7, meals_per_day=3, focus="Balanced", meal_split=None,
+             repeat_gap_days=None):
+        """
+        Returns {day_label: {meal_name: recipe}}.
+        Recipes are not repeated until the pool is exhausted (or within `repeat_gap_days` days, if given).
+        """
+        return dict(self.iter_days(daily_calories, days, meals_per_day, focus, meal_split, repeat_gap_days))
+
+    def iter_days(self, daily_calories, days=7, meals_per_day=3, focus="Balanced", meal_split=None,
+                  repeat_gap_days=None):
+        """Yield (day_label, {meal_name: recipe}) as soon as each day is chosen."""
+        member = {"daily_calories": daily_calories, "meals_per_day": meals_per_day,
+                  "focus": focus, "meal_split": meal_split}
+        for day, members in self.iter_household({"_": member}, days, repeat_gap_days):
+            yield day, members["_"]
+
+    def iter_household(self, members, days=7, repeat_gap_days=None):
+        """
+        Plan several people at once under one global no-repeat constraint.
+        `members` maps a name to {daily_calories, meals_per_day, focus, meal_split}.
+        Yields (day_label, {name: {meal_name: recipe}}).
+        """
+        targets = {name: self._targets(**m) for name, m in members.items()}
+        if not self.recipes:
+            return
+
+        state = PlanState(len(self.recipes), repeat_gap_days)
+        self.last_stats = state.stats
+
+        for day_index, day in enumerate(day_labels(days)):
+            state.start_day(day_index)
+            planned = {}
+            for name, (meal_targets, focus) in targets.items():
+                meals = {}
+                for meal, target in meal_targets.items():
+                    pos = self.pick(target, state.available, focus)
+                    if pos is None:
+                        state.replenish()
+                        pos = self.pick(target, state.available, focus)
+
+                    meals[meal] = self.recipes[pos]
+                    state.take(pos, day_index)
+                planned[name] = meals
+
+            yield day, planned
+
+    @staticmethod
+    def _targets(daily_calories, meals_per_day=3, focus="Balanced", meal_split=None):
+        if focus not in FOCUS_OPTIONS:
+            raise ValueError(f"Unknown focus '{focus}'. Expected one of: {', '.join(FOCUS_OPTIONS)}")
+        split = meal_split or MEAL_SPLITS.get(meals_per_day)
+        if not split:
+            raise ValueError(f"meals_per_day must be one of {sorted(MEAL_SPLITS)}")
+
+        scale = LOW_CALORIE_FACTOR if focus == "Low Calorie" else 1.0
+        return {meal: daily_calories * share * scale for meal, share in split.items()}, focus
@@ -0,0 +1,213 @@
+"""
+Local stand-in for the upstream recipe API, for exercising delta sync without the network.
+
+    python mock_upstream.py --n 200 --port 8765 --mutate-every 5
+    FOODOSCOPE_API_URL=http://127.0.0.1:8765/recipe2-api/recipe/recipesinfo uvicorn api:app
+
+Serves `?page=&limit=` pages in the upstream's {"payload": {"data": [...]}} shape, with an ETag
+per page that honours If-None-Match. The catalog can be edited while it runs (update / delete /
+add), from code or on a timer, so revalidation has something to find.
+
+Faults can be injected to exercise the circuit breaker: a fixed `latency` per request, an
+`error_rate` of random 503s, or `fail_next(n)` for the next n requests.
+
+    python mock_upstream.py --latency 2 --error-rate 0.5
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from recipe_service import page_hash
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+API_PATH = "/recipe2-api/recipe/recipesinfo"
+
+
+# ------------------------------
+# MOCK UPSTREAM
+# ------------------------------
+class MockUpstream:
+    def __init__(self, recipes, host="127.0.0.1", port=0, etags=True, latency=0.0, error_rate=0.0,
+                 error_status=503, seed=0):
+        self.recipes = [dict(r) for r in recipes]
+        self.etags = etags # False mimics an upstream without conditional requests
+        self.latency = latency # seconds added to every response
+        self.error_rate = error_rate # share of requests answered with error_status
+        self.error_status = error_status
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "errors": 0}
+        self._rng = random.Random(seed)
+        self._fail_next = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{API_PATH}"
+
+    # ------------------------------
+    # Mutations
+    # ------------------------------
+    def update(self, recipe_id, **fields):
+        with self.lock:
+            for r in self.recipes:
+                if r.get("_id") == recipe_id:
+                    r.update(fields)
+                    return r
+        raise KeyError(recipe_id)
+
+    def delete(self, recipe_id):
+        with self.lock:
+            self.recipes = [r for r in self.recipes if r.get("_id") != recipe_id]
+
+    def add(self, recipe):
+        with self.lock:
+            self.recipes.append(dict(recipe))
+
+    def page(self, page, limit):
+        with self.lock:
+            return [dict(r) for r in self.recipes[(page - 1) * limit:page * limit]]
+
+    # ------------------------------
+    # Fault injection
+    # ------------------------------
+    def fail_next(self, count):
+        """Answer the next `count` requests with error_status."""
+        with self.lock:
+            self._fail_next = count
+
+    def _should_fail(self):
+        with self.lock:
+            if self._fail_next > 0:
+                self._fail_next -= 1
+                return True
+            return self._rng.random() < self.error_rate
+
+    # ------------------------------
+    # HTTP
+    # ------------------------------
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != API_PATH:
+                    self.send_error(404)
+                    return
+
+                with upstream.lock:
+                    upstream.stats["requests"] += 1
+                if upstream.latency:
+                    time.sleep(upstream.latency)
+                if upstream._should_fail():
+                    with upstream.lock:
+                        upstream.stats["errors"] += 1
+                    self.send_error(upstream.error_status)
+                    return
+
+                query = parse_qs(url.query)
+                page = max(int(query.get("page", ["1"])[0]), 1)
+                limit = max(int(query.get("limit", ["20"])[0]), 1)
+                data = upstream.page(page, limit)
+                etag = f'"{page_hash(data)}"'
+
+                if upstream.etags and self.headers.get("If-None-Match") == etag:
+                    with upstream.lock:
+                        upstream.stats["not_modified"] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                body = json.dumps({"payload": {"data": data}}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if upstream.etags:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # keep test output quiet
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def random_mutation(upstream, rng, next_id):
+    """Edit, delete or add one recipe; returns a short description."""
+    action = rng.choice(["update", "update", "delete", "add"])
+    if action == "add" or not upstream.recipes:
+        from benchmarks import synthetic_recipes
+        upstream.add(next(synthetic_recipes(1, start=next_id)))
+        return f"added recipe {next_id}"
+
+    target = rng.choice(upstream.recipes)["_id"]
+    if action == "delete":
+        upstream.delete(target)
+        return f"deleted {target}"
+    upstream.update(target, Calories=f"{rng.uniform(50, 1200):.1f}")
+    return f"updated {target}"
+
+
+# ------------------------------
+# CLI
+# ------------------------------
+def main(argv=None):
+    from benchmarks import synthetic_recipes
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=200, help="Synthetic recipes to serve")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mutate-every", type=float, default=0, metavar="SECONDS",
+                        help="Apply a random edit / delete / add at this interval")
+    parser.add_argument("--no-etags", action="store_true", help="Do not support conditional requests")
+    parser.add_argument("--latency", type=float, default=0, metavar="SECONDS", help="Delay every response")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of requests answered with a 503")
+    args = parser.parse_args(argv)
+
+    upstream = MockUpstream(synthetic_recipes(args.n), port=args.port, etags=not args.no_etags,
+                            latency=args.latency, error_rate=args.error_rate).start()
+    print(f"🧪 Mock upstream serving {args.n} recipes at {upstream.url}")
+
+    rng = random.Random(0)
+    next_id = args.n
+    try:
+        while True:
+            if args.mutate_every:
+                time.sleep(args.mutate_every)
+                print(f"   ✏️ {random_mutation(upstream, rng, next_id)}")
+                next_id += 1
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        upstream.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
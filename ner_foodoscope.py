@@ -1,6 +1,6 @@
+import os
 import re
 import json
-import pandas as pd
 from collections import defaultdict, Counter
 import warnings
 warnings.filterwarnings('ignore')
@@ -33,6 +33,26 @@ SUPPORTED_METHODS = [
 
 AVOID_METHODS_KEYWORDS = ["fried", "deep fried", "deep-fried"]
 
+# Equipment / technique vocab for the Utensils and Processes columns.
+# Multi-word utensils are indexed by their last word ("air fryer" -> "fryer").
+SUPPORTED_UTENSILS = [
+    "oven", "skillet", "saucepan", "pan", "pot", "stockpot", "wok", "grill", "griddle",
+    "microwave", "blender", "food processor", "mixer", "slow cooker", "pressure cooker",
+    "fryer", "air fryer", "deep fryer", "steamer", "baking sheet", "baking dish",
+    "casserole", "toaster", "bowl", "whisk", "skewer"
+]
+
+SUPPORTED_PROCESSES = [
+    "stir", "simmer", "boil", "bake", "roast", "fry", "stir-fry", "pan-fry", "deep-fry",
+    "grill", "steam", "saute", "blend", "mix", "whisk", "toss", "poach", "broil",
+    "marinate", "knead", "puree", "grind", "toast", "melt", "chill", "refrigerate", "soak"
+]
+
+UTENSIL_TOKENS = sorted({u.split()[-1] for u in SUPPORTED_UTENSILS})
+
+# Prebuilt NER results written by `python preflight.py warmup`
+NER_DATASET_ARTIFACT = os.path.join("artifacts", "ner_recipes.json")
+
 
 # ---------------------------------------------------
 # Protein Range Mapper
@@ -98,6 +118,59 @@ def extract_protein_goal(text: str):
     return None
 
 
+# ---------------------------------------------------
+# Equipment / technique constraints
+# ---------------------------------------------------
+def base_form(word: str, known):
+    """Map an inflected word onto `known` ("stirring" -> "stir", "fried" -> "fry"); unchanged if no match."""
+    word = word.lower().strip()
+    if word in known:
+        return word
+
+    for suffix, replacement in (("ying", "y"), ("ied", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) > len(suffix) + 1:
+            stem = word[:-len(suffix)] + replacement
+            for candidate in (stem, stem + "e", stem[:-1] if stem[-1] == stem[-2] else None):
+                if candidate and candidate in known:
+                    return candidate
+    return word
+
+
+_UTENSIL_PATTERN = "|".join(re.escape(u) for u in sorted(SUPPORTED_UTENSILS, key=len, reverse=True))
+_ARTICLE = r"(?:an?\s+|the\s+|my\s+)?"
+_PROCESS_LIST = r"[a-z\-]+(?:\s*(?:/|,|&|\band\b|\bor\b)\s*[a-z\-]+)*"
+# "in" / "with" only count after a cooking verb ("baked in a casserole", not "served in a bowl")
+_USE_VERB = r"(?:must use|use|using|(?:cook(?:ed)?|made|bak(?:e|ed)|prepared?|fr(?:y|ied))\s+(?:in|with))"
+# A plural "s" at most and no hyphen after the utensil ("no pan-fried food" does not rule out pans)
+_UTENSIL_END = r"s?(?![-\w])"
+
+
+def extract_equipment_constraints(text: str):
+    """
+    "must use oven" -> UTENSIL_REQUIRE ["oven"], "no fryer" -> UTENSIL_AVOID ["fryer"],
+    "only stir/simmer" -> PROCESS_ONLY ["stir", "simmer"]. Values are index tokens.
+    """
+    lower = (text or "").lower()
+
+    avoid = re.findall(rf"\b(?:no|without|avoid(?:ing)?|not using)\s+{_ARTICLE}({_UTENSIL_PATTERN}){_UTENSIL_END}", lower)
+    require = re.findall(rf"\b{_USE_VERB}\s+{_ARTICLE}({_UTENSIL_PATTERN}){_UTENSIL_END}", lower)
+    avoid = sorted({u.split()[-1] for u in avoid})
+    require = sorted({u.split()[-1] for u in require} - set(avoid))
+
+    only = []
+    for match in re.finditer(rf"\bonly\s+({_PROCESS_LIST})", lower):
+        for word in re.split(r"\s*(?:/|,|&|\band\b|\bor\b)\s*", match.group(1)):
+            process = base_form(word, SUPPORTED_PROCESSES) if word else ""
+            if process in SUPPORTED_PROCESSES and process not in only:
+                only.append(process)
+
+    return {
+        "UTENSIL_REQUIRE": require,
+        "UTENSIL_AVOID": avoid,
+        "PROCESS_ONLY": only
+    }
+
+
 # ---------------------------------------------------
 # Rule-based keyword extraction
 # ---------------------------------------------------
@@ -110,7 +183,10 @@ def rule_based_ner(text: str):
             "METHOD_PREFERENCE": [],
             "METHOD_AVOID": [],
             "PROTEIN_GOAL": None,
-            "CALORIE_LIMIT": None
+            "CALORIE_LIMIT": None,
+            "UTENSIL_REQUIRE": [],
+            "UTENSIL_AVOID": [],
+            "PROCESS_ONLY": []
         }
     
     lower = text.lower()
@@ -134,17 +210,29 @@ def rule_based_ner(text: str):
         "METHOD_PREFERENCE": methods_pref,
         "METHOD_AVOID": avoid_methods,
         "PROTEIN_GOAL": protein_goal,
-        "CALORIE_LIMIT": calorie_limit
+        "CALORIE_LIMIT": calorie_limit,
+        **extract_equipment_constraints(text)
     }
 
 
 # ---------------------------------------------------
 # spaCy Transformer NER (optional - requires spacy)
 # ---------------------------------------------------
+_SPACY_NLP = None
+
+
+def _load_spacy():
+    # spaCy is imported and its model loaded once, on first use
+    global _SPACY_NLP
+    if _SPACY_NLP is None:
+        import spacy
+        _SPACY_NLP = spacy.load("en_core_web_sm")
+    return _SPACY_NLP
+
+
 def spacy_ner(text: str):
     try:
-        import spacy
-        nlp = spacy.load("en_core_web_sm")
+        nlp = _load_spacy()
         doc = nlp(text)
         return [(ent.text, ent.label_) for ent in doc.ents]
     except Exception as e:
@@ -236,6 +324,9 @@ def consolidate_entities(rule_out, spacy_out, raw_text):
 
     final["METHOD_AVOID"] = avoid
 
+    # equipment / technique constraints are rule based too
+    final.update(extract_equipment_constraints(raw_text))
+
     return final
 
 
@@ -251,6 +342,9 @@ def build_recipedb_params(entities: dict):
         "exclude_methods": entities.get("METHOD_AVOID", []),
         "protein_goal": entities.get("PROTEIN_GOAL"),
         "calorie_limit": entities.get("CALORIE_LIMIT"),
+        "utensils": entities.get("UTENSIL_REQUIRE", []),
+        "exclude_utensils": entities.get("UTENSIL_AVOID", []),
+        "only_processes": entities.get("PROCESS_ONLY", []),
     }
 
     return params
@@ -282,6 +376,7 @@ def run_full_ner_pipeline(user_text: str):
 # ---------------------------------------------------
 def process_recipe_dataset(csv_path):
     """Process foodoscope recipes CSV and extract entities from recipe fields"""
+    import pandas as pd
     
     df = pd.read_csv(csv_path)
     results = []
@@ -302,6 +397,7 @@ def process_recipe_dataset(csv_path):
             'Calories': row.get('Calories'),
             'Protein (g)': row.get('Protein (g)'),
             'Processes': row.get('Processes'),
+            'Utensils': row.get('Utensils'),
             'NER_ENTITIES': ner_result['FINAL_ENTITIES'],
             'QUERY_PARAMS': ner_result['QUERY_PARAMS']
         })
@@ -309,6 +405,21 @@ def process_recipe_dataset(csv_path):
     return pd.DataFrame(results)
 
 
+# ---------------------------------------------------
+# Load prebuilt results (see `python preflight.py warmup`)
+# ---------------------------------------------------
+def load_processed_dataset(csv_path, artifact_json=None):
+    """Load NER results from a prebuilt JSON artifact if it is newer than the CSV, else process the CSV"""
+    if artifact_json and os.path.exists(artifact_json) \
+            and os.path.getmtime(artifact_json) >= os.path.getmtime(csv_path):
+        import pandas as pd
+        df = pd.read_json(artifact_json, orient='records')
+        if 'Utensils' in df.columns: # artifacts from before the Utensils column are rebuilt
+            return df
+
+    return process_recipe_dataset(csv_path)
+
+
 # ---------------------------------------------------
 # Save results
 # ---------------------------------------------------
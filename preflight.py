@@ -0,0 +1,334 @@
+"""
+Preflight tooling for container images.
+
+    python preflight.py warmup          # prebuild every model / index artifact into ./artifacts
+    python preflight.py check-startup   # fail if module import times exceed their budgets
+    python preflight.py check-ner       # fail if query parsing regresses on EQUIPMENT_CASES
+    python preflight.py check-api       # fail if the API rejects what the frontends send (API_CASES)
+    python preflight.py check-search    # fail if matching / autocomplete regress (SEARCH_CASES, SUGGEST_CASES)
+
+`check-startup` runs each module under `python -X importtime` in a fresh interpreter
+and compares the cumulative import time against IMPORT_BUDGETS_MS.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from ner_foodoscope import NER_DATASET_ARTIFACT
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+DATASET_CSV = os.path.join("Datasets", "foodoscope_recipes.csv")
+
+# Cumulative import-time budgets (milliseconds) for a cold interpreter.
+# Heavy dependencies (torch, sentence-transformers, pandas, spaCy) must stay out of these paths.
+IMPORT_BUDGETS_MS = {
+    "query_encoder": 50,
+    "recipe_service": 100,
+    "recipe_finder": 100,
+    "ner_foodoscope": 100,
+    "api": 800,
+}
+
+IMPORT_REPEATS = 3
+
+# Query -> expected extract_equipment_constraints() output (these become hard search filters)
+EQUIPMENT_CASES = [
+    ("must use oven", {"UTENSIL_REQUIRE": ["oven"]}),
+    ("no air fryer, only stir/simmer", {"UTENSIL_AVOID": ["fryer"], "PROCESS_ONLY": ["stir", "simmer"]}),
+    ("baked in a casserole", {"UTENSIL_REQUIRE": ["casserole"]}),
+    ("without pans", {"UTENSIL_AVOID": ["pan"]}),
+    ("no pan-fried food", {}),
+    ("avoid pan-fried dishes", {}),
+    ("served in a bowl", {}),
+    ("Grilled chicken with grill marks", {}),
+]
+
+# Requests the frontends send -> expected status (served from the local recipe cache)
+FRONTEND_DIET_TYPES = ["no_preference", "vegan", "vegetarian", "pescetarian", "non_veg"] # App.jsx options
+API_CASES = [
+    *(("POST", "/generate-diet-plan", {"daily_calories": 2000, "diet_type": d}, 200) for d in FRONTEND_DIET_TYPES),
+    ("POST", "/generate-diet-plan", {"daily_calories": 2000, "diet_type": "keto"}, 422),
+]
+
+# A tiny catalog for find_matching_recipes(); rows without Processes tokens fall back to NER labels
+SEARCH_ROWS = [
+    {"Recipe_title": "Fried Plantains", "Processes": "", "NER_ENTITIES": {"METHOD_PREFERENCE": ["Fried"]}},
+    {"Recipe_title": "Pan-Fried Fish", "Processes": "heat||pan-fry", "NER_ENTITIES": {"METHOD_PREFERENCE": ["Fried"]}},
+    {"Recipe_title": "Baked Squash", "Processes": "preheat||bake", "NER_ENTITIES": {"METHOD_PREFERENCE": ["Baked"]}},
+    {"Recipe_title": "Steamed Rice", "Processes": "", "NER_ENTITIES": {"METHOD_PREFERENCE": ["Steamed"]}},
+]
+# User entities -> expected matching titles (any order)
+SEARCH_CASES = [
+    ({"METHOD_AVOID": ["Fried", "Deep-fried"]}, {"Baked Squash", "Steamed Rice"}),
+    ({"UTENSIL_AVOID": ["fryer"]}, {"Fried Plantains", "Pan-Fried Fish", "Baked Squash", "Steamed Rice"}),
+]
+
+# Autocomplete over these titles: typed text -> expected first suggestion
+SUGGEST_TITLES = ["Chin Chin", "Dersa (Algerian Chile Paste)", "Harissa Chicken", "Chicken Curry",
+                  "Roast Chicken", "Moroccan Shepherd's Pie", "Pierogi"]
+SUGGEST_CASES = [
+    ("chik", "Harissa Chicken"), # a typo: most used word first, not the closest in length ("chin")
+    ("chi", "Harissa Chicken"),
+    ("pie", "Moroccan Shepherd's Pie"),
+    ("roast chic", "Roast Chicken"),
+]
+
+
+# ------------------------------
+# Startup budget check
+# ------------------------------
+def measure_import_ms(module, repeats=IMPORT_REPEATS):
+    """Best-of-N cumulative import time of `module` in a fresh interpreter (milliseconds)."""
+    best = None
+    for _ in range(repeats):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+        cumulative_us = None
+        for line in proc.stderr.splitlines():
+            # "import time:   self [us] | cumulative | imported package"
+            if not line.startswith("import time:"):
+                continue
+            parts = line[len("import time:"):].split("|")
+            if len(parts) == 3 and parts[2].strip() == module:
+                cumulative_us = int(parts[1])
+
+        if cumulative_us is None:
+            raise RuntimeError(f"No importtime entry for {module}")
+
+        ms = cumulative_us / 1000.0
+        best = ms if best is None else min(best, ms)
+    return best
+
+
+def check_startup(budgets=None):
+    budgets = budgets or IMPORT_BUDGETS_MS
+    failures = []
+    for module, budget in budgets.items():
+        try:
+            ms = measure_import_ms(module)
+        except RuntimeError as e:
+            print(f"   ⚠️ {module}: {e}")
+            failures.append(module)
+            continue
+
+        ok = ms <= budget
+        print(f"   {'✅' if ok else '❌'} {module:<16} {ms:8.1f} ms  (budget {budget} ms)")
+        if not ok:
+            failures.append(module)
+    return failures
+
+
+# ------------------------------
+# Query parsing regression check
+# ------------------------------
+def check_ner(cases=None):
+    from ner_foodoscope import extract_equipment_constraints
+
+    failures = []
+    for text, expected in cases or EQUIPMENT_CASES:
+        got = extract_equipment_constraints(text)
+        want = {key: expected.get(key, []) for key in got}
+        ok = got == want
+        print(f"   {'✅' if ok else '❌'} {text!r}" + ("" if ok else f": got {got}, expected {want}"))
+        if not ok:
+            failures.append(text)
+    return failures
+
+
+# ------------------------------
+# Recipe matching regression check
+# ------------------------------
+def check_search(rows=None, cases=None):
+    import pandas as pd
+    from recipe_finder import find_matching_recipes
+
+    df = pd.DataFrame(rows or SEARCH_ROWS)
+    failures = []
+    for entities, expected in cases or SEARCH_CASES:
+        got = {m["Recipe_title"] for m in find_matching_recipes(df, entities)}
+        ok = got == expected
+        detail = "" if ok else f": got {sorted(got)}, expected {sorted(expected)}"
+        print(f"   {'✅' if ok else '❌'} {entities}{detail}")
+        if not ok:
+            failures.append(json.dumps(entities))
+
+    from trigram_index import TrigramIndex
+    titles = SUGGEST_TITLES
+    trigrams = TrigramIndex()
+    trigrams.rebuild([{"Recipe_title": title} for title in titles])
+    for text, expected in SUGGEST_CASES:
+        got = [titles[row] for row in trigrams.suggest_rows(text, 3)]
+        ok = got[:1] == [expected]
+        detail = "" if ok else f": got {got}, expected {expected!r} first"
+        print(f"   {'✅' if ok else '❌'} suggest {text!r}{detail}")
+        if not ok:
+            failures.append(text)
+    return failures
+
+
+# ------------------------------
+# API contract check
+# ------------------------------
+def check_api(cases=None):
+    from fastapi.testclient import TestClient
+    from api import app
+
+    client = TestClient(app) # no startup sync: requests are served from the local cache
+    failures = []
+    for method, path, payload, expected in cases or API_CASES:
+        status = client.request(method, path, json=payload).status_code
+        ok = status == expected
+        label = f"{method} {path} {json.dumps(payload)}"
+        print(f"   {'✅' if ok else '❌'} {label}" + ("" if ok else f": got {status}, expected {expected}"))
+        if not ok:
+            failures.append(label)
+    return failures
+
+
+# ------------------------------
+# Warm-up steps (each returns a short summary string)
+# ------------------------------
+def warm_recipe_cache():
+    from recipe_service import RecipeService
+    service = RecipeService()
+    return f"{len(service.recipes)} cached recipes"
+
+
+def warm_model(export_onnx=False):
+    from query_encoder import MODEL_DIR, MODEL_NAME, get_encoder
+    if export_onnx and not os.path.isdir(MODEL_DIR):
+        from sentence_transformers import SentenceTransformer
+        SentenceTransformer(MODEL_NAME, backend="onnx").save(MODEL_DIR)
+    get_encoder().encode("warm up")
+    return "encoder loaded"
+
+
+def warm_ner_dataset():
+    from ner_foodoscope import process_recipe_dataset, save_ner_results
+    df = process_recipe_dataset(DATASET_CSV)
+    os.makedirs(os.path.dirname(NER_DATASET_ARTIFACT), exist_ok=True)
+    csv_out = os.path.splitext(NER_DATASET_ARTIFACT)[0] + ".csv"
+    save_ner_results(df, csv_out, NER_DATASET_ARTIFACT)
+    return f"{len(df)} NER rows"
+
+
+def warm_title_embeddings():
+    import csv
+    from recipe_finder import TITLE_EMBEDDINGS_FILE, save_title_embeddings, title_embeddings
+    from recipe_service import RecipeService
+
+    titles = [r.get("Recipe_title") for r in RecipeService().recipes]
+    with open(DATASET_CSV, encoding="utf-8") as f:
+        titles += [row.get("Recipe_title") for row in csv.DictReader(f)]
+    titles = [t for t in dict.fromkeys(titles) if isinstance(t, str) and t]
+
+    title_embeddings(titles)
+    count = save_title_embeddings(TITLE_EMBEDDINGS_FILE)
+    return f"{count} title embeddings"
+
+
+def warm_similarity_graph():
+    from recipe_service import RecipeService
+    from similarity_graph import SIMILARITY_GRAPH_FILE, SimilarityGraph
+
+    graph = SimilarityGraph.build(RecipeService().recipes)
+    count = graph.save(SIMILARITY_GRAPH_FILE)
+    return f"{count} recipes x {graph.neighbor_rows.shape[1]} neighbours"
+
+
+WARMUP_STEPS = [
+    ("recipe cache", warm_recipe_cache),
+    ("encoder model", warm_model),
+    ("NER dataset", warm_ner_dataset),
+    ("title embeddings", warm_title_embeddings),
+    ("similarity graph", warm_similarity_graph),
+]
+
+
+def warmup(export_onnx=False):
+    print("🔥 Preflight warm-up")
+    for name, step in WARMUP_STEPS:
+        start = time.perf_counter()
+        summary = step(export_onnx) if step is warm_model else step()
+        print(f"   ✅ {name}: {summary} ({time.perf_counter() - start:.2f}s)")
+
+
+# ------------------------------
+# CLI
+# ------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_warm = sub.add_parser("warmup", help="Prebuild model and index artifacts")
+    p_warm.add_argument("--export-onnx", action="store_true",
+                        help="Export an ONNX copy of the encoder for CPU-only inference")
+
+    p_check = sub.add_parser("check-startup", help="Check import times against budgets")
+    p_check.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                         help="Override or add a budget, e.g. --budget api=600")
+
+    sub.add_parser("check-ner", help="Check query parsing against known phrases")
+    sub.add_parser("check-api", help="Check that the API accepts what the frontends send")
+    sub.add_parser("check-search", help="Check recipe matching and autocomplete against a tiny catalog")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "warmup":
+        warmup(export_onnx=args.export_onnx)
+        return 0
+
+    if args.command == "check-ner":
+        print("🔎 Query parsing")
+        failures = check_ner()
+        if failures:
+            print(f"❌ {len(failures)} phrase(s) parsed wrongly")
+            return 1
+        print("✅ All phrases parsed as expected")
+        return 0
+
+    if args.command == "check-api":
+        print("🌐 API contract")
+        failures = check_api()
+        if failures:
+            print(f"❌ {len(failures)} request(s) answered wrongly")
+            return 1
+        print("✅ All requests answered as expected")
+        return 0
+
+    if args.command == "check-search":
+        print("🍳 Recipe matching")
+        failures = check_search()
+        if failures:
+            print(f"❌ {len(failures)} case(s) matched wrongly")
+            return 1
+        print("✅ All cases matched as expected")
+        return 0
+
+    budgets = dict(IMPORT_BUDGETS_MS)
+    for item in args.budget:
+        module, _, ms = item.partition("=")
+        budgets[module] = float(ms)
+
+    print("⏱️ Import-time budgets")
+    failures = check_startup(budgets)
+    if failures:
+        print(f"❌ Over budget: {', '.join(failures)}")
+        return 1
+    print("✅ All modules within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
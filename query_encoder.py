@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+MODEL_NAME = os.environ.get("FOODOSCOPE_MODEL", "all-MiniLM-L6-v2")
+
+# Optional local directory holding an exported model (e.g. onnx/model.onnx or
+# onnx/model_qint8_avx512.onnx). Used for CPU-only inference when present.
+MODEL_DIR = os.environ.get("FOODOSCOPE_MODEL_DIR", "models/all-MiniLM-L6-v2")
+
+BATCH_WINDOW_MS = 5
+MAX_BATCH_SIZE = 64
+CACHE_SIZE = 2048
+
+ONNX_CANDIDATES = [
+    "onnx/model_qint8_avx512.onnx",
+    "onnx/model_quint8_avx2.onnx",
+    "onnx/model_O4.onnx",
+    "onnx/model.onnx",
+]
+
+
+# ------------------------------
+# Model loading
+# ------------------------------
+def _cuda_available():
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except Exception:
+        return False
+
+
+def load_model():
+    """
+    Load the SentenceTransformer model.
+    On CPU-only hosts, prefer a quantized / ONNX export from MODEL_DIR when one exists.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if not _cuda_available() and os.path.isdir(MODEL_DIR):
+        for file_name in ONNX_CANDIDATES:
+            if os.path.exists(os.path.join(MODEL_DIR, file_name)):
+                try:
+                    model = SentenceTransformer(
+                        MODEL_DIR,
+                        backend="onnx",
+                        model_kwargs={"file_name": file_name}
+                    )
+                    print(f"⚡ Loaded ONNX encoder: {file_name}")
+                    return model
+                except Exception as e:
+                    print(f"⚠️ ONNX encoder unavailable ({e}). Falling back to torch.")
+                    break
+
+    return SentenceTransformer(MODEL_NAME)
+
+
+# ------------------------------
+# Pending encode request (one per caller)
+# ------------------------------
+class _Pending:
+    __slots__ = ("text", "event", "vector", "error")
+
+    def __init__(self, text):
+        self.text = text
+        self.event = threading.Event()
+        self.vector = None
+        self.error = None
+
+
+# ------------------------------
+# QUERY ENCODER
+# ------------------------------
+class QueryEncoder:
+    """
+    Lazily-loaded sentence encoder.
+    - Concurrent encode() calls arriving within `batch_window_ms` share one forward pass.
+    - Query embeddings are kept in an LRU cache.
+    Embeddings are L2-normalised numpy vectors, so cosine similarity is a dot product.
+    """
+
+    def __init__(self, batch_window_ms=BATCH_WINDOW_MS, max_batch_size=MAX_BATCH_SIZE,
+                 cache_size=CACHE_SIZE, loader=load_model):
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.cache_size = cache_size
+        self._loader = loader
+        self._model = None
+        self._model_lock = threading.Lock()
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self._queue = []
+        self._queue_cond = threading.Condition()
+        self._worker = None
+
+        self.stats = {"hits": 0, "misses": 0, "batches": 0, "batched_texts": 0}
+
+    # ------------------------------
+    # Lazy model access
+    # ------------------------------
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._loader()
+        return self._model
+
+    def is_loaded(self):
+        return self._model is not None
+
+    # ------------------------------
+    # LRU cache helpers
+    # ------------------------------
+    def _cache_get(self, text):
+        with self._cache_lock:
+            vec = self._cache.get(text)
+            if vec is not None:
+                self._cache.move_to_end(text)
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+            return vec
+
+    def _cache_put(self, text, vec):
+        with self._cache_lock:
+            self._cache[text] = vec
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ------------------------------
+    # Direct batch encoding (no queue, no cache)
+    # ------------------------------
+    def encode_batch(self, texts, batch_size=MAX_BATCH_SIZE):
+        return self.model.encode(
+            list(texts),
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+
+    # ------------------------------
+    # Micro-batched, cached single query encoding
+    # ------------------------------
+    def encode(self, text):
+        vec = self._cache_get(text)
+        if vec is not None:
+            return vec
+
+        pending = _Pending(text)
+        with self._queue_cond:
+            self._queue.append(pending)
+            self._ensure_worker()
+            self._queue_cond.notify()
+
+        pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.vector
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._queue_cond:
+                while not self._queue:
+                    self._queue_cond.wait()
+
+                # Collect everything that arrives within the batching window
+                deadline = time.monotonic() + self.batch_window
+                while len(self._queue) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._queue_cond.wait(remaining)
+
+                batch = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+
+            self._encode_pending(batch)
+
+    def _encode_pending(self, batch):
+        # Identical texts in one window are encoded once
+        unique = list(OrderedDict.fromkeys(p.text for p in batch))
+        try:
+            vectors = self.encode_batch(unique)
+        except Exception as e:
+            for p in batch:
+                p.error = e
+                p.event.set()
+            return
+
+        by_text = dict(zip(unique, vectors))
+        for text, vec in by_text.items():
+            self._cache_put(text, vec)
+
+        self.stats["batches"] += 1
+        self.stats["batched_texts"] += len(batch)
+
+        for p in batch:
+            p.vector = by_text[p.text]
+            p.event.set()
+
+
+# Shared process-wide encoder (model loads on first use)
+_default_encoder = None
+_default_lock = threading.Lock()
+
+
+def get_encoder():
+    global _default_encoder
+    if _default_encoder is None:
+        with _default_lock:
+            if _default_encoder is None:
+                _default_encoder = QueryEncoder()
+    return _default_encoder
@@ -1,11 +1,63 @@
-import pandas as pd
-import json
+import math
+import os
 import re
-from sentence_transformers import SentenceTransformer
-import numpy as np
-import ast
+from typing import TYPE_CHECKING
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+from query_encoder import get_encoder
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Title embeddings are catalog-sized and reused across queries.
+# `python preflight.py warmup` persists them so containers start warm.
+TITLE_EMBEDDINGS_FILE = os.path.join("artifacts", "title_embeddings.npz")
+_TITLE_EMBEDDINGS = {}
+_title_embeddings_loaded = False
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+# -------------------------------
+# Title embedding artifact (load / save)
+# -------------------------------
+def load_title_embeddings(path=TITLE_EMBEDDINGS_FILE):
+    global _title_embeddings_loaded
+    _title_embeddings_loaded = True
+    if not os.path.exists(path):
+        return 0
+
+    import numpy as np
+    data = np.load(path, allow_pickle=False)
+    for t, v in zip(data["titles"], data["vectors"]):
+        _TITLE_EMBEDDINGS.setdefault(str(t), v)
+    return len(data["titles"])
+
+
+def save_title_embeddings(path=TITLE_EMBEDDINGS_FILE):
+    import numpy as np
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    titles = list(_TITLE_EMBEDDINGS)
+    np.savez(path, titles=np.array(titles, dtype=str),
+             vectors=np.stack([_TITLE_EMBEDDINGS[t] for t in titles]))
+    return len(titles)
+
+
+# -------------------------------
+# Batched title embeddings
+# -------------------------------
+def title_embeddings(titles):
+    """Return normalised embeddings for `titles`, encoding only unseen ones in one batch."""
+    if not _title_embeddings_loaded:
+        load_title_embeddings()
+
+    missing = [t for t in dict.fromkeys(titles) if t not in _TITLE_EMBEDDINGS]
+    if missing:
+        vectors = get_encoder().encode_batch(missing)
+        for t, v in zip(missing, vectors):
+            _TITLE_EMBEDDINGS[t] = v
+    return [_TITLE_EMBEDDINGS[t] for t in titles]
 
 
 # -------------------------------
@@ -60,8 +112,25 @@ def score_recipe(recipe_entities, user_entities):
 # -------------------------------
 # Main recipe finder
 # -------------------------------
-def find_matching_recipes(recipes_df: pd.DataFrame, user_entities: dict, query: str = None, top_k=20):
-    results = []
+def find_matching_recipes(recipes_df: "pd.DataFrame", user_entities: dict, query: str = None, top_k=20,
+                          token_index=None, searcher=None, entity_index=None, deadline=None):
+    """
+    `token_index` is a UtensilProcessIndex aligned with `recipes_df` (built on the fly when
+    equipment / technique constraints are present and none is passed).
+    `searcher` is a HybridSearcher over the `recipes_df` records, used to rank when there is a
+    query (built on the fly when none is passed).
+    `entity_index` is an EntityIndex over `recipes_df` (built on the fly when none is passed): rows
+    are visited best possible score first and only until the top_k can no longer change.
+    `deadline` is a Deadline (see deadline.py): when it expires, the matches found so far are
+    returned (best score bounds first) and deadline.stopped_at names the stage that was cut short.
+    """
+    from deadline import Deadline
+    from topk_engine import EntityIndex, TopK, bound_groups, scan_groups
+
+    deadline = deadline or Deadline()
+
+    all_recipes = recipes_df
+    positions = range(len(recipes_df))
 
     calorie_limit = user_entities.get("CALORIE_LIMIT")
     protein_goal = user_entities.get("PROTEIN_GOAL")
@@ -70,67 +139,96 @@ def find_matching_recipes(recipes_df: pd.DataFrame, user_entities: dict, query:
     avoid_methods = set(user_entities.get("METHOD_AVOID", []))
     user_diet = user_entities.get("DIET")
 
-    # Semantic boosting if query exists
-    query_embedding = None
-    if query:
-        query_embedding = model.encode(query, convert_to_tensor=True)
-
-    for _, row in recipes_df.iterrows():
-        recipe_entities = row.get("NER_ENTITIES")
-
-        # if stored as JSON string, decode it
-        if isinstance(recipe_entities, str):
-            recipe_entities = json.loads(recipe_entities)
-
+    # Equipment / technique filters: one vectorized mask over the token index
+    if token_index is None and {"Utensils", "Processes"} & set(recipes_df.columns):
+        from token_index import UtensilProcessIndex
+        if UtensilProcessIndex.wants(user_entities):
+            token_index = UtensilProcessIndex.from_frame(recipes_df)
+    token_avoided = None # rows whose Processes tokens already enforced METHOD_AVOID
+    if token_index is not None:
+        from token_index import METHOD_AVOID_PROCESSES
+        if token_index.wants(user_entities):
+            positions = token_index.mask(user_entities).nonzero()[0]
+        token_avoided = token_index.processes.lengths > 0
+        vocab_only_avoid = avoid_methods - set(METHOD_AVOID_PROCESSES) # labels with no process tokens
+
+    if entity_index is None:
+        entity_index = EntityIndex.from_frame(all_recipes)
+    entity_scores = entity_index.scores(user_entities) # exact score_recipe(), so also the upper bound
+    if deadline.check("index"):
+        return []
+
+    def evaluate(pos):
+        recipe_entities = entity_index.entities[pos]
         if not isinstance(recipe_entities, dict):
-            continue
+            return None
+        row = all_recipes.iloc[pos]
 
         # -------------------------
         # HARD FILTERS
         # -------------------------
 
-        # avoid methods check
+        # avoid methods check (rows with Processes tokens were already filtered by the token mask)
+        avoid = vocab_only_avoid if token_avoided is not None and token_avoided[pos] else avoid_methods
         recipe_methods = set(recipe_entities.get("METHOD_PREFERENCE", []))
-        if avoid_methods.intersection(recipe_methods):
-            continue
+        if avoid.intersection(recipe_methods):
+            return None
 
         # calorie filter
-        if calorie_limit is not None and not pd.isna(row.get("Calories")):
+        if calorie_limit is not None and not _is_missing(row.get("Calories")):
             if float(row["Calories"]) > calorie_limit:
-                continue
+                return None
 
         # protein filter
-        if protein_threshold is not None and not pd.isna(row.get("Protein (g)")):
+        if protein_threshold is not None and not _is_missing(row.get("Protein (g)")):
             if float(row["Protein (g)"]) < protein_threshold:
-                continue
+                return None
 
         # diet filter
         recipe_diet = recipe_entities.get("DIET")
         if user_diet and recipe_diet and user_diet.lower() != recipe_diet.lower():
-            continue
+            return None
 
         # -------------------------
-        # SCORE + SAVE
+        # SCORE
         # -------------------------
-        score = score_recipe(recipe_entities, user_entities)
-
-        # Basic Semantic Boost (Hybrid)
-        if query_embedding is not None and row.get("Recipe_title"):
-            title_embedding = model.encode(row["Recipe_title"], convert_to_tensor=True)
-            # Cosine similarity roughly (using torch if available, or just simple dot product)
-            from sentence_transformers import util
-            cosine_score = util.cos_sim(query_embedding, title_embedding).item()
-            score += cosine_score * 10 # Boost score by semantic similarity
-            
-        results.append({
+        return {
             "Recipe_id": row.get("Recipe_id"),
             "Recipe_title": row.get("Recipe_title"),
             "Calories": row.get("Calories"),
             "Protein (g)": row.get("Protein (g)"),
             "Region": row.get("Region"),
-            "Score": score,
+            "Score": score_recipe(recipe_entities, user_entities),
             "Matched_Entities": recipe_entities
-        })
+        }
+
+    results = {} # pos -> result (None when filtered out); rows are only evaluated when visited
+    def result(pos):
+        if pos not in results:
+            results[pos] = evaluate(pos)
+        return results[pos]
 
-    ranked = sorted(results, key=lambda x: x["Score"], reverse=True)
-    return ranked[:top_k]
+    # Hybrid ranking (lexical + semantic, fused, entity boosts) shared with /search
+    if query:
+        from hybrid_search import HybridSearcher
+
+        if searcher is None:
+            searcher = HybridSearcher(all_recipes.to_dict("records"))
+            try:
+                searcher.semantic.warm()
+            except Exception as e:
+                print(f"⚠️ Semantic ranking unavailable: {e}")
+            if deadline.check("index"):
+                return []
+
+        ranked, _ = searcher.search(query, top_k, user_entities, candidates=positions,
+                                    accept=lambda pos: result(pos) is not None, entity_scores=entity_scores,
+                                    deadline=deadline)
+        deadline.check("search") # retrievers cut by the remaining budget
+        return [{**result(row), "Score": score} for row, score in ranked]
+
+    # Entity score only: best group first, stop once the top_k is settled (or time is up)
+    top = TopK(top_k)
+    scan_groups(top, bound_groups(positions, entity_scores), lambda pos: (
+        (entity_scores[pos], result(pos)) if result(pos) is not None else None), deadline)
+    return [match for match, _ in top.items()]
@@ -0,0 +1,513 @@
+"""
+Derived indexes over RecipeService.recipes.
+
+Every index subclasses DerivedIndex and implements three hooks:
+
+    clear()                    drop all state
+    add_rows(rows, start)      index `rows`, which occupy positions start.. in service.recipes
+    fingerprint()              comparable snapshot of the index contents
+
+and may implement two more for delta sync (an index without them is rebuilt on such commits):
+
+    update_rows(positions, old_rows, new_rows)   rows replaced in place
+    remove_rows(positions, old_rows)             rows deleted; later rows move up to close the gaps
+
+attach(service) does a full build once and then follows the service's change feed,
+so each fetched page, edit or deletion is applied as a delta instead of a rebuild.
+verify_consistency() checks an incrementally maintained index against a fresh full build.
+"""
+import bisect
+
+
+# ------------------------------
+# BASE CLASS
+# ------------------------------
+class DerivedIndex:
+    name = "index"
+
+    def __init__(self):
+        self.version = None
+        self.size = 0
+        self._service = None
+        self._unsubscribe = None
+
+    # ------------------------------
+    # Hooks for subclasses
+    # ------------------------------
+    def clear(self):
+        raise NotImplementedError
+
+    def add_rows(self, rows, start):
+        raise NotImplementedError
+
+    def fingerprint(self):
+        raise NotImplementedError
+
+    def update_rows(self, positions, old_rows, new_rows):
+        raise NotImplementedError
+
+    def remove_rows(self, positions, old_rows):
+        raise NotImplementedError
+
+    # ------------------------------
+    # Build / follow the change feed
+    # ------------------------------
+    def rebuild(self, recipes, version=None):
+        self.clear()
+        self.add_rows(recipes, 0)
+        self.size = len(recipes)
+        self.version = version
+        return self
+
+    def attach(self, service):
+        self.detach()
+        self._service = service
+        self.rebuild(service.recipes, service.version)
+        self._unsubscribe = service.subscribe(self.on_change)
+        return self
+
+    def detach(self):
+        if self._unsubscribe:
+            self._unsubscribe()
+        self._unsubscribe = None
+
+    def on_change(self, change):
+        current = self.version or 0
+        if change.version <= current:
+            return # already applied
+
+        if change.version != current + 1:
+            # Missed commits: replay from the service log, or rebuild if it is gone
+            missed = self._service.changes_since(current)
+            if missed is None:
+                print(f"⚠️ {self.name}: change log gap at v{self.version}. Rebuilding.")
+                self.rebuild(self._service.recipes, self._service.version)
+                return
+            for c in missed:
+                self._apply(c)
+            return
+
+        self._apply(change)
+
+    def _apply(self, change):
+        recipes = self._service.recipes
+        if (change.updated_ids or change.removed_ids) and not self._apply_edits(change):
+            self.rebuild(recipes, self._service.version)
+            return
+
+        # appended rows are contiguous from the previous size
+        start = self.size
+        end = start + len(change.added_ids)
+        if end > len(recipes) or (change.added_ids and recipes[start].get("_id") != change.added_ids[0]):
+            self.rebuild(recipes, self._service.version)
+            return
+
+        self.add_rows(recipes[start:end], start)
+        self.size = end
+        self.version = change.version
+
+    def _apply_edits(self, change):
+        """Apply a commit's edits / deletions in place. False if the index has to be rebuilt instead."""
+        service = self._service
+        if change.version != service.version or change.previous is None:
+            return False # replayed commit: its positions no longer describe service.recipes
+        try:
+            if change.removed_ids:
+                self.remove_rows(list(change.removed_positions), [change.previous[rid] for rid in change.removed_ids])
+                self.size -= len(change.removed_ids)
+            if change.updated_ids:
+                positions = [service.position(rid) for rid in change.updated_ids]
+                self.update_rows(positions, [change.previous[rid] for rid in change.updated_ids],
+                                 [service.recipes[p] for p in positions])
+        except NotImplementedError:
+            return False
+        return True
+
+
+# ------------------------------
+# CONSISTENCY CHECKER
+# ------------------------------
+def verify_consistency(index, service, factory=None):
+    """
+    Compare an incrementally maintained `index` against a full rebuild from `service.recipes`.
+    `factory` creates an empty index of the same kind (defaults to type(index)()).
+    Returns True when both agree.
+    """
+    fresh = (factory or type(index))()
+    fresh.rebuild(service.recipes, service.version)
+
+    problems = []
+    if index.version != fresh.version:
+        problems.append(f"version {index.version} != {fresh.version}")
+    if index.size != fresh.size:
+        problems.append(f"size {index.size} != {fresh.size}")
+    if index.fingerprint() != fresh.fingerprint():
+        problems.append("contents differ")
+
+    if problems:
+        print(f"❌ {index.name} inconsistent with full rebuild: {'; '.join(problems)}")
+        return False
+    return True
+
+
+# ------------------------------
+# PACKED BITSETS
+# ------------------------------
+# A bitmap is a plain Python int: bit i set <=> row i matches.
+# &, |, and `all_rows & ~bits` compose filters word-at-a-time in C.
+
+_BYTE_BITS = [tuple(i for i in range(8) if b >> i & 1) for b in range(256)]
+
+
+def bits_from_positions(positions):
+    """Build a bitmap from row positions in O(n) (avoids quadratic `bits |= 1 << i`)."""
+    positions = list(positions)
+    if not positions:
+        return 0
+    buf = bytearray(max(positions) // 8 + 1)
+    for p in positions:
+        buf[p >> 3] |= 1 << (p & 7)
+    return int.from_bytes(buf, "little")
+
+
+def drop_positions(bits, positions):
+    """Delete the bits at `positions`; higher bits move down to close the gaps."""
+    positions = sorted(positions, reverse=True)
+    if not positions or bits.bit_length() <= positions[-1]:
+        return bits
+    for p in positions:
+        bits = (bits & ((1 << p) - 1)) | (bits >> (p + 1) << p)
+    return bits
+
+
+def compact_rows(rows, positions):
+    """
+    For a numpy array of row positions: (mask of the rows that survive deleting `positions`,
+    their new positions).
+    """
+    import numpy as np # deferred: keeps recipe_service imports light
+
+    drop = np.asarray(sorted(positions), dtype=np.int64)
+    keep = ~np.isin(rows, drop)
+    kept = rows[keep].astype(np.int64)
+    return keep, kept - np.searchsorted(drop, kept)
+
+
+def iter_positions(bits):
+    """Yield the set row positions of a bitmap in ascending order."""
+    if not bits:
+        return
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for i, byte in enumerate(data):
+        if byte:
+            base = i * 8
+            for offset in _BYTE_BITS[byte]:
+                yield base + offset
+
+
+# ------------------------------
+# DIET FLAG + REGION FACET BITMAPS
+# ------------------------------
+DIET_FLAGS = ["vegan", "pescetarian", "ovo_vegetarian", "lacto_vegetarian", "ovo_lacto_vegetarian"]
+
+# Composite diets: any one of the listed flags qualifies
+DIET_ALIASES = {
+    "vegetarian": ["vegan", "ovo_vegetarian", "lacto_vegetarian", "ovo_lacto_vegetarian"],
+}
+
+DIET_TYPES = ["any"] + DIET_FLAGS + list(DIET_ALIASES)
+
+# Other ways of saying "no diet filter" (the React diet-plan form sends these)
+NO_DIET_FILTER = ["no_preference", "non_veg"]
+
+FACET_FIELDS = {
+    "region": "Region",
+    "sub_region": "Sub_region",
+    "continent": "Continent",
+}
+
+
+def normalize_diet_type(diet_type):
+    """Map user input ("Vegan", "ovo-vegetarian", None) to a DIET_TYPES key; ValueError if unknown."""
+    key = (diet_type or "any").strip().lower().replace("-", "_").replace(" ", "_")
+    if key in NO_DIET_FILTER:
+        return "any"
+    if key not in DIET_TYPES:
+        raise ValueError(f"Unknown diet_type '{diet_type}'. Expected one of: {', '.join(DIET_TYPES + NO_DIET_FILTER)}")
+    return key
+
+
+class FacetBitmapIndex(DerivedIndex):
+    """
+    One bitmap per diet flag ("1.0" rows) and per distinct Region / Sub_region / Continent value.
+    Queries are bitwise AND/OR/NOT over these bitmaps.
+    """
+    name = "facet_bitmaps"
+
+    def clear(self):
+        self.flags = {f: 0 for f in DIET_FLAGS}
+        self.facets = {field: {} for field in FACET_FIELDS}
+
+    def add_rows(self, rows, start):
+        flag_rows = {f: [] for f in DIET_FLAGS}
+        facet_rows = {field: {} for field in FACET_FIELDS}
+
+        for i, r in enumerate(rows, start):
+            for f in DIET_FLAGS:
+                if str(r.get(f, "0.0")) == "1.0":
+                    flag_rows[f].append(i)
+            for field, column in FACET_FIELDS.items():
+                value = r.get(column)
+                if value:
+                    facet_rows[field].setdefault(str(value), []).append(i)
+
+        for f, positions in flag_rows.items():
+            self.flags[f] |= bits_from_positions(positions)
+        for field, values in facet_rows.items():
+            bucket = self.facets[field]
+            for value, positions in values.items():
+                bucket[value] = bucket.get(value, 0) | bits_from_positions(positions)
+
+    def fingerprint(self):
+        return self.flags, self.facets
+
+    def _bitmaps(self):
+        """(container, key) of every bitmap, so edits can rewrite them."""
+        return [(self.flags, f) for f in self.flags] + \
+            [(bucket, value) for bucket in self.facets.values() for value in bucket]
+
+    def update_rows(self, positions, old_rows, new_rows):
+        for p, old in zip(positions, old_rows):
+            mask = ~(1 << p)
+            for f in DIET_FLAGS:
+                if str(old.get(f, "0.0")) == "1.0":
+                    self.flags[f] &= mask
+            for field, column in FACET_FIELDS.items():
+                value = old.get(column)
+                bucket = self.facets[field]
+                if value and str(value) in bucket:
+                    bucket[str(value)] &= mask
+                    if not bucket[str(value)]:
+                        del bucket[str(value)]
+        for p, row in zip(positions, new_rows):
+            self.add_rows([row], p)
+
+    def remove_rows(self, positions, old_rows):
+        for container, key in self._bitmaps():
+            container[key] = drop_positions(container[key], positions)
+        for bucket in self.facets.values():
+            for value in [v for v, bits in bucket.items() if not bits]:
+                del bucket[value]
+
+    # ------------------------------
+    # Query building blocks
+    # ------------------------------
+    def all_rows(self):
+        # Cached per size: building a 1M-bit mask costs more than the queries using it
+        if getattr(self, "_all_size", None) != self.size:
+            self._all_bits = (1 << self.size) - 1
+            self._all_size = self.size
+        return self._all_bits
+
+    def negate(self, bits):
+        all_rows = self.all_rows()
+        return all_rows ^ (bits & all_rows)
+
+    def flag(self, name):
+        return self.flags[name]
+
+    def diet(self, diet_type):
+        diet_type = normalize_diet_type(diet_type)
+        if diet_type == "any":
+            return self.all_rows()
+        bits = 0
+        for f in DIET_ALIASES.get(diet_type, [diet_type]):
+            bits |= self.flags[f]
+        return bits
+
+    def facet(self, field, value):
+        """Exact (case-insensitive) match on a facet value."""
+        value = str(value).lower()
+        bits = 0
+        for v, b in self.facets[field].items():
+            if v.lower() == value:
+                bits |= b
+        return bits
+
+    def region(self, region):
+        """Substring match on Region or Sub_region, as RecipeService.match_recipe does."""
+        needle = region.lower()
+        bits = 0
+        for field in ("region", "sub_region"):
+            for v, b in self.facets[field].items():
+                if needle in v.lower():
+                    bits |= b
+        return bits
+
+    def select(self, recipes, bits):
+        return [recipes[i] for i in iter_positions(bits)]
+
+
+# ------------------------------
+# NUMERIC RANGE INDEX
+# ------------------------------
+RANGE_COLUMNS = {
+    "calories": "Calories",
+    "protein": "Protein (g)",
+    "fat": "Total lipid (fat) (g)",
+    "carbs": "Carbohydrate, by difference (g)",
+    "energy": "Energy (kcal)",
+    "total_time": "total_time",
+    "servings": "servings",
+}
+
+# RecipeDB reports Calories per serving but nutrient totals per recipe;
+# these columns also get a "<name>_per_serving" key (value / servings).
+PER_SERVING_COLUMNS = ["protein", "fat", "carbs", "energy"]
+
+
+def _to_float(value):
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if f != f else f # NaN -> None
+
+
+class RangeIndex(DerivedIndex):
+    """
+    Per column: a sorted key array with parallel row positions (bisect for ranges),
+    plus a row -> value array for verifying the remaining predicates on a candidate set.
+    Unparseable values (e.g. total_time "1Day20") are left out, so they never match a range.
+    """
+    name = "ranges"
+
+    def clear(self):
+        keys = list(RANGE_COLUMNS) + [f"{c}_per_serving" for c in PER_SERVING_COLUMNS]
+        self.keys = {k: [] for k in keys}
+        self.rows = {k: [] for k in keys}
+        self.values = {k: [] for k in keys}
+
+    @staticmethod
+    def _parse(r):
+        parsed = {k: _to_float(r.get(column)) for k, column in RANGE_COLUMNS.items()}
+        servings = parsed["servings"]
+        for c in PER_SERVING_COLUMNS:
+            v = parsed[c]
+            parsed[f"{c}_per_serving"] = v / servings if v is not None and servings else None
+        return parsed
+
+    def add_rows(self, rows, start):
+        new = {k: [] for k in self.keys}
+        for i, r in enumerate(rows, start):
+            for k, v in self._parse(r).items():
+                self.values[k].append(v)
+                if v is not None:
+                    new[k].append((v, i))
+
+        for k, pairs in new.items():
+            self._merge(k, pairs)
+
+    def _merge(self, key, pairs):
+        if not pairs:
+            return
+        keys, rows = self.keys[key], self.rows[key]
+
+        if len(pairs) < 64 and keys:
+            # Small delta (one fetched page): ordered inserts
+            for v, i in pairs:
+                at = bisect.bisect_right(keys, v)
+                keys.insert(at, v)
+                rows.insert(at, i)
+            return
+
+        merged = sorted(list(zip(keys, rows)) + pairs)
+        self.keys[key] = [v for v, _ in merged]
+        self.rows[key] = [i for _, i in merged]
+
+    def fingerprint(self):
+        return self.keys, self.rows
+
+    def _entry(self, key, v, row):
+        """Where (v, row) sits (or belongs) in the sorted arrays; equal keys are ordered by row."""
+        keys = self.keys[key]
+        return bisect.bisect_left(self.rows[key], row, bisect.bisect_left(keys, v), bisect.bisect_right(keys, v))
+
+    def update_rows(self, positions, old_rows, new_rows):
+        for p, row in zip(positions, new_rows):
+            for k, v in self._parse(row).items():
+                old = self.values[k][p]
+                if old == v:
+                    continue
+                if old is not None:
+                    at = self._entry(k, old, p)
+                    del self.keys[k][at], self.rows[k][at]
+                if v is not None:
+                    at = self._entry(k, v, p)
+                    self.keys[k].insert(at, v)
+                    self.rows[k].insert(at, p)
+                self.values[k][p] = v
+
+    def remove_rows(self, positions, old_rows):
+        import numpy as np
+
+        for k in self.keys:
+            keep, rows = compact_rows(np.asarray(self.rows[k], dtype=np.int64), positions)
+            self.keys[k] = np.asarray(self.keys[k], dtype=np.float64)[keep].tolist()
+            self.rows[k] = rows.tolist()
+            for p in sorted(positions, reverse=True):
+                del self.values[k][p]
+
+    # ------------------------------
+    # Queries
+    # ------------------------------
+    @staticmethod
+    def resolve(column, per_serving=False):
+        """Map a short name ("protein") or dataset column ("Protein (g)") to an index key."""
+        key = column
+        if key not in RANGE_COLUMNS:
+            key = next((k for k, c in RANGE_COLUMNS.items() if c == column), None)
+        if key is None:
+            raise KeyError(f"No range index for column '{column}'")
+        if per_serving and key in PER_SERVING_COLUMNS:
+            return f"{key}_per_serving"
+        return key
+
+    def _span(self, key, lo, hi):
+        keys = self.keys[key]
+        i = 0 if lo is None else bisect.bisect_left(keys, lo)
+        j = len(keys) if hi is None else bisect.bisect_right(keys, hi)
+        return i, max(i, j)
+
+    def range(self, column, lo=None, hi=None, per_serving=False):
+        """Bitmap of rows with lo <= value <= hi (either bound may be None)."""
+        key = self.resolve(column, per_serving)
+        i, j = self._span(key, lo, hi)
+        return bits_from_positions(self.rows[key][i:j])
+
+    def query(self, ranges, per_serving=False):
+        """
+        Bitmap of rows satisfying every {column: (lo, hi)} constraint.
+        The most selective range (smallest bisect span) drives; the others are checked per candidate.
+        """
+        spans = []
+        for column, (lo, hi) in ranges.items():
+            key = self.resolve(column, per_serving)
+            i, j = self._span(key, lo, hi)
+            spans.append((j - i, key, lo, hi, i, j))
+        if not spans:
+            return (1 << self.size) - 1
+
+        spans.sort(key=lambda s: s[0])
+        _, key, _, _, i, j = spans[0]
+        candidates = self.rows[key][i:j]
+
+        for _, key, lo, hi, _, _ in spans[1:]:
+            values = self.values[key]
+            candidates = [
+                p for p in candidates
+                if values[p] is not None
+                and (lo is None or values[p] >= lo)
+                and (hi is None or values[p] <= hi)
+            ]
+        return bits_from_positions(candidates)
@@ -1,6 +1,23 @@
-import requests
+import hashlib
 import json
 import os
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+
+from analytics_cube import AnalyticsCube
+from candidate_pools import CandidatePools
+from circuit_breaker import CircuitBreaker, UpstreamUnavailable
+from deadline import Deadline
+from hybrid_search import HybridSearcher
+from ingredient_index import IngredientIndex
+from meal_planner import MealPlanner
+from ner_foodoscope import rule_based_ner
+from recipe_index import DIET_ALIASES, FacetBitmapIndex, RangeIndex, iter_positions, normalize_diet_type
+from recipe_table import RecipeTable
+from similarity_graph import SIMILARITY_GRAPH_FILE, SimilarityGraph
+from trigram_index import TrigramIndex
 
 # ------------------------------
 # CONFIGURATION
@@ -8,17 +25,101 @@ import os
 
 CACHE_FILE = "recipes_cache.json"
 
+# Upstream recipe API (override for staging or the local mock: `python mock_upstream.py`)
+API_URL = os.environ.get("FOODOSCOPE_API_URL", "http://cosylab.iiitd.edu.in:6969/recipe2-api/recipe/recipesinfo")
+API_KEY = os.environ.get("FOODOSCOPE_API_KEY", "SXUtue0kpjPJQpVbrUiibRM8J0dYB2SqwDzz9udpn9PTlk1n")
+REQUEST_TIMEOUT = 15 # seconds
+CONNECT_TIMEOUT = 3 # seconds; an unreachable host should not cost the full REQUEST_TIMEOUT
+
+# Offline mode: serve the local store only, never touch the network
+OFFLINE = os.environ.get("FOODOSCOPE_OFFLINE", "").lower() in ("1", "true", "yes")
+
+# Already-fetched pages revalidated per sync run (rolling, least recently checked first)
+REVALIDATE_PAGES = 5
+
+# Seconds between background sync runs while serving; 0 = only the startup sync
+SYNC_INTERVAL = float(os.environ.get("FOODOSCOPE_SYNC_INTERVAL", "900"))
+
+# Hybrid search in this many worker processes (scatter-gather over shards); 0 = in process
+SEARCH_SHARDS = int(os.environ.get("FOODOSCOPE_SEARCH_SHARDS", "0"))
+
+# How many commits the change feed remembers for late subscribers
+CHANGELOG_SIZE = 256
+
+
+# ------------------------------
+# CHANGE FEED
+# ------------------------------
+class ChangeSet(NamedTuple):
+    """One commit to RecipeService.recipes: the new version and the `_id`s it appended, replaced or removed."""
+    version: int
+    added_ids: tuple
+    updated_ids: tuple = ()
+    removed_ids: tuple = ()
+    previous: dict = None # _id -> the replaced / removed row as it was (for incremental index updates)
+    removed_positions: tuple = () # where each removed row sat, parallel to removed_ids
+
+def page_hash(page_data):
+    """Content hash of one upstream page (key order does not matter)"""
+    raw = json.dumps(page_data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def plan_entry(r):
+    """The fields of a recipe that plan responses carry"""
+    try:
+        calories = float(r.get("Calories", 0))
+    except (TypeError, ValueError):
+        calories = 0.0
+    return {
+        "Recipe_title": r.get("Recipe_title"),
+        "Calories": calories,
+        "total_time": r.get("total_time"),
+        "Protein (g)": r.get("Protein (g)"),
+        "Region": r.get("Region"),
+        "Sub_region": r.get("Sub_region"),
+        "ingredients": r.get("ingredients"),
+        "instructions": r.get("instructions"),
+        "_id": r.get("_id")
+    }
+
+
 # ------------------------------
 # RECIPE SERVICE
 # ------------------------------
 
 class RecipeService:
-    def __init__(self):
-        self.cache_file = CACHE_FILE
-        self.recipes = []
+    def __init__(self, cache_file=CACHE_FILE, api_url=API_URL, api_key=API_KEY, offline=OFFLINE):
+        self.cache_file = cache_file
+        self.api_url = api_url
+        self.api_key = api_key
+        self.offline = offline
+        # Upstream health, persisted next to the cache (recipes_cache.upstream.json)
+        self.breaker = CircuitBreaker(f"{os.path.splitext(cache_file)[0]}.upstream.json")
+        self.recipes = RecipeTable() # dictionary-encoded; rows are read-only dict-like views
         self.last_fetched_page = 0
+        self.page_limit = None
+        self.pages = {} # str(page) -> {hash, etag, ids, checked}
+        self.version = 0
+        self._positions = {}
+        self._subscribers = []
+        self._changelog = deque(maxlen=CHANGELOG_SIZE)
         self.load_cache()
 
+        # Derived indexes follow the change feed
+        self.facets = FacetBitmapIndex().attach(self)
+        self.ranges = RangeIndex().attach(self)
+        self.ingredients = IngredientIndex().attach(self)
+        # BM25 + title embeddings; with search shards, those hold the search indexes instead
+        self._searcher = None if SEARCH_SHARDS else HybridSearcher(service=self)
+        self._searcher_lock = threading.Lock()
+        self.trigrams = TrigramIndex().attach(self) # typo-tolerant lookup / autocomplete
+        self.analytics = AnalyticsCube().attach(self) # pre-aggregated stats for /analytics
+        # after facets / ranges: refreshes use them
+        self.pools = CandidatePools(self._build_planner, self._extend_planner).attach(self)
+        self.shards = None # ShardedSearch, see use_shards()
+        self.similarity_file = SIMILARITY_GRAPH_FILE # built offline: python preflight.py warmup
+        self._similarity = None # (artifact mtime, SimilarityGraph)
+
     # ------------------------------
     # Load cached recipes from single JSON
     # ------------------------------
@@ -30,24 +131,30 @@ class RecipeService:
 
                     # Case 1: Proper dict format
                     if isinstance(data, dict):
-                        self.recipes = data.get("recipes", [])
+                        self.recipes = RecipeTable(data.get("recipes", []))
                         self.last_fetched_page = data.get("last_fetched_page", 0)
+                        self.version = data.get("version", 0)
+                        self.page_limit = data.get("page_limit")
+                        self.pages = data.get("pages", {})
 
                     # Case 2: Old list-only format
                     elif isinstance(data, list):
                         print("⚠️ Old cache format detected. Converting...")
-                        self.recipes = data
+                        self.recipes = RecipeTable(data)
                         self.last_fetched_page = 0
                         self.save_cache()  # Save in correct format
 
+                    self._reindex_positions()
                     print(f"📦 Loaded {len(self.recipes)} recipes from cache")
             else:
                 print("🆕 No cache found. Starting fresh.")
 
         except Exception as e:
             print(f"⚠️ Error loading cache: {e}")
-            self.recipes = []
+            self.recipes = RecipeTable()
             self.last_fetched_page = 0
+            self.pages = {}
+            self._positions = {}
 
     # ------------------------------
     # Save cache with structured keys
@@ -56,60 +163,170 @@ class RecipeService:
         with open(self.cache_file, "w", encoding="utf-8") as f:
             json.dump({
                 "last_fetched_page": self.last_fetched_page,
-                "recipes": self.recipes
+                "version": self.version,
+                "page_limit": self.page_limit,
+                "pages": self.pages,
+                "recipes": self.recipes.to_dicts()
             }, f, indent=2)
 
 
+    # ------------------------------
+    # Change feed: version + per-commit deltas for derived indexes
+    # ------------------------------
+    def _reindex_positions(self, start=0):
+        if not start:
+            self._positions = {}
+        for i in range(start, len(self.recipes)):
+            rid = self.recipes[i].get("_id")
+            if rid:
+                self._positions[rid] = i
+
+    def position(self, recipe_id):
+        """Row index of a recipe in self.recipes (None if unknown)"""
+        return self._positions.get(recipe_id)
+
+    def subscribe(self, listener):
+        """
+        Register `listener(change: ChangeSet)`, called after every commit.
+        Returns a function that unsubscribes it.
+        """
+        self._subscribers.append(listener)
+        return lambda: self._subscribers.remove(listener)
+
+    def changes_since(self, version):
+        """Commits newer than `version`, or None if the log no longer reaches back that far."""
+        if version == self.version:
+            return []
+        if not self._changelog or self._changelog[0].version > version + 1:
+            return None
+        return [c for c in self._changelog if c.version > version]
+
+    def _commit(self, added_ids, updated_ids=(), removed_ids=(), previous=None, removed_positions=()):
+        if not (added_ids or updated_ids or removed_ids):
+            return None
+
+        self.version += 1
+        change = ChangeSet(self.version, tuple(added_ids), tuple(updated_ids), tuple(removed_ids),
+                           previous or {}, tuple(removed_positions))
+        self._changelog.append(change)
+
+        for listener in list(self._subscribers):
+            try:
+                listener(change)
+            except Exception as e:
+                print(f"⚠️ Change listener failed on v{change.version}: {e}")
+        return change
+
+    # ------------------------------
+    # Upstream pages
+    # ------------------------------
+    def _request_page(self, page, limit, etag=None):
+        """
+        GET one upstream page. Returns (status_code, page_data, etag); page_data is None unless 200.
+        Raises UpstreamUnavailable without a request when offline or while the circuit is open.
+        """
+        if self.offline:
+            raise UpstreamUnavailable("offline mode")
+        if not self.breaker.allow():
+            raise UpstreamUnavailable(f"circuit open, next probe in {self.breaker.retry_in():.0f}s")
+
+        import requests # deferred: only needed when we actually hit the network
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        if etag:
+            headers["If-None-Match"] = etag # conditional request: 304 if the page is unchanged
+
+        try:
+            response = requests.get(
+                self.api_url,
+                headers=headers,
+                params={"page": page, "limit": limit},
+                timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT)
+            )
+        except requests.RequestException as e:
+            self.breaker.record_failure(e)
+            raise
+
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            self.breaker.record_success()
+        if response.status_code != 200:
+            return response.status_code, None, etag
+        data = response.json()
+        return 200, data.get("payload", {}).get("data", []), response.headers.get("ETag")
+
+    def _apply_page(self, page, page_data, etag=None):
+        """
+        Upsert a page's recipes (one commit) and record its new hash / ids.
+        Returns (change, left): `left` are ids the page used to hold and no longer does.
+        """
+        added_ids, updated_ids, old_rows = [], [], {}
+        for r in page_data:
+            rid = r.get("_id")
+            pos = self._positions.get(rid) if rid else None
+            if pos is None:
+                if rid:
+                    self._positions[rid] = len(self.recipes)
+                self.recipes.append(r)
+                added_ids.append(rid)
+            elif self.recipes[pos] != r:
+                old_rows[rid] = dict(self.recipes[pos])
+                self.recipes[pos] = r
+                updated_ids.append(rid)
+
+        previous = self.pages.get(str(page), {}).get("ids", [])
+        self.pages[str(page)] = {
+            "hash": page_hash(page_data),
+            "etag": etag,
+            "ids": [r.get("_id") for r in page_data if r.get("_id")],
+            "checked": time.time()
+        }
+
+        left = set(previous).difference(self.pages[str(page)]["ids"])
+        return self._commit(added_ids, updated_ids, previous=old_rows), left
+
+    def _remove(self, recipe_ids):
+        positions = [self._positions.pop(rid) for rid in recipe_ids]
+        old_rows = {rid: dict(self.recipes[p]) for rid, p in zip(recipe_ids, positions)}
+        self.recipes = self.recipes.without(positions) # a new table: rows already handed out stay valid
+        self._reindex_positions(min(positions))
+        return self._commit((), (), recipe_ids, old_rows, positions)
+
     # ------------------------------
     # Fetch new pages sequentially
     # ------------------------------
     def fetch_recipes(self, max_new_pages=50, limit=20):
         print(f"📡 Current cache count: {len(self.recipes)} recipes")
-        
-        # API Config (Move to instance if needed, keeping here for simplicity)
-        API_KEY = "SXUtue0kpjPJQpVbrUiibRM8J0dYB2SqwDzz9udpn9PTlk1n"
-        API_URL = "http://cosylab.iiitd.edu.in:6969/recipe2-api/recipe/recipesinfo"
-        HEADERS = {
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
-        }
 
+        self._check_page_limit(limit)
         start_page = self.last_fetched_page + 1
         end_page = start_page + max_new_pages
         
         print(f"🔄 Sequential fetch: Starting from Page {start_page}...")
 
-        existing_ids = {r.get("_id") for r in self.recipes if r.get("_id")}
         new_count = 0
 
         for page in range(start_page, end_page):
             try:
-                response = requests.get(
-                    API_URL,
-                    headers=HEADERS,
-                    params={"page": page, "limit": limit},
-                    timeout=15
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    page_data = data.get("payload", {}).get("data", [])
+                status, page_data, etag = self._request_page(page, limit)
 
+                if status == 200:
                     if not page_data:
                         print(f"   🛑 Page {page} is empty. Reached end of API.")
                         break
 
-                    for r in page_data:
-                        if r.get("_id") not in existing_ids:
-                            self.recipes.append(r)
-                            existing_ids.add(r.get("_id"))
-                            new_count += 1
+                    change, _ = self._apply_page(page, page_data, etag) # One commit per page
+                    new_count += len(change.added_ids) if change else 0
                     
                     self.last_fetched_page = page
                     self.save_cache() # Save progress after each page
                     print(f"   ✅ Fetched Page {page} ({len(page_data)} items)")
                 else:
-                    print(f"   ❌ Error on Page {page}: {response.status_code}")
+                    print(f"   ❌ Error on Page {page}: {status}")
                     break
 
             except Exception as e:
@@ -122,14 +339,146 @@ class RecipeService:
         else:
             print("ℹ️ No new recipes were found.")
 
+    # ------------------------------
+    # Delta sync: revalidate known pages, then fetch new ones
+    # ------------------------------
+    def _check_page_limit(self, limit):
+        # Page hashes only make sense for the page size they were taken with
+        if self.page_limit != limit:
+            if self.pages:
+                print(f"⚠️ Page size changed ({self.page_limit} -> {limit}). Dropping page hashes.")
+            self.pages = {}
+            self.page_limit = limit
+
+    def revalidation_schedule(self, count, limit=20):
+        """The `count` least recently checked known pages, plus the last page while it is not full."""
+        known = range(1, self.last_fetched_page + 1)
+        pages = sorted(known, key=lambda p: self.pages.get(str(p), {}).get("checked", 0))[:count]
+
+        last = self.last_fetched_page
+        if last and last not in pages and len(self.pages.get(str(last), {}).get("ids", [])) < limit:
+            pages.append(last) # new upstream recipes land here first
+        return pages
+
+    def sync_recipes(self, max_new_pages=50, limit=20, revalidate_pages=REVALIDATE_PAGES):
+        """
+        Delta sync. Revalidates `revalidate_pages` already-fetched pages per run (oldest check first,
+        with If-None-Match when the upstream sent an ETag), applies edits and deletions as upserts /
+        removals, then fetches new pages. Returns counters for the run.
+
+        A deletion upstream shifts later recipes onto earlier pages, so when ids leave a page its
+        neighbours are revalidated too; an id is only deleted once it is on no known page.
+
+        Offline, or while the upstream circuit is open, the run makes no requests at all.
+        """
+        self._check_page_limit(limit)
+        stats = {"revalidated": 0, "not_modified": 0, "unchanged": 0, "added": 0, "updated": 0, "removed": 0}
+
+        if self.offline:
+            print(f"📴 Offline mode: serving {len(self.recipes)} cached recipes (no upstream requests)")
+            return {**stats, "skipped": "offline"}
+        if self.breaker.retry_in() > 0:
+            print(f"⛔ Upstream circuit open (next probe in {self.breaker.retry_in():.0f}s, "
+                  f"last good sync: {self._format_time(self.breaker.last_good_sync)}). Serving cache.")
+            return {**stats, "skipped": "circuit_open"}
+
+        queue = deque(self.revalidation_schedule(revalidate_pages, limit))
+        scheduled = set(queue)
+        left = set()
+        while queue:
+            page = queue.popleft()
+            state = self.pages.get(str(page), {})
+            try:
+                status, page_data, etag = self._request_page(page, limit, state.get("etag"))
+            except Exception as e:
+                print(f"   ⚠️ Revalidation failed on Page {page}: {e}")
+                break
+
+            stats["revalidated"] += 1
+            if status == 304:
+                state["checked"] = time.time()
+                stats["not_modified"] += 1
+                continue
+            if status != 200:
+                print(f"   ❌ Error revalidating Page {page}: {status}")
+                break
+
+            if state.get("hash") == page_hash(page_data):
+                state.update(etag=etag, checked=time.time())
+                stats["unchanged"] += 1
+                continue
+
+            change, page_left = self._apply_page(page, page_data, etag)
+            if change:
+                stats["added"] += len(change.added_ids)
+                stats["updated"] += len(change.updated_ids)
+            print(f"   🔁 Page {page} changed: +{len(change.added_ids) if change else 0} "
+                  f"~{len(change.updated_ids) if change else 0} ({len(page_left)} left the page)")
+
+            left |= page_left
+            for neighbour in (page - 1, page + 1) if page_left else ():
+                if 1 <= neighbour <= self.last_fetched_page and neighbour not in scheduled:
+                    scheduled.add(neighbour)
+                    queue.append(neighbour)
+
+        # Deletions: ids that left their page and are not on any other known page
+        left -= {rid for state in self.pages.values() for rid in state["ids"]}
+        removed_ids = [rid for rid in left if rid in self._positions]
+        if removed_ids:
+            self._remove(removed_ids)
+            stats["removed"] = len(removed_ids)
+            print(f"   🗑️ Removed {len(removed_ids)} recipes deleted upstream")
+
+        if stats["revalidated"]:
+            self.save_cache()
+            print(f"🔎 Revalidated {stats['revalidated']} pages ({stats['not_modified']} not modified, "
+                  f"{stats['unchanged']} unchanged)")
+
+        size = len(self.recipes)
+        self.fetch_recipes(max_new_pages, limit)
+        stats["added"] += max(len(self.recipes) - size, 0)
+
+        if self.breaker.failures == 0: # every request of the run reached the upstream
+            self.breaker.record_sync()
+        return stats
+
+    def start_periodic_sync(self, interval=SYNC_INTERVAL, max_new_pages=50):
+        """
+        Run sync_recipes() every `interval` seconds in a daemon thread, so upstream edits and
+        deletions reach a long-running server. Returns a threading.Event that stops the loop.
+        """
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    stats = self.sync_recipes(max_new_pages=max_new_pages)
+                    print(f"🔄 Periodic sync: +{stats['added']} ~{stats['updated']} -{stats['removed']}")
+                except Exception as e:
+                    print(f"⚠️ Periodic sync failed: {e}")
+
+        if interval > 0:
+            threading.Thread(target=loop, name="recipe-sync", daemon=True).start()
+        return stop
+
+    @staticmethod
+    def _format_time(timestamp):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else "never"
+
+    def upstream_status(self):
+        """Offline flag, circuit state and last good sync time (for /metrics)."""
+        return {"offline": self.offline, **self.breaker.status()}
+
     # ------------------------------
     # Dataset-Driven Filtering Logic
     # ------------------------------
     def match_recipe(self, r, diet_type="any", max_time=None, region=None, protein_goal=None):
         try:
-            # 1. Diet Type (vegan column: "1.0" or "0.0")
-            if diet_type == "vegan":
-                if str(r.get("vegan", "0.0")) != "1.0":
+            # 1. Diet Type (diet flag columns: "1.0" or "0.0")
+            diet_type = normalize_diet_type(diet_type)
+            if diet_type != "any":
+                flags = DIET_ALIASES.get(diet_type, [diet_type])
+                if not any(str(r.get(f, "0.0")) == "1.0" for f in flags):
                     return False
 
             # 2. Max Time (total_time column)
@@ -158,93 +507,282 @@ class RecipeService:
     # ------------------------------
     # PROGRESSIVE RELAXED FILTERING
     # ------------------------------
-    def get_filtered_pool(self, diet_type="any", max_time=None, region=None, protein_goal=None):
+    def select_recipes(self, diet_type="any", max_time=None, region=None, protein_goal=None,
+                       min_calories=None, max_calories=None, servings=None, per_serving=False):
+        bits = self.select_bits(diet_type, max_time, region, protein_goal,
+                                min_calories, max_calories, servings, per_serving)
+        return self.facets.select(self.recipes, bits)
+
+    def select_bits(self, diet_type="any", max_time=None, region=None, protein_goal=None,
+                    min_calories=None, max_calories=None, servings=None, per_serving=False):
+        # Diet + region come from the bitmap index, numeric constraints from the range index
+        bits = self.facets.diet(diet_type)
+        if region:
+            bits &= self.facets.region(region)
+
+        ranges = {}
+        if max_time:
+            ranges["total_time"] = (None, max_time)
+        if protein_goal:
+            ranges["protein"] = (protein_goal, None)
+        if min_calories or max_calories:
+            ranges["calories"] = (min_calories or None, max_calories or None)
+        if servings:
+            ranges["servings"] = (servings, None)
+        if ranges and bits:
+            bits &= self.ranges.query(ranges, per_serving)
+        return bits
+
+    def get_filtered_pool(self, diet_type="any", max_time=None, region=None, protein_goal=None,
+                          min_calories=None, max_calories=None, servings=None, per_serving=False,
+                          relaxed=None):
+        # `relaxed`, if given, collects the names of the filters that had to be dropped
+        relaxed = relaxed if relaxed is not None else []
         
         # Level 1: Strict match
-        pool = [r for r in self.recipes if self.match_recipe(r, diet_type, max_time, region, protein_goal)]
+        pool = self.select_recipes(diet_type, max_time, region, protein_goal,
+                                   min_calories, max_calories, servings, per_serving)
         if pool: return pool
 
+        if min_calories or max_calories or servings:
+            print("⚠️ Relaxing filters (calories/servings)...")
+            relaxed.append("calories/servings")
+            # Level 2: Relax per-recipe calorie bounds and servings
+            pool = self.select_recipes(diet_type, max_time, region, protein_goal, per_serving=per_serving)
+            if pool: return pool
+
         print("⚠️ Relaxing filters (protein)...")
-        # Level 2: Relax Protein
-        pool = [r for r in self.recipes if self.match_recipe(r, diet_type, max_time, region, None)]
+        relaxed.append("protein")
+        # Level 3: Relax Protein
+        pool = self.select_recipes(diet_type, max_time, region, None)
         if pool: return pool
 
         print("⚠️ Relaxing filters (time)...")
-        # Level 3: Relax Time
-        pool = [r for r in self.recipes if self.match_recipe(r, diet_type, None, region, None)]
+        relaxed.append("time")
+        # Level 4: Relax Time
+        pool = self.select_recipes(diet_type, None, region, None)
         if pool: return pool
 
         print("⚠️ Relaxing filters (region)...")
-        # Level 4: Relax Region (Diet type is sacred)
-        pool = [r for r in self.recipes if self.match_recipe(r, diet_type, None, None, None)]
+        relaxed.append("region")
+        # Level 5: Relax Region (Diet type is sacred)
+        pool = self.select_recipes(diet_type, None, None, None)
         if pool: return pool
 
         # Final Fallback: Just diet type or all
         return self.recipes
 
     # ------------------------------
-    # SIMPLE KEYWORD SEARCH
+    # CALORIE-SORTED CANDIDATE POOLS (materialized for frequent constraints)
     # ------------------------------
-    def search_recipes(self, query, top_k=20):
-        if not self.recipes:
-            return []
-            
-        q = query.lower()
-        results = []
-        for r in self.recipes:
-            text = (str(r.get("Recipe_title", "")) + " " + str(r.get("ingredients", ""))).lower()
-            if q in text:
-                results.append(r)
-        
-        return results[:top_k]
+    @staticmethod
+    def pool_key(diet_type="any", max_time=None, region=None, protein_goal=None,
+                 min_calories=None, max_calories=None, servings=None, per_serving=False):
+        """Normalized constraints: requests that filter the same way share one key."""
+        return (normalize_diet_type(diet_type), max_time or None, region.lower() if region else None,
+                protein_goal or None, min_calories or None, max_calories or None, servings or None,
+                bool(per_serving))
+
+    def _build_planner(self, key):
+        relaxed = []
+        pool = self.get_filtered_pool(*key, relaxed=relaxed)
+        return MealPlanner(pool), relaxed
+
+    def _extend_planner(self, key, planner, relaxed, change):
+        """Merge appended rows into a strict (nothing relaxed) pool; None when it needs a rebuild."""
+        if relaxed or change.updated_ids or change.removed_ids or not change.added_ids:
+            return None # a relaxed pool may now have a stricter match
+        start = self.position(change.added_ids[0])
+        if start is None or start + len(change.added_ids) != len(self.recipes):
+            return None
+        bits = self.select_bits(*key) >> start
+        return planner.extended([self.recipes[start + i] for i in iter_positions(bits)]), relaxed
+
+    def candidate_planner(self, *constraints, **named):
+        """(MealPlanner over get_filtered_pool(...), relaxed filters), from a materialized pool when one exists."""
+        return self.pools.get(self.pool_key(*constraints, **named))
 
     # ------------------------------
-    # 7-DAY DIET PLAN GENERATOR
+    # HYBRID SEARCH (lexical + semantic, fused, entity boosts)
     # ------------------------------
-    def generate_weekly_plan(self, daily_calories, diet_type="any", max_time=None, region=None, protein_goal=None):
-        
-        # Calculate split targets
-        targets = {
-            "Breakfast": daily_calories * 0.30,
-            "Lunch": daily_calories * 0.40,
-            "Dinner": daily_calories * 0.30
-        }
+    def search_with_stats(self, query, top_k=20, budgets_ms=None, fuzzy=False):
+        """
+        (recipes with a "Score", per-stage timings / skipped stages)
+        With `fuzzy`, misspelled words are first replaced by their closest indexed word.
+        """
+        if not self.recipes or not query:
+            return [], {"stages": {}, "skipped": []}
+
+        fixes = {}
+        if fuzzy:
+            query, fixes = self.trigrams.correct(query)
+
+        if self.shards is not None:
+            recipes, stats = self.shards.search(query, top_k, rule_based_ner(query), budgets_ms)
+        else:
+            ranked, stats = self.searcher.search(query, top_k, rule_based_ner(query), budgets_ms=budgets_ms)
+            recipes = [{**self.recipes[row], "Score": score} for row, score in ranked]
+        if fixes:
+            stats["corrected_query"] = query
+        return recipes, stats
+
+    @property
+    def searcher(self):
+        """The in-process HybridSearcher, built on first use when it was skipped for shards."""
+        with self._searcher_lock:
+            if self._searcher is None:
+                self._searcher = HybridSearcher(service=self)
+            return self._searcher
+
+    def use_shards(self, count=SEARCH_SHARDS):
+        """
+        Serve hybrid search from `count` worker processes, kept current through the change feed.
+        The in-process search indexes are dropped: each shard holds its own part.
+        """
+        from shard_search import ShardedSearch # deferred: spawns processes
+
+        self.shards = ShardedSearch(self.recipes, shards=count).start().attach(self)
+        with self._searcher_lock:
+            if self._searcher is not None:
+                self._searcher.detach()
+                self._searcher = None
+        return self.shards
+
+    def search_recipes(self, query, top_k=20, fuzzy=False):
+        return self.search_with_stats(query, top_k, fuzzy=fuzzy)[0]
+
+    def suggest(self, text, limit=10):
+        """Autocomplete: distinct titles matching the typed text (typos tolerated)."""
+        suggestions = {}
+        for row in self.trigrams.suggest_rows(text, limit * 3):
+            r = self.recipes[row]
+            title = r.get("Recipe_title")
+            if title and title not in suggestions:
+                suggestions[title] = {"Recipe_title": title, "_id": r.get("_id")}
+            if len(suggestions) >= limit:
+                break
+        return list(suggestions.values())
 
-        # Get the recipe pool based on constraints
-        pool = self.get_filtered_pool(diet_type, max_time, region, protein_goal)
-        print(f"📊 Filtering complete. Final pool size: {len(pool)}")
+    # ------------------------------
+    # PANTRY SEARCH ("what can I cook with these items?")
+    # ------------------------------
+    def pantry_search(self, items, min_coverage=0.8, top_k=20, diet_type="any"):
+        candidates = self.facets.diet(diet_type)
+        return self.ingredients.pantry_matches(self.recipes, items, min_coverage, top_k, candidates)
 
-        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    # ------------------------------
+    # MEAL SWAP (precomputed similarity graph)
+    # ------------------------------
+    def similarity_graph(self):
+        """The offline-built SimilarityGraph (reloaded when the artifact changes), or None if not built."""
+        try:
+            mtime = os.path.getmtime(self.similarity_file)
+        except OSError:
+            return None
+        if self._similarity is None or self._similarity[0] != mtime:
+            self._similarity = (mtime, SimilarityGraph.load(self.similarity_file))
+        return self._similarity[1]
+
+    def swap_meal(self, recipe_id, limit=5, exclude_ids=(), diet_type="any", max_time=None, region=None,
+                  protein_goal=None, min_calories=None, max_calories=None):
+        """
+        Up to `limit` alternatives for one planned meal: its nearest neighbours in the similarity graph
+        that pass the plan's constraints, nearest first. Costs O(GRAPH_NEIGHBORS), not a pool scan.
+        Returns None when the graph does not know the recipe.
+        """
+        graph = self.similarity_graph()
+        if graph is None or recipe_id not in graph:
+            return None
+
+        pos = self.position(recipe_id)
+        title = self.recipes[pos].get("Recipe_title") if pos is not None else None
+        excluded = set(exclude_ids)
+        alternatives = []
+        for rid, distance in graph.neighbors(recipe_id):
+            pos = self.position(rid)
+            if pos is None or rid in excluded: # removed since the build, or already in the plan
+                continue
+            r = self.recipes[pos]
+            if title and r.get("Recipe_title") == title: # the same dish listed twice
+                continue
+            entry = plan_entry(r)
+            if (min_calories and entry["Calories"] < min_calories) or (max_calories and entry["Calories"] > max_calories):
+                continue
+            if not self.match_recipe(r, diet_type, max_time, region, protein_goal):
+                continue
+            alternatives.append({**entry, "distance": round(distance, 4)})
+            if len(alternatives) >= limit:
+                break
+        return alternatives
+
+    # ------------------------------
+    # 7-DAY DIET PLAN GENERATOR
+    # ------------------------------
+    def generate_weekly_plan(self, daily_calories, diet_type="any", max_time=None, region=None, protein_goal=None,
+                             min_calories=None, max_calories=None, servings=None, per_serving=False,
+                             days=7, meals_per_day=3, focus="Balanced", meal_split=None, repeat_gap_days=None,
+                             deadline=None):
+        """{day: {meal: entry}}. With a `deadline`, only the days planned before it expired (see deadline.partial)."""
         plan = {}
-        used_ids = set()
-
-        for day in days:
-            plan[day] = {}
-            for meal, target in targets.items():
-                
-                # Filter out used recipes to avoid repetition
-                available = [r for r in pool if r.get("_id") not in used_ids]
-                
-                # If we ran out of recipes, reset the used set for diversity
-                if not available:
-                    used_ids.clear()
-                    available = pool
-
-                # Pick closest calorie match
-                best_match = min(available, key=lambda x: abs(float(x.get("Calories", 0)) - target))
-                
-                # Store only required fields for the UI
-                plan[day][meal] = {
-                    "Recipe_title": best_match.get("Recipe_title"),
-                    "Calories": float(best_match.get("Calories", 0)),
-                    "total_time": best_match.get("total_time"),
-                    "Protein (g)": best_match.get("Protein (g)"),
-                    "Region": best_match.get("Region"),
-                    "Sub_region": best_match.get("Sub_region"),
-                    "ingredients": best_match.get("ingredients"),
-                    "instructions": best_match.get("instructions"),
-                    "_id": best_match.get("_id")
-                }
-                used_ids.add(best_match.get("_id"))
+        for event, data in self.stream_weekly_plan(
+                daily_calories, diet_type, max_time, region, protein_goal,
+                min_calories, max_calories, servings, per_serving, days, meals_per_day, focus,
+                meal_split, repeat_gap_days, deadline):
+            if event == "day":
+                plan[data["day"]] = data["meals"]
+        return plan
 
+    # ------------------------------
+    # Streaming variant: (event, data) pairs as the plan is built
+    # ------------------------------
+    def stream_weekly_plan(self, daily_calories, diet_type="any", max_time=None, region=None, protein_goal=None,
+                           min_calories=None, max_calories=None, servings=None, per_serving=False,
+                           days=7, meals_per_day=3, focus="Balanced", meal_split=None, repeat_gap_days=None,
+                           deadline=None):
+        """
+        Yields ("relaxed", {...}) for every dropped filter, ("pool", {...}) once,
+        then ("day", {...}) and ("progress", {...}) per day, and finally ("done", {...}).
+        A `deadline` (see deadline.py) is checked after the pool and after every day; once it
+        expires no further days are planned, and "done" reports partial=True and the stage.
+        """
+        deadline = deadline or Deadline()
+        # Get the recipe pool based on constraints (calorie-sorted inside the planner)
+        planner, relaxed = self.candidate_planner(diet_type, max_time, region, protein_goal,
+                                                  min_calories, max_calories, servings, per_serving)
+        print(f"📊 Filtering complete. Final pool size: {len(planner)}")
+
+        for name in relaxed:
+            yield "relaxed", {"filter": name}
+        yield "pool", {"size": len(planner)}
+
+        # Shared planning engine (also used by the Streamlit diet chart)
+        completed = 0
+        days_left = planner.iter_days(daily_calories, days, meals_per_day, focus, meal_split, repeat_gap_days)
+        for day, meals in () if deadline.check("pool") else days_left:
+            completed += 1
+            # Store only required fields for the UI
+            yield "day", {"day": day, "meals": {meal: plan_entry(r) for meal, r in meals.items()}}
+            yield "progress", {"completed": completed, "total": days}
+            if completed < days and deadline.check("plan"):
+                break
+
+        yield "done", {"days": completed, **planner.last_stats,
+                       "partial": deadline.partial, "stopped_at": deadline.stopped_at}
+
+    # ------------------------------
+    # MULTI-USER PLAN (one global no-repeat constraint)
+    # ------------------------------
+    def generate_household_plan(self, members, diet_type="any", max_time=None, region=None, protein_goal=None,
+                                days=28, repeat_gap_days=None):
+        """
+        `members` maps a name to {daily_calories, meals_per_day, focus, meal_split}.
+        Returns {name: {day: {meal: entry}}}; no recipe repeats across members within the gap.
+        """
+        planner, _ = self.candidate_planner(diet_type, max_time, region, protein_goal)
+        print(f"📊 Filtering complete. Final pool size: {len(planner)}")
+
+        plan = {name: {} for name in members}
+        for day, planned in planner.iter_household(members, days, repeat_gap_days):
+            for name, meals in planned.items():
+                plan[name][day] = {meal: plan_entry(r) for meal, r in meals.items()}
         return plan
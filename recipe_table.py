@@ -0,0 +1,295 @@
+"""
+Compact in-memory recipe storage.
+
+RecipeService used to keep one dict per recipe, so every row repeated the same 20+ key strings
+and its own copy of values like "Rest Africa", "AllRecipes" or "0.0". RecipeTable stores the
+catalog column by column instead:
+
+- dictionary columns (Region, Source, diet flags, small-integer times...) keep each distinct
+  value once and a 4-byte code per row;
+- token columns (`||`-delimited Utensils / Processes / ingredients) keep each distinct token
+  once and the row's token codes in one flat array (CSR offsets + codes);
+- everything else (ids, titles, nutrient strings) is a plain list.
+
+Rows are read through RecipeRow, a read-only Mapping view, so `r.get("Calories")`, `r["Region"]`
+and `dict(r)` behave exactly like the dicts they replace.
+"""
+import bisect
+from array import array
+from collections.abc import Mapping, Sequence
+from itertools import accumulate
+
+from recipe_index import DIET_FLAGS
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+DICTIONARY_FIELDS = [
+    "Region", "Sub_region", "Continent", "Source",
+    "servings", "cook_time", "prep_time", "total_time",
+    *DIET_FLAGS,
+]
+
+TOKEN_FIELDS = ["Utensils", "Processes", "ingredients"]
+TOKEN_SEPARATOR = "||"
+
+
+class _Missing:
+    """Marks a key the row does not have."""
+
+    def __repr__(self):
+        return "<missing>"
+
+
+_MISSING = _Missing()
+_OVERFLOW = 1 # dictionary code for values kept per row (unhashable, e.g. lists)
+
+
+def _kept_spans(drop, rows):
+    """[start, end) runs of rows that survive deleting the sorted positions `drop`."""
+    spans, start = [], 0
+    for p in drop:
+        if p > start:
+            spans.append((start, p))
+        start = p + 1
+    if start < rows:
+        spans.append((start, rows))
+    return spans
+
+
+def _shift_keys(by_row, drop):
+    """Re-key a {row: value} dict after deleting the sorted positions `drop`."""
+    gone = set(drop)
+    return {i - bisect.bisect_left(drop, i): v for i, v in by_row.items() if i not in gone}
+
+
+# ------------------------------
+# Columns
+# ------------------------------
+class _PlainColumn:
+    def __init__(self, rows=0):
+        self.values = [_MISSING] * rows
+
+    def append(self, value):
+        self.values.append(value)
+
+    def set(self, i, value):
+        self.values[i] = value
+
+    def get(self, i):
+        return self.values[i]
+
+    def without(self, drop, spans):
+        column = _PlainColumn()
+        for start, end in spans:
+            column.values += self.values[start:end]
+        return column
+
+
+class _DictionaryColumn:
+    def __init__(self, rows=0):
+        self.dictionary = [_MISSING, None] # codes 0 (missing) and 1 (_OVERFLOW) are reserved
+        self.lookup = {}
+        self.codes = array("I", bytes(4 * rows))
+        self.overflow = {} # row -> value that cannot be a dictionary key
+
+    def encode(self, value):
+        key = (type(value), value) # keeps "1", 1 and 1.0 apart
+        code = self.lookup.get(key)
+        if code is None:
+            code = self.lookup[key] = len(self.dictionary)
+            self.dictionary.append(value)
+        return code
+
+    def append(self, value):
+        if value is _MISSING:
+            self.codes.append(0)
+            return
+        try:
+            self.codes.append(self.encode(value))
+        except TypeError:
+            self.overflow[len(self.codes)] = value
+            self.codes.append(_OVERFLOW)
+
+    def set(self, i, value):
+        self.overflow.pop(i, None)
+        if value is _MISSING:
+            self.codes[i] = 0
+            return
+        try:
+            self.codes[i] = self.encode(value)
+        except TypeError:
+            self.overflow[i] = value
+            self.codes[i] = _OVERFLOW
+
+    def get(self, i):
+        code = self.codes[i]
+        if code == _OVERFLOW:
+            return self.overflow[i]
+        return self.dictionary[code]
+
+    def without(self, drop, spans):
+        column = _DictionaryColumn()
+        column.dictionary = list(self.dictionary)
+        column.lookup = dict(self.lookup)
+        for start, end in spans:
+            column.codes += self.codes[start:end]
+        column.overflow = _shift_keys(self.overflow, drop)
+        return column
+
+
+class _TokenColumn:
+    def __init__(self, rows=0):
+        self.tokens = [] # code -> token
+        self.lookup = {}
+        self.offsets = array("I", [0] * (rows + 1))
+        self.codes = array("I")
+        self.special = dict.fromkeys(range(rows), _MISSING) # rows that are not a string
+
+    def append(self, value):
+        if isinstance(value, str):
+            for token in value.split(TOKEN_SEPARATOR):
+                code = self.lookup.get(token)
+                if code is None:
+                    code = self.lookup[token] = len(self.tokens)
+                    self.tokens.append(token)
+                self.codes.append(code)
+        else:
+            self.special[len(self.offsets) - 1] = value
+        self.offsets.append(len(self.codes))
+
+    def set(self, i, value):
+        # CSR rows cannot grow in place; updated rows are kept verbatim
+        self.special[i] = value
+
+    def get(self, i):
+        if i in self.special:
+            return self.special[i]
+        tokens = self.tokens
+        return TOKEN_SEPARATOR.join([tokens[c] for c in self.codes[self.offsets[i]:self.offsets[i + 1]]])
+
+    def without(self, drop, spans):
+        column = _TokenColumn()
+        column.tokens = list(self.tokens)
+        column.lookup = dict(self.lookup)
+        offsets, lengths = self.offsets, []
+        for start, end in spans:
+            column.codes += self.codes[offsets[start]:offsets[end]]
+            lengths += [offsets[i + 1] - offsets[i] for i in range(start, end)]
+        column.offsets = array("I", accumulate(lengths, initial=0))
+        column.special = _shift_keys(self.special, drop)
+        return column
+
+
+def _new_column(field, rows):
+    if field in TOKEN_FIELDS:
+        return _TokenColumn(rows)
+    if field in DICTIONARY_FIELDS:
+        return _DictionaryColumn(rows)
+    return _PlainColumn(rows)
+
+
+# ------------------------------
+# Row view
+# ------------------------------
+class RecipeRow(Mapping):
+    """Read-only dict-like view of one row of a RecipeTable."""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        column = self._table.columns.get(key)
+        if column is None:
+            return default
+        value = column.get(self._row)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        for key, column in self._table.columns.items():
+            if column.get(self._row) is not _MISSING:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"RecipeRow({dict(self)!r})"
+
+
+# ------------------------------
+# RECIPE TABLE
+# ------------------------------
+class RecipeTable(Sequence):
+    """List-like catalog of recipes: append() dicts in, get RecipeRow views out."""
+
+    def __init__(self, recipes=()):
+        self.columns = {}
+        self._size = 0
+        self.extend(recipes)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [RecipeRow(self, j) for j in range(*i.indices(self._size))]
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError("recipe index out of range")
+        return RecipeRow(self, i)
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield RecipeRow(self, i)
+
+    def append(self, recipe):
+        for key in recipe:
+            if key not in self.columns:
+                self.columns[key] = _new_column(key, self._size)
+        for key, column in self.columns.items():
+            column.append(recipe.get(key, _MISSING))
+        self._size += 1
+
+    def extend(self, recipes):
+        for recipe in recipes:
+            self.append(recipe)
+
+    def __setitem__(self, i, recipe):
+        """Replace row i in place (keys absent from `recipe` become missing)."""
+        row = self[i]._row
+        for key in recipe:
+            if key not in self.columns:
+                self.columns[key] = _new_column(key, self._size)
+        for key, column in self.columns.items():
+            column.set(row, recipe.get(key, _MISSING))
+
+    def without(self, positions):
+        """
+        A copy without the rows at `positions`. Columns are copied in slices (codes stay encoded),
+        and rows read from this table are unaffected.
+        """
+        drop = sorted(set(positions))
+        spans = _kept_spans(drop, self._size)
+        table = RecipeTable()
+        table.columns = {key: column.without(drop, spans) for key, column in self.columns.items()}
+        table._size = self._size - len(drop)
+        return table
+
+    def to_dicts(self):
+        """Plain dicts, e.g. for json.dump."""
+        return [dict(row) for row in self]
@@ -0,0 +1,374 @@
+"""
+Scatter-gather search over recipe shards served by local worker processes.
+
+    shards = ShardedSearch.from_cache("recipes_cache.json", shards=4).start()
+    recipes, stats = shards.search("spicy chicken curry", top_k=20)
+    matches, stats = shards.find(user_entities, "spicy chicken curry", top_k=20)
+    shards.stop()
+
+Recipes are assigned to a shard by hashing Recipe_id (`_id` when missing). Every shard lives in
+its own process with its own indexes (HybridSearcher, EntityIndex), so CPU and index memory are
+split N ways. The coordinator sends each query to all shards at once over local pipes, waits up
+to SHARD_TIMEOUT for the answers, and merges the per-shard top-k lists by score; stats report
+per-shard latency and any shard that failed or timed out (its results are simply missing).
+A worker that dies is restarted in the background from the attached service's recipes (or the
+cache file); queries skip it meanwhile, and the changes it missed are replayed before it rejoins.
+
+Shard scores use the shard's own statistics (BM25 idf, RRF ranks), so the merged /search ranking
+is the usual scatter-gather approximation of a single index. find() without a query ranks by
+absolute entity scores and merges exactly.
+"""
+import hashlib
+import heapq
+import json
+import multiprocessing
+import threading
+import time
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+DEFAULT_SHARDS = 4
+SHARD_TIMEOUT = 5.0 # seconds a query waits for the slowest shard
+START_TIMEOUT = 120.0 # seconds for a worker to import its modules and build its indexes
+
+
+def shard_of(recipe, shards):
+    """Shard number of a recipe: a stable hash of its Recipe_id (or `_id`)."""
+    key = str(recipe.get("Recipe_id") or recipe.get("_id") or "")
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big") % shards
+
+
+def _key(recipe):
+    return recipe.get("_id") or recipe.get("Recipe_id")
+
+
+# ------------------------------
+# Worker side
+# ------------------------------
+class _Shard:
+    """One shard's recipes and indexes. New recipes are indexed incrementally; edits and removals rebuild lazily."""
+
+    def __init__(self, recipes):
+        self.rows = []
+        self.positions = {} # key -> row
+        self._searcher = None
+        self.upsert(recipes)
+
+    def _invalidate(self):
+        self._searcher = self._frame = self._entity_index = None
+
+    def upsert(self, recipes):
+        start = len(self.rows)
+        for r in recipes:
+            key = _key(r) or f"#{len(self.rows)}"
+            pos = self.positions.get(key)
+            if pos is None:
+                self.positions[key] = len(self.rows)
+                self.rows.append(r)
+            else:
+                self.rows[pos] = r
+                self._invalidate()
+
+        self._frame = self._entity_index = None
+        if self._searcher is not None and len(self.rows) > start:
+            for index in (self._searcher.lexical, self._searcher.semantic):
+                index.add_rows(self.rows[start:], start)
+                index.size = len(self.rows)
+        return len(self.rows)
+
+    def remove(self, keys):
+        drop = {self.positions[key] for key in keys if key in self.positions}
+        if drop:
+            self.rows = [r for i, r in enumerate(self.rows) if i not in drop]
+            self.positions = {_key(r) or f"#{i}": i for i, r in enumerate(self.rows)}
+            self._invalidate()
+        return len(self.rows)
+
+    def searcher(self):
+        if self._searcher is None:
+            from hybrid_search import HybridSearcher
+            self._searcher = HybridSearcher(self.rows) # shares self.rows, so appended rows are visible
+        return self._searcher
+
+    def search(self, query, top_k, user_entities, budgets_ms=None):
+        ranked, stats = self.searcher().search(query, top_k, user_entities, budgets_ms=budgets_ms)
+        return [{**self.rows[row], "Score": score} for row, score in ranked], stats
+
+    def find(self, user_entities, query, top_k):
+        import pandas as pd
+
+        from recipe_finder import find_matching_recipes
+        from topk_engine import EntityIndex
+
+        if self._frame is None:
+            self._frame = pd.DataFrame(self.rows)
+            self._entity_index = EntityIndex.from_frame(self._frame)
+        if not len(self._frame):
+            return [], {}
+        matches = find_matching_recipes(self._frame, user_entities, query, top_k,
+                                        searcher=self.searcher() if query else None,
+                                        entity_index=self._entity_index)
+        return matches, {}
+
+
+def _serve(conn, shard, shards, cache_file, recipes):
+    """Worker process: load this shard's recipes, then answer (request_id, method, args) messages."""
+    if cache_file:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        recipes = [r for r in data.get("recipes", []) if shard_of(r, shards) == shard]
+        del data # only this shard's rows stay in memory
+    state = _Shard(recipes)
+    state.searcher() # build the lexical index before taking queries
+    conn.send(("ready", len(state.rows)))
+
+    while True:
+        try:
+            request_id, method, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        if method == "stop":
+            return
+        start = time.perf_counter()
+        try:
+            result, ok = getattr(state, method)(*args), True
+        except Exception as e:
+            result, ok = repr(e), False
+        conn.send((request_id, ok, result, (time.perf_counter() - start) * 1000))
+
+
+# ------------------------------
+# COORDINATOR
+# ------------------------------
+class ShardedSearch:
+    def __init__(self, recipes=None, shards=DEFAULT_SHARDS, cache_file=None, timeout=SHARD_TIMEOUT):
+        self.shards = shards
+        self.timeout = timeout
+        self.cache_file = cache_file # workers load their own rows from it (recipes is then ignored)
+        self._recipes = None if cache_file else list(recipes or [])
+        self._connections = []
+        self._processes = []
+        self.sizes = []
+        self._lock = threading.Lock() # one scatter / gather on the pipes at a time
+        self._request_id = 0
+        self._unsubscribe = None
+        self._service = None
+        self._restarting = {} # shard -> [(method, args)] updates to replay once its worker is back
+
+    @classmethod
+    def from_cache(cls, cache_file, shards=DEFAULT_SHARDS, timeout=SHARD_TIMEOUT):
+        return cls(shards=shards, cache_file=cache_file, timeout=timeout)
+
+    # ------------------------------
+    # Lifecycle
+    # ------------------------------
+    def _spawn(self, shard, recipes, cache_file=None):
+        context = multiprocessing.get_context("spawn") # safe with the API's threads
+        parent, child = context.Pipe()
+        process = context.Process(target=_serve, args=(child, shard, self.shards, cache_file, recipes),
+                                  name=f"recipe-shard-{shard}", daemon=True)
+        process.start()
+        child.close()
+        return parent, process
+
+    def start(self):
+        parts = [[] for _ in range(self.shards)]
+        for r in self._recipes or ():
+            parts[shard_of(r, self.shards)].append(dict(r))
+        self._recipes = None
+
+        for shard in range(self.shards):
+            parent, process = self._spawn(shard, parts[shard], self.cache_file)
+            self._connections.append(parent)
+            self._processes.append(process)
+
+        for shard, conn in enumerate(self._connections):
+            if not conn.poll(START_TIMEOUT):
+                self.stop()
+                raise RuntimeError(f"Shard {shard} did not start within {START_TIMEOUT:.0f}s")
+            self.sizes.append(conn.recv()[1])
+        print(f"🧩 {self.shards} search shards ready ({', '.join(map(str, self.sizes))} recipes)")
+        return self
+
+    def stop(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        for conn in self._connections:
+            try:
+                conn.send((0, "stop", ()))
+            except (OSError, ValueError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._connections:
+            conn.close()
+        self._connections, self._processes = [], []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ------------------------------
+    # Scatter / gather
+    # ------------------------------
+    def _scatter(self, method, args_by_shard):
+        """Send to every shard in `args_by_shard` at once, then collect. Returns ({shard: result}, stats)."""
+        results, stats = {}, {"shards": [], "failed": []}
+        with self._lock:
+            self._request_id += 1
+            request_id = self._request_id
+            sent = time.perf_counter()
+            live = {}
+            for shard, args in args_by_shard.items():
+                if shard in self._restarting:
+                    self._missed(shard, method, args)
+                    down = self._restarting[shard] is None
+                    stats["failed"].append({"shard": shard, "error": "down" if down else "restarting"})
+                    continue
+                try:
+                    self._connections[shard].send((request_id, method, args))
+                    live[shard] = args
+                except (BrokenPipeError, EOFError, OSError) as e:
+                    self._lost(shard, method, args, e, stats)
+
+            deadline = sent + self.timeout
+            for shard, args in live.items():
+                conn = self._connections[shard]
+                while True:
+                    try:
+                        if not conn.poll(max(deadline - time.perf_counter(), 0)):
+                            stats["failed"].append({"shard": shard, "error": "timeout"})
+                            break
+                        reply_id, ok, result, worker_ms = conn.recv()
+                    except (BrokenPipeError, EOFError, OSError) as e:
+                        self._lost(shard, method, args, e, stats)
+                        break
+                    if reply_id != request_id:
+                        continue # late answer to a query that already timed out
+                    if ok:
+                        results[shard] = result
+                    else:
+                        stats["failed"].append({"shard": shard, "error": result})
+                    stats["shards"].append({"shard": shard, "ms": round(worker_ms, 3),
+                                            "roundtrip_ms": round((time.perf_counter() - sent) * 1000, 3)})
+                    break
+        return results, stats
+
+    # ------------------------------
+    # Dead workers
+    # ------------------------------
+    def _missed(self, shard, method, args):
+        if method in ("upsert", "remove") and self._restarting.get(shard) is not None:
+            self._restarting[shard].append((method, args))
+
+    def _lost(self, shard, method, args, error, stats):
+        """A worker's pipe broke (the process died): skip it from now on and restart it."""
+        stats["failed"].append({"shard": shard, "error": f"worker died ({type(error).__name__})"})
+        self._restarting[shard] = []
+        self._missed(shard, method, args)
+        print(f"⚠️ Search shard {shard} died. Restarting it in the background.")
+        threading.Thread(target=self._respawn, args=(shard,), name=f"recipe-shard-{shard}-restart",
+                         daemon=True).start()
+
+    def _shard_recipes(self, shard):
+        """This shard's current rows (the worker reads the cache file itself when there is no service)."""
+        if self._service is None:
+            return None if self.cache_file else False
+        return [dict(r) for r in list(self._service.recipes) if shard_of(r, self.shards) == shard]
+
+    def _respawn(self, shard):
+        recipes = self._shard_recipes(shard)
+        if recipes is False:
+            print(f"⚠️ Search shard {shard} cannot be restarted (no service or cache file to load it from)")
+            self._restarting[shard] = None # stays out of every query
+            return
+
+        conn, process = self._spawn(shard, recipes or [], self.cache_file if recipes is None else None)
+        try:
+            if not conn.poll(START_TIMEOUT):
+                raise RuntimeError(f"no answer within {START_TIMEOUT:.0f}s")
+            size = conn.recv()[1]
+            with self._lock:
+                if not self._connections: # stopped meanwhile
+                    raise RuntimeError("search stopped")
+                for method, args in self._restarting[shard]: # updates sent while it was down
+                    conn.send((0, method, args))
+                    _, ok, result, _ = conn.recv()
+                    size = result if ok else size
+                old_conn, old_process = self._connections[shard], self._processes[shard]
+                self._connections[shard], self._processes[shard] = conn, process
+                self.sizes[shard] = size
+                del self._restarting[shard]
+        except Exception as e:
+            print(f"⚠️ Search shard {shard} restart failed: {e}")
+            self._restarting[shard] = None
+            process.terminate()
+            conn.close()
+            return
+
+        old_conn.close()
+        old_process.join(timeout=5)
+        print(f"🧩 Search shard {shard} restarted ({size} recipes)")
+
+    def _merge(self, method, args, top_k):
+        results, stats = self._scatter(method, {shard: args for shard in range(self.shards)})
+        start = time.perf_counter()
+        for entry in stats["shards"]:
+            entry["stages"] = results.get(entry["shard"], (None, {}))[1].get("stages", {})
+        merged = heapq.nlargest(top_k, (r for rows, _ in results.values() for r in rows), key=lambda r: r["Score"])
+        stats["merge_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return merged, stats
+
+    def search(self, query, top_k=20, user_entities=None, budgets_ms=None):
+        """Hybrid search on every shard; ([recipe with "Score"], stats with per-shard latency)."""
+        if user_entities is None:
+            from ner_foodoscope import rule_based_ner
+            user_entities = rule_based_ner(query)
+        return self._merge("search", (query, top_k, user_entities, budgets_ms), top_k)
+
+    def find(self, user_entities, query=None, top_k=20):
+        """find_matching_recipes() on every shard, merged by Score."""
+        return self._merge("find", (user_entities, query, top_k), top_k)
+
+    # ------------------------------
+    # Updates
+    # ------------------------------
+    def upsert(self, recipes):
+        parts = {}
+        for r in recipes:
+            parts.setdefault(shard_of(r, self.shards), []).append(dict(r))
+        sizes, _ = self._scatter("upsert", {shard: (rows,) for shard, rows in parts.items()})
+        for shard, size in sizes.items():
+            self.sizes[shard] = size
+
+    def remove(self, keys):
+        # Only `_id`s are known for removed recipes, not their shard
+        sizes, _ = self._scatter("remove", {shard: (list(keys),) for shard in range(self.shards)})
+        for shard, size in sizes.items():
+            self.sizes[shard] = size
+
+    def attach(self, service):
+        """Forward a RecipeService's change feed (added / updated / removed recipes) to the shards."""
+        def forward(change):
+            changed = [service.recipes[service.position(rid)] for rid in change.added_ids + change.updated_ids
+                       if service.position(rid) is not None]
+            if changed:
+                self.upsert(changed)
+            if change.removed_ids:
+                self.remove(change.removed_ids)
+        self._service = service
+        self._unsubscribe = service.subscribe(forward)
+        return self
+
+    def status(self):
+        return {"shards": self.shards, "sizes": self.sizes,
+                "alive": [process.is_alive() for process in self._processes],
+                "restarting": sorted(s for s, pending in self._restarting.items() if pending is not None),
+                "down": sorted(s for s, pending in self._restarting.items() if pending is None)}
@@ -0,0 +1,168 @@
+"""
+Precomputed k-nearest-neighbour graph over recipes, for instant meal swaps.
+
+    graph = SimilarityGraph.build(recipes)          # offline: python preflight.py warmup
+    graph.save(SIMILARITY_GRAPH_FILE)
+    graph = SimilarityGraph.load(SIMILARITY_GRAPH_FILE)
+    for recipe_id, distance in graph.neighbors("6405721fa13d0d2d35890df3"): ...
+
+Each recipe is a feature vector of its standardised nutrients (Calories, Protein, fat, carbs;
+nutrient totals per serving, log-scaled) and its title embedding. The K nearest recipes by
+Euclidean distance are found once by a blocked brute-force scan and stored as an int32
+adjacency array (row -> K neighbour rows, nearest first) plus float16 distances, so a lookup is
+O(K) and independent of catalog size. Rows are keyed by recipe `_id`, so the graph stays usable
+while the live catalog grows; recipes added after the build have no neighbours until the next one.
+"""
+import os
+
+from recipe_index import RANGE_COLUMNS
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+SIMILARITY_GRAPH_FILE = os.path.join("artifacts", "similarity_graph.npz")
+
+GRAPH_NEIGHBORS = 32 # K stored per recipe; a swap request can ask for at most this many alternatives
+
+# (RANGE_COLUMNS key, divide by servings): Calories is already per serving in RecipeDB
+NUTRIENT_COLUMNS = [("calories", False), ("protein", True), ("fat", True), ("carbs", True)]
+
+NUTRIENT_WEIGHT = 1.0 # weight of the (unit-variance) nutrient block
+TITLE_WEIGHT = 1.0 # weight of the (unit-length) title embedding
+BLOCK_ELEMENTS = 1 << 24 # distance matrix entries computed per block (~64 MB of float32)
+
+
+def _float(value):
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if f != f else f
+
+
+def _nutrients(r):
+    servings = _float(r.get("servings"))
+    values = []
+    for key, per_serving in NUTRIENT_COLUMNS:
+        v = _float(r.get(RANGE_COLUMNS[key]))
+        if v is not None and per_serving and servings:
+            v /= servings
+        values.append(v)
+    return values
+
+
+def nutrient_matrix(recipes):
+    """(rows, 4) float32: log1p nutrients standardised per column; missing values sit at the mean (0)."""
+    import numpy as np
+
+    raw = np.array([[np.nan if v is None else v for v in _nutrients(r)] for r in recipes],
+                   dtype=np.float64).reshape(len(recipes), len(NUTRIENT_COLUMNS))
+    logged = np.log1p(np.clip(raw, 0, None))
+    mean = np.nanmean(logged, axis=0) if len(recipes) else 0
+    std = np.nanstd(logged, axis=0) if len(recipes) else 1
+    z = (logged - mean) / np.where(std > 0, std, 1)
+    return np.nan_to_num(z, nan=0.0).astype(np.float32)
+
+
+def feature_matrix(recipes, title_vectors=None):
+    """Nutrient block (scaled to unit expected norm) next to the title embeddings, if any."""
+    import numpy as np
+
+    nutrients = nutrient_matrix(recipes) * (NUTRIENT_WEIGHT / np.sqrt(len(NUTRIENT_COLUMNS)))
+    if title_vectors is None:
+        return nutrients
+    return np.hstack([nutrients, np.asarray(title_vectors, dtype=np.float32) * TITLE_WEIGHT])
+
+
+def nearest_neighbors(features, k=GRAPH_NEIGHBORS, block_elements=BLOCK_ELEMENTS):
+    """(neighbors int32 (rows, k), distances float32) by blocked brute force; -1 pads short rows."""
+    import numpy as np
+
+    n = len(features)
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    distances = np.full((n, k), np.inf, dtype=np.float32)
+    width = min(k, n - 1)
+    if width <= 0:
+        return neighbors, distances
+
+    norms = np.einsum("ij,ij->i", features, features)
+    block = max(block_elements // n, 1)
+    for start in range(0, n, block):
+        end = min(start + block, n)
+        d = norms[start:end, None] + norms[None, :] - 2 * (features[start:end] @ features.T)
+        d[np.arange(end - start), np.arange(start, end)] = np.inf # not its own neighbour
+        best = np.argpartition(d, width - 1, axis=1)[:, :width]
+        best_d = np.take_along_axis(d, best, axis=1)
+        order = np.argsort(best_d, axis=1, kind="stable")
+        neighbors[start:end, :width] = np.take_along_axis(best, order, axis=1)
+        distances[start:end, :width] = np.sqrt(np.maximum(np.take_along_axis(best_d, order, axis=1), 0))
+    return neighbors, distances
+
+
+# ------------------------------
+# SIMILARITY GRAPH
+# ------------------------------
+class SimilarityGraph:
+    def __init__(self, ids, neighbors, distances, titles_embedded=False):
+        self.ids = list(ids)
+        self.rows = {rid: i for i, rid in enumerate(self.ids) if rid}
+        self.neighbor_rows = neighbors # int32 (rows, K)
+        self.distances = distances # float16 (rows, K)
+        self.titles_embedded = titles_embedded
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, recipe_id):
+        return recipe_id in self.rows
+
+    @classmethod
+    def build(cls, recipes, k=GRAPH_NEIGHBORS, use_titles=True):
+        """Offline build from recipe dicts; falls back to nutrients only when no encoder is available."""
+        import numpy as np
+
+        recipes = list(recipes)
+        title_vectors = None
+        if use_titles and recipes:
+            try:
+                from recipe_finder import title_embeddings
+                titles = [r.get("Recipe_title") if isinstance(r.get("Recipe_title"), str) else "" for r in recipes]
+                named = [t for t in dict.fromkeys(titles) if t]
+                vectors = dict(zip(named, title_embeddings(named))) if named else {}
+                dim = len(next(iter(vectors.values()))) if vectors else 0
+                zero = np.zeros(dim, dtype=np.float32)
+                title_vectors = np.stack([vectors.get(t, zero) for t in titles]) if dim else None
+            except Exception as e:
+                print(f"⚠️ Title embeddings unavailable ({e}). Building the similarity graph from nutrients only.")
+
+        neighbors, distances = nearest_neighbors(feature_matrix(recipes, title_vectors), k)
+        return cls([r.get("_id") or "" for r in recipes], neighbors, distances.astype(np.float16),
+                   titles_embedded=title_vectors is not None)
+
+    def save(self, path=SIMILARITY_GRAPH_FILE):
+        import numpy as np
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, ids=np.array(self.ids, dtype=str), neighbors=self.neighbor_rows,
+                 distances=self.distances, titles_embedded=np.array(self.titles_embedded))
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, path=SIMILARITY_GRAPH_FILE):
+        """The saved graph, or None when it has not been built yet."""
+        if not os.path.exists(path):
+            return None
+        import numpy as np
+
+        data = np.load(path, allow_pickle=False)
+        return cls([str(rid) for rid in data["ids"]], data["neighbors"], data["distances"],
+                   bool(data["titles_embedded"]))
+
+    def neighbors(self, recipe_id):
+        """[(recipe_id, distance)] nearest first; [] for a recipe the graph does not know."""
+        row = self.rows.get(recipe_id)
+        if row is None:
+            return []
+        return [(self.ids[n], float(d)) for n, d in zip(self.neighbor_rows[row].tolist(), self.distances[row].tolist())
+                if n >= 0]
@@ -0,0 +1,76 @@
+"""
+Request coalescing ("single flight") for expensive API calls.
+
+Bursts of identical /search or /generate-diet-plan requests used to run the same filter and
+planner work once each. With SingleFlight, the first request for a key computes the result and
+every identical request that arrives while it is running waits for that computation and gets the
+same result (or the same exception) instead of starting its own.
+
+    flights = SingleFlight()
+    payload = flights.do("search", key, compute)              # threadpool (sync def) handlers
+    payload = await flights.do_async("search", key, compute)  # async def handlers
+
+A key is only shared while its computation is in flight; nothing is cached afterwards (the
+ETag / 304 path in api.py covers repeats). Keys should include the recipe snapshot version, so a
+request never receives a result computed from an older catalog.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {} # key -> Future of the running computation
+        self._stats = defaultdict(lambda: {"executed": 0, "coalesced": 0, "errors": 0})
+
+    def _join(self, endpoint, key):
+        """(future, leader): the running flight for `key`, or a new one this caller must run."""
+        with self._lock:
+            future = self._flights.get((endpoint, key))
+            if future is not None:
+                self._stats[endpoint]["coalesced"] += 1
+                return future, False
+            future = self._flights[(endpoint, key)] = Future()
+            self._stats[endpoint]["executed"] += 1
+            return future, True
+
+    def _finish(self, endpoint, key, future, compute):
+        try:
+            future.set_result(compute())
+        except BaseException as e:
+            with self._lock:
+                self._stats[endpoint]["errors"] += 1
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._flights.pop((endpoint, key), None)
+
+    def do(self, endpoint, key, compute):
+        """compute() once per concurrent burst of `key`; blocks until the result is ready."""
+        future, leader = self._join(endpoint, key)
+        if leader:
+            self._finish(endpoint, key, future, compute)
+        return future.result()
+
+    async def do_async(self, endpoint, key, compute):
+        """Like do(), without blocking the event loop: compute() runs in the default executor."""
+        future, leader = self._join(endpoint, key)
+        if leader:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._finish, endpoint, key, future, compute)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        """Per endpoint: computations executed, requests coalesced onto one, failed computations."""
+        with self._lock:
+            in_flight = defaultdict(int)
+            for endpoint, _ in self._flights:
+                in_flight[endpoint] += 1
+            return {
+                endpoint: {**counts, "in_flight": in_flight[endpoint],
+                           "coalesced_ratio": round(counts["coalesced"] / ((counts["executed"] + counts["coalesced"]) or 1), 4)}
+                for endpoint, counts in self._stats.items()
+            }
@@ -0,0 +1,163 @@
+"""
+Utensil / process token index for equipment- and technique-based filters.
+
+`Utensils` and `Processes` are `||`-delimited strings in the cached catalog (the demo CSV has
+prose instructions instead). Each column is parsed once into interned token ids stored CSR-style:
+`values` holds every row's ids back to back and row i owns values[offsets[i]:offsets[i + 1]].
+A filter is an np.isin over `values` plus a segmented sum per row, so "must use oven",
+"no fryer" or "only stir/simmer" never loop over recipes in Python.
+"""
+import re
+
+import numpy as np
+
+from ner_foodoscope import SUPPORTED_PROCESSES, UTENSIL_TOKENS, base_form
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+# Handling steps that do not count against "only stir/simmer"
+GENERIC_PROCESSES = {
+    "add", "arrange", "bring", "combine", "cook", "cool", "cover", "divide", "drain", "garnish",
+    "heat", "ladle", "place", "pour", "preheat", "prepare", "put", "reduce", "remove", "return",
+    "season", "serve", "set", "sprinkle", "stand", "taste", "top", "transfer",
+}
+
+# METHOD_AVOID labels from the NER pipeline -> process tokens
+METHOD_AVOID_PROCESSES = {
+    "Fried": ["fry", "pan-fry", "deep-fry", "stir-fry"],
+    "Deep-fried": ["deep-fry", "fry"],
+}
+
+_WORD = re.compile(r"[a-z]+(?:-[a-z]+)*")
+
+
+def split_tokens(value, prose_vocab=None):
+    """
+    Tokens of one cell: a `||`-delimited string or a list. Free text (no delimiter) is scanned
+    for words whose base form is in `prose_vocab`, when given.
+    """
+    if isinstance(value, (list, tuple)):
+        parts = value
+    elif isinstance(value, str):
+        if "||" not in value and prose_vocab is not None:
+            words = (base_form(w, prose_vocab) for w in _WORD.findall(value.lower()))
+            return [w for w in words if w in prose_vocab]
+        parts = value.split("||")
+    else:
+        return []
+    return [p.strip().lower() for p in parts if isinstance(p, str) and p.strip()]
+
+
+# ------------------------------
+# CSR token column
+# ------------------------------
+class TokenCSR:
+    def __init__(self, column, prose_vocab=None):
+        vocab = {}
+        offsets = [0]
+        raw = []
+        for value in column:
+            for token in split_tokens(value, prose_vocab):
+                raw.append(vocab.setdefault(token, len(vocab)))
+            offsets.append(len(raw))
+
+        # Inflections share one id when their base form also occurs ("stirring" -> "stir")
+        canonical = np.array([vocab[base_form(t, vocab)] for t in vocab], dtype=np.int32)
+        self.names = list(vocab)
+        self.vocab = {t: int(canonical[i]) for t, i in vocab.items()}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.values = canonical[np.asarray(raw, dtype=np.int64)] if raw else np.zeros(0, dtype=np.int32)
+        self.lengths = np.diff(self.offsets)
+        self._starts = self.offsets[:-1][self.lengths > 0]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def token_id(self, token):
+        return self.vocab.get(base_form(token, self.vocab))
+
+    def ids(self, tokens):
+        """Ids of the known `tokens` (unknown tokens are dropped)."""
+        ids = {self.token_id(t) for t in tokens}
+        ids.discard(None)
+        return ids
+
+    def hits(self, ids):
+        """Per-row count of tokens whose id is in `ids`."""
+        counts = np.zeros(len(self), dtype=np.int64)
+        if not ids or not len(self.values):
+            return counts
+        matched = np.isin(self.values, list(ids)).astype(np.int64)
+        counts[self.lengths > 0] = np.add.reduceat(matched, self._starts)
+        return counts
+
+    # ------------------------------
+    # Row masks
+    # ------------------------------
+    def contains_all(self, tokens):
+        keep = np.ones(len(self), dtype=bool)
+        for token in tokens:
+            tid = self.token_id(token)
+            if tid is None: # nothing in the catalog uses it
+                return np.zeros(len(self), dtype=bool)
+            keep &= self.hits({tid}) > 0
+        return keep
+
+    def contains_none(self, tokens):
+        return self.hits(self.ids(tokens)) == 0
+
+    def only(self, tokens, ignore=()):
+        """Rows that use at least one of `tokens` and nothing outside `tokens` / `ignore`."""
+        allowed = self.ids(tokens)
+        if not allowed:
+            return np.zeros(len(self), dtype=bool)
+        return (self.hits(allowed) > 0) & (self.hits(allowed | self.ids(ignore)) == self.lengths)
+
+
+# ------------------------------
+# UTENSIL / PROCESS INDEX
+# ------------------------------
+class UtensilProcessIndex:
+    """Row-aligned with the DataFrame it was built from."""
+
+    ENTITY_KEYS = ("UTENSIL_REQUIRE", "UTENSIL_AVOID", "PROCESS_ONLY", "METHOD_AVOID")
+
+    def __init__(self, utensils, processes):
+        self.utensils = TokenCSR(utensils, prose_vocab=set(UTENSIL_TOKENS))
+        self.processes = TokenCSR(processes, prose_vocab=set(SUPPORTED_PROCESSES))
+
+    @classmethod
+    def from_frame(cls, df):
+        processes = df["Processes"].tolist() if "Processes" in df.columns else [None] * len(df)
+        utensils = df["Utensils"].tolist() if "Utensils" in df.columns else [None] * len(df)
+        # Rows without utensils but with prose instructions: read them from the text ("bake in the oven")
+        utensils = [
+            u if isinstance(u, (str, list)) else (p if isinstance(p, str) and "||" not in p else None)
+            for u, p in zip(utensils, processes)
+        ]
+        return cls(utensils, processes)
+
+    def __len__(self):
+        return len(self.processes)
+
+    @classmethod
+    def wants(cls, entities):
+        return any(entities.get(key) for key in cls.ENTITY_KEYS)
+
+    def mask(self, entities):
+        """Boolean row mask for the equipment / technique constraints in `entities`."""
+        keep = np.ones(len(self), dtype=bool)
+
+        if entities.get("UTENSIL_REQUIRE"):
+            keep &= self.utensils.contains_all(entities["UTENSIL_REQUIRE"])
+        if entities.get("UTENSIL_AVOID"):
+            keep &= self.utensils.contains_none(entities["UTENSIL_AVOID"])
+        if entities.get("PROCESS_ONLY"):
+            keep &= self.processes.only(entities["PROCESS_ONLY"], ignore=GENERIC_PROCESSES)
+
+        avoid = [p for label in entities.get("METHOD_AVOID") or [] for p in METHOD_AVOID_PROCESSES.get(label, [])]
+        if avoid:
+            keep &= self.processes.contains_none(avoid)
+        return keep
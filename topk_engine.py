@@ -0,0 +1,148 @@
+"""
+Early-terminating top-k selection with score upper bounds (MaxScore style).
+
+score_recipe() is a weighted count of matched entities (cuisine x5, flavor x3, method x2), so
+every recipe's best possible score is known from an inverted index over NER_ENTITIES before its
+row is decoded, filtered or scored. Recipes are grouped by that bound and visited best group
+first; a bounded heap keeps the k best seen so far, and once its k-th best score beats the bound
+of the next group, that group and every later one are skipped.
+
+In hybrid ranking the fused lexical / semantic part adds at most SCORE_SCALE points on top of
+the entity boost, so only recipes a retriever returned can exceed their group's entity bound.
+"""
+import heapq
+import json
+import math
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+ENTITY_WEIGHTS = {"CUISINE": 5, "FLAVOR": 3, "METHOD_PREFERENCE": 2} # as in score_recipe()
+
+
+# ------------------------------
+# Bounded heap
+# ------------------------------
+class TopK:
+    """The k best (score, item) pushed so far; on equal scores the lower `order` wins."""
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = [] # min-heap of (score, -order, item)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def threshold(self):
+        """Score a new entry must beat to get in (-inf until k entries are held)."""
+        if self.k <= 0:
+            return math.inf
+        return self._heap[0][0] if len(self._heap) >= self.k else -math.inf
+
+    def can_beat(self, bound):
+        return bound > self.threshold()
+
+    def push(self, score, order, item):
+        if self.k <= 0:
+            return
+        entry = (score, -order, item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self):
+        """[(item, score)] best first."""
+        return [(item, score) for score, _, item in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+
+# ------------------------------
+# Groups by upper bound
+# ------------------------------
+def bound_groups(positions, bounds, scale=1.0):
+    """[(bound * scale, positions)] best bound first; positions keep their order inside a group."""
+    import numpy as np
+
+    positions = np.asarray(positions, dtype=np.int64)
+    if not len(positions):
+        return []
+    values = bounds[positions]
+    order = np.argsort(-values, kind="stable")
+    positions, values = positions[order], values[order]
+
+    cuts = np.flatnonzero(np.diff(values)) + 1
+    starts = [0, *cuts.tolist()]
+    ends = [*cuts.tolist(), len(positions)]
+    return [(float(values[s]) * scale, positions[s:e]) for s, e in zip(starts, ends)]
+
+
+DEADLINE_CHECK_EVERY = 8 # rows scored between deadline checks (a row can cost a DataFrame lookup)
+
+
+def scan_groups(top, groups, score, deadline=None, stage="scan"):
+    """
+    Push the rows of `groups` (see bound_groups) into `top`, best group first, until no remaining
+    row can beat the k-th best. `score(row)` returns (score, item), or None for a row that fails
+    the filters. With a `deadline` (see deadline.py) the scan also stops when it expires, leaving
+    the best rows of the best groups in `top`. Returns counters: groups, groups scanned, rows scored.
+    """
+    stats = {"groups": len(groups), "groups_scanned": 0, "rows_scored": 0}
+    for bound, rows in groups:
+        if not top.can_beat(bound):
+            break
+        stats["groups_scanned"] += 1
+        for row in rows.tolist():
+            if not top.can_beat(bound):
+                break
+            if deadline is not None and stats["rows_scored"] % DEADLINE_CHECK_EVERY == 0 and deadline.check(stage):
+                stats["stopped"] = True
+                return stats
+            stats["rows_scored"] += 1
+            result = score(row)
+            if result is not None:
+                top.push(result[0], row, result[1])
+    return stats
+
+
+# ------------------------------
+# ENTITY INDEX
+# ------------------------------
+class EntityIndex:
+    """NER_ENTITIES of every row, parsed once, with (kind, value) -> rows postings for score bounds."""
+
+    def __init__(self, entities):
+        import numpy as np
+
+        self.entities = entities # row -> dict (None when the row has no entities)
+        postings = {}
+        for row, found in enumerate(entities):
+            if not isinstance(found, dict):
+                continue
+            for kind in ENTITY_WEIGHTS:
+                for value in set(found.get(kind) or []):
+                    postings.setdefault((kind, value), []).append(row)
+        self.postings = {key: np.array(rows, dtype=np.int64) for key, rows in postings.items()}
+
+    @classmethod
+    def from_frame(cls, df):
+        if "NER_ENTITIES" not in df.columns:
+            return cls([None] * len(df))
+        entities = []
+        for value in df["NER_ENTITIES"].tolist():
+            if isinstance(value, str):
+                value = json.loads(value)
+            entities.append(value if isinstance(value, dict) else None)
+        return cls(entities)
+
+    def scores(self, user_entities):
+        """score_recipe(row entities, user_entities) for every row, as one int array."""
+        import numpy as np
+
+        scores = np.zeros(len(self.entities), dtype=np.int32)
+        for kind, weight in ENTITY_WEIGHTS.items():
+            for value in set(user_entities.get(kind) or []):
+                rows = self.postings.get((kind, value))
+                if rows is not None:
+                    scores[rows] += weight
+        return scores
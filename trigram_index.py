@@ -0,0 +1,248 @@
+"""
+Character-trigram index for typo-tolerant lookup and autocomplete.
+
+The vocabulary is every word of every recipe title and canonical ingredient name. Each word is
+split into padded trigrams ("  f", " fa", "fal", ..., "al "), and each trigram lists the words
+containing it. A misspelling ("falafal") only needs to be compared with words that share enough
+trigrams with it (an edit destroys at most three), and those few candidates are verified with an
+edit distance that gives up as soon as it exceeds the bound. Word -> recipe rows are bitmaps, so
+multi-word suggestions are a handful of ANDs.
+"""
+import bisect
+import re
+
+from ingredient_index import canonical_ingredient, split_ingredients
+from recipe_index import DerivedIndex, bits_from_positions, drop_positions, iter_positions
+
+# ------------------------------
+# CONFIGURATION
+# ------------------------------
+
+MIN_FUZZY_LENGTH = 4 # shorter words must match exactly
+SUGGEST_COMPLETIONS = 50 # words a prefix may expand to
+
+_WORD = re.compile(r"[a-z]+")
+
+
+def max_distance(word):
+    """Edits tolerated for a query word of this length."""
+    if len(word) < MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if len(word) <= 7 else 2
+
+
+def trigrams(word, prefix=False):
+    padded = f"  {word}" if prefix else f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_distance(a, b, k):
+    """Levenshtein distance between a and b, or k + 1 as soon as it must exceed k."""
+    if abs(len(a) - len(b)) > k:
+        return k + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > k:
+            return k + 1
+        previous = current
+    return previous[-1] if previous[-1] <= k else k + 1
+
+
+# ------------------------------
+# TRIGRAM INDEX
+# ------------------------------
+class TrigramIndex(DerivedIndex):
+    name = "trigrams"
+
+    def clear(self):
+        self.words = [] # id -> word
+        self.word_ids = {}
+        self.word_rows = [] # id -> bitmap of rows using the word
+        self.grams = {} # trigram -> list of word ids
+        self._sorted = None # words in order, for prefix lookups (rebuilt lazily)
+
+    def _intern(self, word):
+        wid = self.word_ids.get(word)
+        if wid is None:
+            wid = self.word_ids[word] = len(self.words)
+            self.words.append(word)
+            self.word_rows.append(0)
+            for gram in trigrams(word):
+                self.grams.setdefault(gram, []).append(wid)
+        return wid
+
+    @staticmethod
+    def _row_words(r):
+        text = str(r.get("Recipe_title") or "")
+        text += " " + " ".join(canonical_ingredient(item) for item in split_ingredients(r.get("ingredients")))
+        return set(_WORD.findall(text.lower()))
+
+    def add_rows(self, rows, start):
+        positions = {}
+        for i, r in enumerate(rows, start):
+            for word in self._row_words(r):
+                positions.setdefault(self._intern(word), []).append(i)
+
+        for wid, rows_of_word in positions.items():
+            self.word_rows[wid] |= bits_from_positions(rows_of_word)
+        self._sorted = None
+
+    def fingerprint(self):
+        # Word ids follow first use, which edits change; compare by word (edits can leave unused words)
+        return {word: bits for word, bits in zip(self.words, self.word_rows) if bits}
+
+    def update_rows(self, positions, old_rows, new_rows):
+        for p, old, row in zip(positions, old_rows, new_rows):
+            for word in self._row_words(old):
+                wid = self.word_ids.get(word)
+                if wid is not None:
+                    self.word_rows[wid] &= ~(1 << p)
+            for word in self._row_words(row):
+                self.word_rows[self._intern(word)] |= 1 << p
+        self._sorted = None
+
+    def remove_rows(self, positions, old_rows):
+        self.word_rows = [drop_positions(bits, positions) for bits in self.word_rows]
+        self._sorted = None
+
+    def _used(self, word):
+        wid = self.word_ids.get(word)
+        return wid is not None and bool(self.word_rows[wid])
+
+    # ------------------------------
+    # Word lookups
+    # ------------------------------
+    def similar(self, word, k=None, limit=5, prefix=False):
+        """
+        [(word, distance)] within k edits, closest (then most used) first.
+        With `prefix`, `word` is compared with the start of each indexed word ("biri" ~ "biry...").
+        """
+        word = word.lower()
+        k = max_distance(word) if k is None else k
+        if self._used(word) and k == 0 and not prefix:
+            return [(word, 0)]
+
+        grams = trigrams(word, prefix)
+        counts = {}
+        for gram in grams:
+            for wid in self.grams.get(gram, ()):
+                counts[wid] = counts.get(wid, 0) + 1
+
+        needed = max(len(grams) - 3 * k, 1)
+        matches = []
+        for wid, shared in counts.items():
+            if shared < needed or not self.word_rows[wid]:
+                continue
+            candidate = self.words[wid]
+            distance = bounded_distance(word, candidate[:len(word)] if prefix else candidate, k)
+            if distance <= k:
+                matches.append((distance, -self.word_rows[wid].bit_count(), candidate))
+        matches.sort()
+        return [(candidate, distance) for distance, _, candidate in matches[:limit]] # limit=None: all
+
+    def completions(self, prefix, limit=SUGGEST_COMPLETIONS):
+        """Words starting with `prefix`, in alphabetical order (limit=None: all of them)."""
+        if self._sorted is None:
+            self._sorted = sorted(w for w, bits in zip(self.words, self.word_rows) if bits)
+        words = self._sorted
+        found = []
+        i = bisect.bisect_left(words, prefix)
+        while i < len(words) and words[i].startswith(prefix) and (limit is None or len(found) < limit):
+            found.append(words[i])
+            i += 1
+        return found
+
+    def correct(self, query):
+        """Replace unknown query words with their closest indexed word. Returns (query, {typo: fix})."""
+        fixes = {}
+        for word in set(_WORD.findall(query.lower())):
+            if self._used(word):
+                continue
+            similar = self.similar(word)
+            if similar:
+                fixes[word] = similar[0][0]
+
+        corrected = _WORD.sub(lambda m: fixes.get(m.group(0).lower(), m.group(0)), query)
+        return corrected, fixes
+
+    # ------------------------------
+    # Autocomplete
+    # ------------------------------
+    def _rows_for(self, words):
+        bits = 0
+        for word in words:
+            bits |= self.word_rows[self.word_ids[word]]
+        return bits
+
+    def _uses(self, word):
+        """How many rows use `word` (its document frequency)."""
+        return self.word_rows[self.word_ids[word]].bit_count()
+
+    def _levels(self, ranked):
+        """{word: rank} -> [(rank, bitmap of rows using a word of that rank)], best rank first."""
+        levels = {}
+        for word, rank in ranked.items():
+            levels[rank] = levels.get(rank, 0) | self.word_rows[self.word_ids[word]]
+        return sorted(levels.items())
+
+    def suggest_rows(self, text, limit=10):
+        """
+        Rows whose words cover `text`: every complete word (fuzzily) and the last word as a prefix
+        (or fuzzily, if no word starts with it). Best first: exact words, then fewer edits, then
+        words used by more recipes ("chik" -> chicken before chin), then completions closest in
+        length to the typed prefix; ties in catalog order.
+        """
+        words = _WORD.findall(text.lower())
+        if not words:
+            return []
+
+        *complete, last = words
+        if text[-1:].isspace(): # "chicken " -> "chicken" is a complete word
+            complete, last = words, None
+
+        bits = None
+        ranked = [] # per query word: {indexed word: (edits, -rows using it, letters past the typed prefix)}
+        for word in complete:
+            matched = {w: (d, -self._uses(w), 0) for w, d in self.similar(word)}
+            bits = self._rows_for(matched) if bits is None else bits & self._rows_for(matched)
+            ranked.append(matched)
+        if last is not None:
+            # Alone, the prefix only needs its most used words to fill `limit` rows; after other
+            # words it must expand fully, or the few rows they left could be missed
+            expand = SUGGEST_COMPLETIONS if bits is None else None
+            completions = sorted(self.completions(last, None), key=self._uses, reverse=True)[:expand]
+            matched = {w: (0, -self._uses(w), len(w) - len(last)) for w in completions}
+            found = self._rows_for(matched) if bits is None else bits & self._rows_for(matched)
+            if not found: # nothing starts with it: allow typos in the prefix
+                matched = {w: (d, -self._uses(w), len(w) - len(last))
+                           for w, d in self.similar(last, limit=expand, prefix=True)}
+                found = self._rows_for(matched) if bits is None else bits & self._rows_for(matched)
+            bits = found
+            ranked.append(matched)
+        if not bits:
+            return []
+
+        if len(ranked) == 1:
+            # One word: walk its ranks best first and stop once `limit` rows are found
+            rows, seen = [], 0
+            for _, level in self._levels(ranked[0]):
+                for pos in iter_positions(level & ~seen):
+                    rows.append(pos)
+                    if len(rows) >= limit:
+                        return rows
+                seen |= level
+            return rows
+
+        # Several words: a row's rank is the sum of its best rank for each word
+        keys = {pos: [0, 0, 0] for pos in iter_positions(bits)}
+        for matched in ranked:
+            seen = 0
+            for rank, level in self._levels(matched):
+                for pos in iter_positions(level & bits & ~seen):
+                    for i, value in enumerate(rank):
+                        keys[pos][i] += value
+                seen |= level
+        return sorted(keys, key=lambda pos: (*keys[pos], pos))[:limit]